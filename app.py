@@ -2,24 +2,49 @@
 app.py
 FastAPI server for NSFW (adult) service chatbot core.
 - Loads model + vectorizer + intents
-- Exposes /chat endpoint
+- Exposes /chat and /chat/batch endpoints
+- Low-confidence messages answered from the nearest intents pattern, or the fallback reply
+- Coalesces concurrent /chat calls into micro-batches
+- Hot-reloads artifacts off the request path (versioned, with rollback)
+- /health is liveness, /ready readiness; with LAZY_STARTUP artifacts load in the background
+  after the port is bound and /chat answers 503 until they are live
+- Per-stage latency histograms and counters on /metrics (Prometheus text)
+- Opt-in sampling profiler for slow requests (/admin/profile)
 - Includes simple safety/mode checks + logging hook
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
-import joblib
+from typing import Optional, Dict, Any, List, Tuple
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import io
 import json
+import math
 import os
 import time
 
 # -------------------------
 # Config & Paths
 # -------------------------
-from config import MODEL_PATH, VECTORIZER_PATH, INTENTS_PATH, APP_NAME, ALLOWED_ORIGINS
+from config import MODEL_PATH, VECTORIZER_PATH, INTENTS_PATH, INTENTS_INDEX_PATH, COMPACT_DIR, NEAREST_DIR, APP_NAME, ALLOWED_ORIGINS, ensure_dirs, settings
+from inference import ArtifactManager, InferenceBundle, artifact_files, load_bundle
+from cache import ReplyCache
+from normalize import tokenize, tokenize_batch
+from moderation import ModerationEngine, ModerationResult
+from ratelimit import MemoryBucketStore, RateLimitMiddleware, SqliteBucketStore, client_key
+from serve import worker_memory
+from metrics import Registry
+from profiler import RequestProfiler
+from sessions import Session, SessionStore
+from database import (ChatLogWriter, DB, EXPORT_COLUMNS, KnownUsers, decode_cursor, encode_cursor, ensure_schema,
+                      iter_chats, label_chat, load_session)
 
+ensure_dirs()
 app = FastAPI(title=APP_NAME)
 
 app.add_middleware(
@@ -30,23 +55,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.RATE_LIMIT_BACKEND == "sqlite":
+    RATE_LIMIT_STORE = SqliteBucketStore(settings.RATE_LIMIT_DB_PATH, settings.RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_BURST)
+else:
+    RATE_LIMIT_STORE = MemoryBucketStore(settings.RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_BURST,
+                                         max_keys=settings.RATE_LIMIT_MAX_KEYS)
+RATE_LIMIT_KEY_HEADER = settings.API_KEY_HEADER.lower().encode("latin-1")
+RATE_LIMIT_API_KEYS = frozenset(settings.API_KEYS_ALLOWLIST)
+if settings.RATE_LIMIT_ENABLED:
+    # /chat is charged by the middleware; /chat/batch per item in its handler (charge_batch).
+    app.add_middleware(RateLimitMiddleware, store=RATE_LIMIT_STORE, paths=("/chat",),
+                       api_key_header=settings.API_KEY_HEADER, api_keys=RATE_LIMIT_API_KEYS)
+
+
+def charge_batch(request: Request, items: int):
+    """Take one token per batch item from the caller's bucket; 429 when it is empty."""
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    key = client_key(request.scope.get("headers", ()), request.scope.get("client"),
+                     RATE_LIMIT_KEY_HEADER, RATE_LIMIT_API_KEYS)
+    wait = RATE_LIMIT_STORE.take(key, cost=items)
+    if wait:
+        raise HTTPException(status_code=429, detail="rate limit exceeded",
+                            headers={"Retry-After": str(max(1, math.ceil(wait)))})
+
 # -------------------------
 # Models & Data Loading
 # -------------------------
+# Request handlers read ARTIFACTS.current once and use that bundle throughout;
+# MODEL / VECTORIZER / INTENTS mirror it for older callers.
 MODEL = None
 VECTORIZER = None
 INTENTS: Dict[str, Any] = {}
+CACHE = ReplyCache(
+    max_size=settings.REPLY_CACHE_SIZE if settings.REPLY_CACHE_ENABLED else 0,
+    ttl_seconds=settings.REPLY_CACHE_TTL_SECONDS,
+)
 
-def load_artifacts():
+def _compact_dir():
+    return COMPACT_DIR if settings.SERVING_BACKEND == "numpy" else None
+
+def _nearest_dir():
+    return NEAREST_DIR if settings.NEAREST_ENABLED else None
+
+def _before_publish(bundle: InferenceBundle):
     global MODEL, VECTORIZER, INTENTS
-    if not os.path.exists(MODEL_PATH) or not os.path.exists(VECTORIZER_PATH):
-        raise RuntimeError("Model or vectorizer not found. Train first (see train.py).")
-    MODEL = joblib.load(MODEL_PATH)
-    VECTORIZER = joblib.load(VECTORIZER_PATH)
-    with open(INTENTS_PATH, "r", encoding="utf-8") as f:
-        INTENTS = json.load(f)
+    # New generation first: entries and in-flight results from the old bundle become unusable.
+    bundle.generation = CACHE.invalidate()
+    MODEL, VECTORIZER, INTENTS = bundle.estimator, bundle.transformer, bundle.intents
+
+ARTIFACTS = ArtifactManager(
+    loader=lambda: load_bundle(MODEL_PATH, VECTORIZER_PATH, INTENTS_PATH, compact_dir=_compact_dir(),
+                               index_path=INTENTS_INDEX_PATH, nearest_dir=_nearest_dir(),
+                               confidence_threshold=settings.CONFIDENCE_THRESHOLD,
+                               min_similarity=settings.NEAREST_MIN_SIMILARITY,
+                               max_postings=settings.NEAREST_MAX_POSTINGS),
+    files=lambda: artifact_files(MODEL_PATH, VECTORIZER_PATH, INTENTS_PATH, compact_dir=_compact_dir(),
+                                 index_path=INTENTS_INDEX_PATH, nearest_dir=_nearest_dir()),
+    before_publish=_before_publish,
+)
+# Loads never run on the event loop, and never two at a time.
+RELOAD_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact-reload")
 
-load_artifacts()
+def load_artifacts() -> InferenceBundle:
+    return ARTIFACTS.reload()
+
+# Eager by default: serve.py imports the app before forking so workers share the loaded pages.
+if not settings.LAZY_STARTUP:
+    load_artifacts()
 
 # -------------------------
 # Schemas
@@ -55,12 +131,25 @@ class ChatRequest(BaseModel):
     message: str = Field(..., min_length=1, description="User input text")
     user_id: Optional[str] = Field(default=None, description="Optional user identifier")
     mode: Optional[str] = Field(default="default", description="bot mode, e.g., 'default', 'nsfw', 'safe'")
+    context: Optional[Dict[str, str]] = Field(default=None, description="Per-user reply variables, e.g. {'name': 'Sam'}")
 
 class ChatResponse(BaseModel):
     reply: str
     intent: Optional[str] = None
-    confidence: Optional[float] = None
-    latency_ms: Optional[int] = None
+    confidence: Optional[float] = None  # model probability, also when the nearest pattern answered
+    meta: Optional[Dict[str, Any]] = None  # low confidence: {"source": "nearest", "similarity"} or {"source": "fallback"}
+    latency_ms: Optional[float] = None  # sub-millisecond resolution
+
+class ChatBatchRequest(BaseModel):
+    items: List[ChatRequest] = Field(..., min_items=1, description="Messages to classify in one call")
+
+class LabelRequest(BaseModel):
+    label: str = Field(..., min_length=1, description="Correct intent tag for the chat")
+
+class ChatBatchResponse(BaseModel):
+    results: List[ChatResponse]
+    count: int
+    latency_ms: Optional[float] = None
 
 # -------------------------
 # Helpers
@@ -70,88 +159,700 @@ SAFEPLACEHOLDER = (
     "Please keep it respectful and within acceptable guidelines."
 )
 
+MODERATION = ModerationEngine.from_file(settings.MODERATION_RULES_PATH)
+
+def load_moderation():
+    """(Re)compile the per-mode term lists; the engine reference is swapped in one step."""
+    global MODERATION
+    MODERATION = ModerationEngine.from_file(settings.MODERATION_RULES_PATH)
+
+def moderate(text: str, mode: Optional[str] = "default") -> ModerationResult:
+    """Single-pass check of `text` against the rules for `mode`; reports the rule that fired."""
+    return MODERATION.check(text, mode)
+
 def simple_moderation(text: str, mode: str = "default") -> bool:
     """
     Return True if the request is ALLOWED to proceed.
-    This is a placeholder; replace with your policy rules or an external moderator.
+    Rules live in MODERATION_RULES_PATH (see moderation.py); without that file
+    only the built-in 'safe' mode list applies.
     """
-    # Example toggles:
-    if mode == "safe":
-        # Block sensitive/explicit words (very basic placeholder).
-        blocked = ["minors", "illegal", "exploit", "rape"]  # extend appropriately
-        if any(b in text.lower() for b in blocked):
-            return False
-    # In 'nsfw' mode you still should enforce your platform’s policy.
-    return True
+    return moderate(text, mode).allowed
 
-def classify_and_respond(message: str) -> Dict[str, Any]:
+def require_ready():
+    if ARTIFACTS.current is None:
+        raise HTTPException(status_code=503, detail="model not loaded yet", headers={"Retry-After": "1"})
+
+def require_api_key(request: Request):
+    """Enforce API_KEY_REQUIRED / API_KEYS_ALLOWLIST on routes that depend on it."""
+    if settings.API_KEY_REQUIRED and request.headers.get(settings.API_KEY_HEADER) not in settings.API_KEYS_ALLOWLIST:
+        raise HTTPException(status_code=401, detail="invalid or missing API key")
+
+def classify_and_respond(message: str, timings: Optional[Dict[str, int]] = None,
+                         bundle: Optional[InferenceBundle] = None) -> Dict[str, Any]:
     """
     Vectorize -> predict intent -> choose response.
-    INTENTS format expected from intents.json:
-    {
-      "intents": [{"tag": "...", "responses": ["...","..."]}, ...]
-    }
+    One transform + one predict_proba; responses come from the bundle's
+    class-index table built from intents.json at load time.
+    Handlers pass the bundle they captured, so a reload can't switch models mid-request.
+    """
+    return (bundle or ARTIFACTS.current).classify([message], timings)[0]
+
+def classify_batch(messages: List[str], timings: Optional[Dict[str, int]] = None,
+                   bundle: Optional[InferenceBundle] = None) -> List[Dict[str, Any]]:
+    """
+    Batched variant of classify_and_respond:
+    one sparse transform + one predict_proba for the whole list, argmax per row.
     """
-    X = VECTORIZER.transform([message])
-    proba = getattr(MODEL, "predict_proba", None)
-    tag = MODEL.predict(X)[0]
-    conf = float(max(proba(X)[0])) if callable(proba) else None
+    return (bundle or ARTIFACTS.current).classify(messages, timings)
+
+def user_context(req: ChatRequest) -> Dict[str, Any]:
+    """Values for per-user reply placeholders ({{user_id}}, {{mode}}, anything in req.context)."""
+    return {"user_id": req.user_id, "mode": req.mode, **(req.context or {})}
+
+SESSIONS = SessionStore(
+    max_turns=settings.SESSION_TURNS,
+    memory_bytes=int(settings.SESSION_MEMORY_MB * 1024 * 1024),
+    idle_seconds=settings.SESSION_IDLE_S,
+    flush_interval=settings.SESSION_FLUSH_S,
+    persist=settings.SESSION_PERSIST,
+)
+
+def user_session(user_id: Optional[str]) -> Optional[Session]:
+    """The user's session (None without a user_id); a miss reads SQLite, so not on the event loop."""
+    return SESSIONS.get(user_id) if settings.SESSIONS_ENABLED and user_id else None
+
+async def user_session_async(user_id: Optional[str]) -> Optional[Session]:
+    """user_session() for async handlers: a session not in memory is warmed in a pool thread."""
+    if not (settings.SESSIONS_ENABLED and user_id):
+        return None
+    if SESSIONS.persist and SESSIONS.peek(user_id) is None:
+        return await run_in_threadpool(SESSIONS.get, user_id)
+    return SESSIONS.get(user_id)
+
+def personalize(bundle: InferenceBundle, result: Dict[str, Any], req: ChatRequest,
+                session: Optional[Session]) -> Dict[str, Any]:
+    """
+    Per-user part of a reply; classify() and cache hits give a user-neutral result.
+    With a session (user_session()) the response rotates through the intent's responses,
+    and it is re-rendered only when the choice or per-user placeholders require it.
+    """
+    intent = result["intent"]
+    if intent is None:  # low confidence, fallback reply
+        return result
+    choice = session.next_choice(intent, bundle.response_count(intent)) if session is not None else 0
+    if choice or bundle.personalized:
+        result = bundle.respond(intent, result["confidence"], user_context(req), choice, result.get("meta"))
+    if session is not None:
+        SESSIONS.record(session, intent, choice)
+    return result
+
+def cache_entry(result: Dict[str, Any]) -> tuple:
+    return (result["intent"], result["confidence"], result.get("meta"))
 
-    # pick response by tag
-    responses = next((i["responses"] for i in INTENTS["intents"] if i["tag"] == tag), None)
-    reply = (responses or ["I'm not sure I understood that. Could you rephrase?"])[0]
-    return {"reply": reply, "intent": tag, "confidence": conf}
+def from_cache(bundle: InferenceBundle, cached: tuple) -> Dict[str, Any]:
+    intent, confidence, meta = cached
+    return bundle.respond(intent, confidence, meta=meta)
 
-def log_event(user_id: Optional[str], message: str, intent: Optional[str], reply: str, ok: bool):
-    """Hook for logging/analytics; replace with DB or queue as needed."""
-    print({
-        "ts": int(time.time() * 1000),
-        "user_id": user_id,
-        "message": message,
-        "intent": intent,
-        "reply_len": len(reply),
-        "allowed": ok,
-    })
+def cache_key(message: str, mode: Optional[str]) -> tuple:
+    # The vectorizer's own tokens: messages that share a key share the model input exactly.
+    return (" ".join(tokenize(message)), mode or "default")
+
+CHAT_LOG = ChatLogWriter(
+    max_queue=settings.LOG_QUEUE_SIZE,
+    batch_size=settings.LOG_BATCH_SIZE,
+    flush_interval=settings.LOG_FLUSH_INTERVAL_MS / 1000,
+)
+
+KNOWN_USERS = KnownUsers(
+    DB,
+    capacity=settings.KNOWN_USERS_CAPACITY,
+    fp_rate=settings.KNOWN_USERS_FP_RATE,
+    hot_size=settings.KNOWN_USERS_HOT_SIZE,
+    flush_interval=settings.KNOWN_USERS_FLUSH_MS / 1000,
+)
+
+def log_event(
+    user_id: Optional[str],
+    message: str,
+    intent: Optional[str],
+    reply: str,
+    ok: bool,
+    confidence: Optional[float] = None,
+    latency_ms: Optional[float] = None,
+    meta: Optional[Dict[str, Any]] = None,
+):
+    """Hook for logging/analytics: a non-blocking enqueue to the write-behind DB writer."""
+    if settings.ENABLE_REQUEST_LOG:
+        if user_id and settings.KNOWN_USERS_ENABLED:
+            KNOWN_USERS.ensure(user_id)
+        CHAT_LOG.submit(user_id, message, reply, intent, confidence, latency_ms, ok, meta)
+
+def server_timing(stages: Dict[str, int]) -> str:
+    """Per-stage ns -> Server-Timing header value (ms), read by benchmarks/loadtest.py."""
+    return ", ".join(f"{name};dur={ns / 1e6:.3f}" for name, ns in stages.items())
+
+def elapsed_ms(start_ns: int) -> float:
+    return round((time.perf_counter_ns() - start_ns) / 1e6, 3)
+
+# -------------------------
+# Metrics (Prometheus text on /metrics)
+# -------------------------
+METRICS = Registry(prefix="chatbot_")
+STAGE_SECONDS = METRICS.histogram(
+    "stage_seconds", "Time per request stage; batched stages (queue/vectorize/predict) count the whole batch",
+    labels=("endpoint", "stage"),
+)
+REQUEST_SECONDS = METRICS.histogram("request_seconds", "Handler time per request", labels=("endpoint",))
+MESSAGES = METRICS.counter("messages_total", "Messages handled", labels=("intent", "mode", "allowed"))
+
+def count_message(intent: Optional[str], mode: Optional[str], allowed: bool):
+    if settings.METRICS_ENABLED:
+        MESSAGES.inc(intent or "", mode or "default", "true" if allowed else "false")
+
+PROFILER = RequestProfiler(
+    settings.PROFILE_DIR,
+    sample_rate=settings.PROFILE_SAMPLE_RATE,
+    slow_ms=settings.PROFILE_SLOW_MS,
+    interval_ms=settings.PROFILE_INTERVAL_MS,
+    max_requests=settings.PROFILE_MAX_REQUESTS,
+    top_n=settings.PROFILE_TOP_N,
+    flush_seconds=settings.PROFILE_FLUSH_SECONDS,
+)
+
+def observe_request(endpoint: str, start_ns: int, stages: Dict[str, int], intent: Optional[str] = None,
+                    mode: Optional[str] = None, allowed: Optional[bool] = None):
+    """
+    End-of-request hook: hands the request to the profiler (when on), feeds its stage
+    timings (ns) into the histograms and counts the message unless allowed is None.
+    """
+    if PROFILER.enabled:
+        PROFILER.finish(endpoint, start_ns)
+    if not settings.METRICS_ENABLED:
+        return
+    REQUEST_SECONDS.observe_ns(time.perf_counter_ns() - start_ns, endpoint)
+    STAGE_SECONDS.observe_many_ns(stages, endpoint)
+    if allowed is not None:
+        MESSAGES.inc(intent or "", mode or "default", "true" if allowed else "false")
+
+# -------------------------
+# Micro-batching
+# -------------------------
+class MicroBatcher:
+    """
+    Coalesces concurrent /chat requests into one classify_batch call.
+    The first queued request opens a window of `window_ms`; everything that arrives
+    before it closes (up to `max_batch`) shares one inference. While a batch runs,
+    new requests keep queuing, so batches grow with load and stay small when idle.
+    """
+    # Upper bounds (ms) for the queue-wait histogram; last bucket is +inf.
+    WAIT_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250)
+
+    def __init__(self, window_ms: float, max_batch: int):
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes: Dict[int, int] = {}
+        self.wait_hist = [0] * (len(self.WAIT_BUCKETS_MS) + 1)
+        self.wait_ms_sum = 0.0
+        self.wait_ms_max = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def submit(self, message: str, bundle: InferenceBundle) -> Tuple[Dict[str, Any], Dict[str, int]]:
+        """
+        Returns (result, stage ns): time queued, plus the batch's vectorize/predict/respond time.
+        `message` is classified by `bundle`, the one the caller renders and caches with.
+        """
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((message, fut, time.perf_counter_ns(), bundle))
+        return await fut
+
+    async def _collect(self) -> List[tuple]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            # Drain whatever is already waiting before sleeping on the window.
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _record(self, batch: List[tuple]):
+        now = time.perf_counter_ns()
+        self.batches += 1
+        self.items += len(batch)
+        self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+        for _, _, enqueued, _ in batch:
+            wait_ms = (now - enqueued) / 1e6
+            self.wait_ms_sum += wait_ms
+            self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+            i = 0
+            while i < len(self.WAIT_BUCKETS_MS) and wait_ms > self.WAIT_BUCKETS_MS[i]:
+                i += 1
+            self.wait_hist[i] += 1
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            self._record(batch)
+            # One group per captured bundle; there is more than one only across a reload.
+            groups: Dict[int, List[tuple]] = {}
+            for item in batch:
+                groups.setdefault(id(item[3]), []).append(item)
+            for group in groups.values():
+                started = time.perf_counter_ns()
+                timings: Dict[str, int] = {}
+                try:
+                    results = await run_in_threadpool(classify_batch, [m for m, _, _, _ in group], timings, group[0][3])
+                except Exception as e:
+                    for _, fut, _, _ in group:
+                        if not fut.done():
+                            fut.set_exception(e)
+                    continue
+                for (_, fut, enqueued, _), result in zip(group, results):
+                    if not fut.done():
+                        fut.set_result((result, {"queue": started - enqueued, **timings}))
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [f"le_{b}" for b in self.WAIT_BUCKETS_MS] + ["inf"]
+        return {
+            "running": self.running,
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "queue_wait_ms": {
+                "avg": self.wait_ms_sum / self.items if self.items else 0.0,
+                "max": self.wait_ms_max,
+                "histogram": dict(zip(labels, self.wait_hist)),
+            },
+        }
+
+BATCHER = MicroBatcher(settings.MICROBATCH_WINDOW_MS, settings.MICROBATCH_MAX_BATCH)
+
+def _pick(stats: Dict[str, Any], *keys: str) -> Dict[str, Any]:
+    return {k: stats[k] for k in keys}
+
+METRICS.gauge("queue_depth", "Items waiting in in-process queues", lambda: {
+    "microbatch": BATCHER.snapshot()["queue_depth"],
+    "chat_log": CHAT_LOG.stats()["queue_depth"],
+}, label="queue")
+METRICS.gauge("microbatch", "Micro-batcher totals", lambda: _pick(BATCHER.snapshot(), "batches", "items"), label="stat")
+METRICS.gauge("reply_cache", "Reply cache size and totals", lambda: _pick(
+    CACHE.stats(), "size", "hits", "misses", "evictions", "expirations", "invalidations"), label="stat")
+METRICS.gauge("chat_log", "Write-behind chat log totals", lambda: _pick(
+    CHAT_LOG.stats(), "enqueued", "written", "dropped", "errors"), label="stat")
+METRICS.gauge("sessions", "Session store size (bytes = estimated footprint) and totals", lambda: _pick(
+    SESSIONS.stats(), "sessions", "bytes", "hits", "misses", "evicted_lru", "evicted_idle")
+              if settings.SESSIONS_ENABLED else None, label="stat")
+METRICS.gauge("rate_limit", "Rate limiter decisions", lambda: _pick(RATE_LIMIT_STORE.stats(), "allowed", "limited")
+              if settings.RATE_LIMIT_ENABLED else None, label="decision")
+
+@app.on_event("startup")
+async def init_database():
+    # Schema creation is blocking SQLite work; do it in a pool thread before serving.
+    await run_in_threadpool(ensure_schema)
+
+@app.on_event("startup")
+async def start_batcher():
+    if settings.MICROBATCH_ENABLED:
+        BATCHER.start()
+
+@app.on_event("startup")
+def start_chat_log():
+    if settings.ENABLE_REQUEST_LOG:
+        CHAT_LOG.start()
+
+@app.on_event("startup")
+def start_known_users():
+    if settings.ENABLE_REQUEST_LOG and settings.KNOWN_USERS_ENABLED:
+        KNOWN_USERS.start()
+
+@app.on_event("shutdown")
+def stop_known_users():
+    KNOWN_USERS.close()
+
+@app.on_event("startup")
+def start_sessions():
+    if settings.SESSIONS_ENABLED:
+        SESSIONS.start()
+
+@app.on_event("shutdown")
+def stop_sessions():
+    SESSIONS.close()
+
+def _report_startup_load(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"[WARN] Background artifact load failed, not ready: {future.exception()}")
+    elif not future.cancelled():
+        print(f"[INFO] Artifacts loaded in the background: {future.result().version}")
+
+@app.on_event("startup")
+def start_artifact_load():
+    # Returns at once, so uvicorn binds the port while the model loads; /ready flips when it is live.
+    if settings.LAZY_STARTUP and ARTIFACTS.current is None:
+        RELOAD_EXECUTOR.submit(load_artifacts).add_done_callback(_report_startup_load)
+
+@app.on_event("startup")
+def start_artifact_watch():
+    if settings.ARTIFACT_WATCH:
+        ARTIFACTS.watch(settings.ARTIFACT_WATCH_INTERVAL_S)
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    await BATCHER.stop()
+
+@app.on_event("shutdown")
+def stop_chat_log():
+    CHAT_LOG.close()
+    DB.close_all()
+
+@app.on_event("startup")
+def start_profiler():
+    if settings.PROFILE_ENABLED:
+        PROFILER.start()
+
+@app.on_event("shutdown")
+def stop_profiler():
+    if PROFILER.enabled:
+        PROFILER.stop()
+
+@app.on_event("shutdown")
+def stop_artifact_watch():
+    ARTIFACTS.stop_watch()
+    RELOAD_EXECUTOR.shutdown(wait=False)
 
 # -------------------------
 # Routes
 # -------------------------
 @app.get("/health")
 def health():
-    return {"status": "ok", "model_loaded": MODEL is not None}
+    bundle = ARTIFACTS.current
+    return {"status": "ok", "model_loaded": bundle is not None, "model_version": bundle.version if bundle else None}
+
+@app.get("/ready")
+def ready():
+    bundle = ARTIFACTS.current
+    if bundle is None:
+        return JSONResponse(status_code=503, content={"ready": False, "model_version": None})
+    return {"ready": True, "model_version": bundle.version}
+
+@app.get("/stats")
+def stats():
+    return {
+        "batcher": BATCHER.snapshot(),
+        "reply_cache": CACHE.stats(),
+        "chat_log": CHAT_LOG.stats(),
+        "sessions": SESSIONS.stats() if settings.SESSIONS_ENABLED else None,
+        "known_users": KNOWN_USERS.stats() if settings.KNOWN_USERS_ENABLED else None,
+        "moderation_terms": MODERATION.stats(),
+        "rate_limit": RATE_LIMIT_STORE.stats() if settings.RATE_LIMIT_ENABLED else None,
+        "artifacts": ARTIFACTS.info(),
+        "workers": worker_memory(),
+    }
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/profile", dependencies=[Depends(require_api_key)])
+def profile_report(top: Optional[int] = None):
+    return PROFILER.report(top)
+
+@app.post("/admin/profile", dependencies=[Depends(require_api_key)])
+def profile_configure(enabled: Optional[bool] = None, sample_rate: Optional[float] = None,
+                      slow_ms: Optional[float] = None):
+    """Switch the profiler on/off and adjust what it captures; turning it off writes the report."""
+    PROFILER.configure(sample_rate=sample_rate, slow_ms=slow_ms)
+    if enabled is True and not PROFILER.enabled:
+        PROFILER.start()
+    elif enabled is False and PROFILER.enabled:
+        PROFILER.stop()
+    return PROFILER.report(0)
 
-@app.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest):
-    start = time.perf_counter()
+@app.post("/chat", response_model=ChatResponse, dependencies=[Depends(require_ready)])
+async def chat(req: ChatRequest, response: Response):
+    start = time.perf_counter_ns()
+    stages: Dict[str, int] = {}
 
-    if not simple_moderation(req.message, req.mode):
-        log_event(req.user_id, req.message, None, SAFEPLACEHOLDER, ok=False)
-        return ChatResponse(reply=SAFEPLACEHOLDER, latency_ms=int((time.perf_counter()-start)*1000))
+    verdict = moderate(req.message, req.mode)
+    stages["moderation"] = time.perf_counter_ns() - start
+    if not verdict.allowed:
+        latency = elapsed_ms(start)
+        t0 = time.perf_counter_ns()
+        log_event(req.user_id, req.message, None, SAFEPLACEHOLDER, ok=False, latency_ms=latency,
+                  meta={"rule": verdict.rule})
+        stages["log"] = time.perf_counter_ns() - t0
+        observe_request("/chat", start, stages, None, req.mode, allowed=False)
+        if settings.SERVER_TIMING:
+            response.headers["Server-Timing"] = server_timing(stages)
+        return ChatResponse(reply=SAFEPLACEHOLDER, latency_ms=latency)
 
     try:
-        result = classify_and_respond(req.message)
-        latency = int((time.perf_counter()-start)*1000)
-        log_event(req.user_id, req.message, result.get("intent"), result["reply"], ok=True)
+        bundle = ARTIFACTS.current
+        session = await user_session_async(req.user_id)
+        t0 = time.perf_counter_ns()
+        key = cache_key(req.message, req.mode)
+        cached = CACHE.get(key, bundle.generation)
+        stages["cache"] = time.perf_counter_ns() - t0
+        if cached is not None:
+            t0 = time.perf_counter_ns()
+            result = personalize(bundle, from_cache(bundle, cached), req, session)
+            stages["respond"] = time.perf_counter_ns() - t0
+        else:
+            if BATCHER.running:
+                result, timings = await BATCHER.submit(req.message, bundle)
+                stages.update(timings)
+            else:
+                result = await run_in_threadpool(classify_and_respond, req.message, stages, bundle)
+            CACHE.put(key, cache_entry(result), bundle.generation)
+            t0 = time.perf_counter_ns()
+            result = personalize(bundle, result, req, session)
+            stages["respond"] = stages.get("respond", 0) + (time.perf_counter_ns() - t0)
+        latency = elapsed_ms(start)
+        t0 = time.perf_counter_ns()
+        log_event(req.user_id, req.message, result.get("intent"), result["reply"], ok=True,
+                  confidence=result.get("confidence"), latency_ms=latency, meta=result.get("meta"))
+        stages["log"] = time.perf_counter_ns() - t0
+        observe_request("/chat", start, stages, result.get("intent"), req.mode, allowed=True)
+        if settings.SERVER_TIMING:
+            response.headers["Server-Timing"] = server_timing(stages)
         return ChatResponse(
             reply=result["reply"],
             intent=result.get("intent"),
             confidence=result.get("confidence"),
+            meta=result.get("meta"),
             latency_ms=latency
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"chat error: {e}")
 
-# Optional reload endpoint after retraining
-@app.post("/reload")
-def reload_artifacts():
+@app.post("/chat/batch", response_model=ChatBatchResponse, dependencies=[Depends(require_ready)])
+def chat_batch(req: ChatBatchRequest, response: Response, request: Request):
+    """
+    Classify many messages in one vectorized call.
+    Per-item latency = own moderation time + an even share of the batched inference time.
+    """
+    if len(req.items) > settings.MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"batch too large (max {settings.MAX_BATCH_SIZE})")
+    charge_batch(request, len(req.items))  # sync handler: a sqlite store blocks a pool thread, not the loop
+
+    start = time.perf_counter_ns()
+
+    # Moderation per item; only allowed messages go to the classifier.
+    allowed_idx = []
+    mod_ns = []
+    rules: Dict[int, Optional[str]] = {}
+    for i, item in enumerate(req.items):
+        t0 = time.perf_counter_ns()
+        verdict = moderate(item.message, item.mode)
+        if verdict.allowed:
+            allowed_idx.append(i)
+        else:
+            rules[i] = verdict.rule
+        mod_ns.append(time.perf_counter_ns() - t0)
+
+    # Cache hits are rendered directly; only misses go to the classifier.
+    bundle = ARTIFACTS.current
+    by_index: Dict[int, Dict[str, Any]] = {}
+    misses = []
+    t0 = time.perf_counter_ns()
+    # Same keys as cache_key(), tokenized in one batch call.
+    keys = {i: (" ".join(tokens), req.items[i].mode or "default")
+            for i, tokens in zip(allowed_idx, tokenize_batch([req.items[i].message for i in allowed_idx]))}
+    for i in allowed_idx:
+        cached = CACHE.get(keys[i], bundle.generation)
+        if cached is not None:
+            by_index[i] = personalize(bundle, from_cache(bundle, cached), req.items[i],
+                                      user_session(req.items[i].user_id))
+        else:
+            misses.append(i)
+    stages: Dict[str, int] = {"moderation": sum(mod_ns), "cache": time.perf_counter_ns() - t0}
+
+    try:
+        t0 = time.perf_counter_ns()
+        results = classify_batch([req.items[i].message for i in misses], stages, bundle) if misses else []
+        share_ns = (time.perf_counter_ns() - t0) / max(len(misses), 1)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"chat error: {e}")
+
+    missed = set(misses)
+    for i, result in zip(misses, results):
+        by_index[i] = personalize(bundle, result, req.items[i], user_session(req.items[i].user_id))
+        CACHE.put(keys[i], cache_entry(result), bundle.generation)
+
+    t0 = time.perf_counter_ns()
+    out = []
+    for i, item in enumerate(req.items):
+        result = by_index.get(i)
+        if result is None:
+            latency = round(mod_ns[i] / 1e6, 3)
+            log_event(item.user_id, item.message, None, SAFEPLACEHOLDER, ok=False, latency_ms=latency,
+                      meta={"rule": rules.get(i)})
+            count_message(None, item.mode, allowed=False)
+            out.append(ChatResponse(reply=SAFEPLACEHOLDER, latency_ms=latency))
+            continue
+        latency = round((mod_ns[i] + (share_ns if i in missed else 0)) / 1e6, 3)
+        log_event(item.user_id, item.message, result.get("intent"), result["reply"], ok=True,
+                  confidence=result.get("confidence"), latency_ms=latency, meta=result.get("meta"))
+        count_message(result.get("intent"), item.mode, allowed=True)
+        out.append(ChatResponse(
+            reply=result["reply"],
+            intent=result.get("intent"),
+            confidence=result.get("confidence"),
+            meta=result.get("meta"),
+            latency_ms=latency
+        ))
+    # Whole-request totals; "log" also covers building the response items.
+    stages["log"] = time.perf_counter_ns() - t0
+
+    observe_request("/chat/batch", start, stages)
+    if settings.SERVER_TIMING:
+        response.headers["Server-Timing"] = server_timing(stages)
+    return ChatBatchResponse(results=out, count=len(out), latency_ms=elapsed_ms(start))
+
+@app.get("/export/chats", dependencies=[Depends(require_api_key)])
+def export_chats(
+    format: str = "ndjson",
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    intent: Optional[str] = None,
+    user_id: Optional[str] = None,
+    allowed: Optional[bool] = None,
+    cursor: Optional[str] = None,
+):
+    """
+    Stream chat history as NDJSON or CSV, ordered by (ts, id).
+    Every record carries a `cursor`; pass the last one back to resume after it.
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    rows = iter_chats(since=since, until=until, intent=intent, user_id=user_id, allowed=allowed,
+                      after=after, page_size=settings.EXPORT_PAGE_SIZE)
+
+    def ndjson_lines():
+        for row in rows:
+            row["cursor"] = encode_cursor(row["ts"], row["id"])
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+
+    def csv_lines():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(EXPORT_COLUMNS + ("cursor",))
+        for row in rows:
+            row["meta"] = json.dumps(row["meta"], ensure_ascii=False)
+            writer.writerow([row[c] for c in EXPORT_COLUMNS] + [encode_cursor(row["ts"], row["id"])])
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+
+    def chunked(lines, size: int = 500):
+        # Group lines so the threadpool hop happens per chunk, not per row.
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= size:
+                yield "".join(chunk)
+                chunk = []
+        if chunk:
+            yield "".join(chunk)
+
+    if format == "csv":
+        return StreamingResponse(chunked(csv_lines()), media_type="text/csv")
+    return StreamingResponse(chunked(ndjson_lines()), media_type="application/x-ndjson")
+
+@app.post("/chats/{chat_id}/label", dependencies=[Depends(require_api_key), Depends(require_ready)])
+def label(chat_id: int, req: LabelRequest):
+    """Record the reviewed intent of a logged chat (consumed by online_train.py)."""
+    if req.label not in ARTIFACTS.current.classes:
+        raise HTTPException(status_code=422, detail=f"unknown intent: {req.label}")
+    if not label_chat(chat_id, req.label):
+        raise HTTPException(status_code=404, detail="chat not found")
+    return {"id": chat_id, "label": req.label}
+
+@app.get("/sessions/{user_id}", dependencies=[Depends(require_api_key)])
+def session(user_id: str):
+    """A user's recent turns as the session store has them (memory, else the sessions table)."""
+    current = SESSIONS.peek(user_id)
+    turns = current.recent() if current is not None else load_session(user_id)
+    if turns is None:
+        raise HTTPException(status_code=404, detail="no session")
+    return {"user_id": user_id, "in_memory": current is not None,
+            "turns": [{"intent": intent, "response": choice} for intent, choice in turns]}
+
+# Reload after retraining: the new bundle is loaded and smoke-tested on RELOAD_EXECUTOR
+# while the current one keeps serving, then swapped in as a single reference.
+def _reload_all() -> InferenceBundle:
+    previous = ARTIFACTS.current
+    bundle = load_artifacts()
+    load_moderation()
+    print(f"[INFO] Reloaded artifacts: {previous.version if previous else None} -> {bundle.version}")
+    return bundle
+
+def _report_reload(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"[WARN] Background reload failed, still serving the previous bundle: {future.exception()}")
+
+@app.post("/reload", dependencies=[Depends(require_api_key)])
+async def reload_artifacts(wait: bool = True):
+    previous = ARTIFACTS.current
+    future = asyncio.get_running_loop().run_in_executor(RELOAD_EXECUTOR, _reload_all)
+    if not wait:
+        future.add_done_callback(_report_reload)
+        return JSONResponse(status_code=202, content={"reloaded": False, "scheduled": True,
+                                                      "version": previous.version if previous else None})
     try:
-        load_artifacts()
-        return {"reloaded": True}
+        bundle = await future
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"reload error: {e}")
+    return {"reloaded": True, "version": bundle.version, "previous": previous.version if previous else None}
+
+@app.post("/reload/rollback", dependencies=[Depends(require_api_key)])
+def rollback_artifacts():
+    try:
+        bundle = ARTIFACTS.rollback()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"rolled_back": True, "version": bundle.version, "previous": ARTIFACTS.previous.version}
 
 # -------------------------
-# Dev server
+# Dev server (production: python serve.py)
 # -------------------------
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,5 @@
+"""
+benchmarks
+Micro-benchmarks (bench_*.py) and the /chat load test (loadtest.py).
+Run from the repo root, e.g.  python -m benchmarks.loadtest --help
+"""
@@ -0,0 +1,147 @@
+"""
+bench_importtime.py
+Cold-start budget of the API process: `import app` and time until /ready.
+- runs `python -X importtime -c "import app"` in a fresh interpreter with LAZY_STARTUP off
+  (artifacts loaded while importing) and on (loaded after startup)
+- reports the total, the slowest modules by cumulative time and self time per top-level package
+- which heavy packages (nltk / sklearn / scipy / numpy) the import pulled in
+- --serve: starts uvicorn in each mode and times process start -> /health and -> /ready
+- --out writes the numbers as JSON; --baseline compares with an earlier --out and fails
+  (exit 1) past --threshold; --budget-ms fails when the LAZY_STARTUP import exceeds it
+
+Run from the repo root:  python -m benchmarks.bench_importtime [--serve] [--budget-ms 400]
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY = ("nltk", "sklearn", "scipy", "numpy")
+PROBE = "import sys, app; print(' '.join(m for m in {heavy!r} if m in sys.modules))"
+
+
+def import_profile(lazy: bool):
+    """(total ms, [(module, self ms, cumulative ms)], heavy packages loaded) for one cold import."""
+    env = {**os.environ, "LAZY_STARTUP": "true" if lazy else "false"}
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE.format(heavy=HEAVY)],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    rows, total = [], 0.0
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not name[1:].startswith(" "):  # top-level import (the tree is indented by depth)
+            total += int(cumulative_us) / 1000
+        rows.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return total, rows, out.stdout.split()
+
+
+def by_package(rows):
+    totals = defaultdict(float)
+    for name, self_ms, _ in rows:
+        totals[name.split(".")[0]] += self_ms
+    return sorted(totals.items(), key=lambda kv: kv[1], reverse=True)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to(url: str, start: float, proc, timeout: float = 120.0) -> float:
+    while time.perf_counter() - start < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return (time.perf_counter() - start) * 1000
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.005)
+    raise RuntimeError(f"{url} not answering after {timeout}s")
+
+
+def serve_profile(lazy: bool):
+    """Milliseconds from spawning uvicorn until /health and /ready answer 200."""
+    port = free_port()
+    env = {**os.environ, "LAZY_STARTUP": "true" if lazy else "false"}
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        health = time_to(f"http://127.0.0.1:{port}/health", start, proc)
+        ready = time_to(f"http://127.0.0.1:{port}/ready", start, proc)
+    finally:
+        proc.terminate()
+        proc.wait(10)
+    return health, ready
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5, help="cold imports per mode (median reported)")
+    parser.add_argument("--top", type=int, default=12, help="modules / packages listed")
+    parser.add_argument("--serve", action="store_true", help="also time uvicorn start -> /health and /ready")
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier --out to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown vs --baseline (0.2 = 20%%)")
+    parser.add_argument("--budget-ms", type=float, help="fail if the LAZY_STARTUP import takes longer")
+    args = parser.parse_args()
+
+    results = {}
+    for lazy in (False, True):
+        mode = "lazy" if lazy else "eager"
+        profiles = [import_profile(lazy) for _ in range(args.runs)]
+        total = statistics.median(p[0] for p in profiles)
+        _, rows, heavy = min(profiles, key=lambda p: abs(p[0] - total))
+        results[mode] = {"import_ms": round(total, 1), "heavy_loaded": heavy}
+
+        print(f"\n== LAZY_STARTUP={str(lazy).lower()}: import app {total:.0f} ms "
+              f"(median of {args.runs}); loaded: {', '.join(heavy) or 'none of ' + '/'.join(HEAVY)}")
+        print(f"  {'cumulative ms':>13} {'self ms':>8}  module")
+        for name, self_ms, cum in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+            print(f"  {cum:13.1f} {self_ms:8.1f}  {name}")
+        print(f"  {'self ms':>13}  package")
+        for package, ms in by_package(rows)[:args.top]:
+            print(f"  {ms:13.1f}  {package}")
+
+        if args.serve:
+            health, ready = serve_profile(lazy)
+            results[mode].update(health_ms=round(health, 1), ready_ms=round(ready, 1))
+            print(f"  uvicorn start -> /health {health:.0f} ms, -> /ready {ready:.0f} ms")
+
+    failed = False
+    if args.budget_ms is not None and results["lazy"]["import_ms"] > args.budget_ms:
+        print(f"\n[FAIL] lazy import {results['lazy']['import_ms']:.0f} ms > budget {args.budget_ms:.0f} ms")
+        failed = True
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\nvs baseline:")
+        for mode, row in results.items():
+            for key, value in row.items():
+                before = baseline.get(mode, {}).get(key)
+                if not isinstance(value, float) or not before:
+                    continue
+                change = value / before - 1
+                flag = "  <-- regression" if change > args.threshold else ""
+                failed |= bool(flag)
+                print(f"  {mode:5} {key:10} {before:8.1f} -> {value:8.1f} ms ({change:+.0%}){flag}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+bench_inference.py
+Microbenchmark: per-request classify cost, legacy path vs fused InferenceBundle.
+- legacy: transform -> predict -> predict_proba -> linear scan of intents
+- fused:  transform -> predict_proba -> argmax -> class-index lookup
+
+Run from the repo root after training:  python -m benchmarks.bench_inference [--n 5000]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import MODEL_PATH, VECTORIZER_PATH, INTENTS_PATH  # noqa: E402
+from inference import load_bundle  # noqa: E402
+
+
+def legacy_classify(bundle, message):
+    X = bundle.transformer.transform([message])
+    model = bundle.estimator
+    tag = model.predict(X)[0]
+    conf = float(max(model.predict_proba(X)[0])) if bundle._proba is not None else None
+    responses = next((i["responses"] for i in bundle.intents["intents"] if i["tag"] == tag), None)
+    reply = (responses or ["I'm not sure I understood that. Could you rephrase?"])[0]
+    return {"reply": reply, "intent": tag, "confidence": conf}
+
+
+def timed(fn, messages):
+    start = time.perf_counter()
+    for m in messages:
+        fn(m)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=5000, help="messages per run")
+    args = parser.parse_args()
+
+    bundle = load_bundle(MODEL_PATH, VECTORIZER_PATH, INTENTS_PATH)
+    patterns = [p for i in bundle.intents["intents"] for p in i.get("patterns", [])]
+    messages = [patterns[k % len(patterns)] for k in range(args.n)]
+
+    # Sanity: both paths must agree before we compare speed.
+    for m in patterns:
+        a, b = legacy_classify(bundle, m), bundle.classify([m])[0]
+        assert a["intent"] == b["intent"] and a["reply"] == b["reply"], m
+
+    legacy = lambda m: legacy_classify(bundle, m)  # noqa: E731
+    timed(legacy, messages[:200])  # warm-up
+    legacy_us = timed(legacy, messages)
+    fused_us = timed(lambda m: bundle.classify([m]), messages)
+    print(f"legacy: {legacy_us:8.1f} us/msg")
+    print(f"fused:  {fused_us:8.1f} us/msg  ({legacy_us / fused_us:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
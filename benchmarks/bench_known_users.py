@@ -0,0 +1,90 @@
+"""
+bench_known_users.py
+Per-request cost of registering the user: database.ensure_user vs database.KnownUsers.
+- scratch database preloaded with --users ids
+- repeat users: ids already in the table (hot set hits, and with a cold hot set: filter
+  "maybe" + queue; the background batched read that confirms them is timed separately)
+- new users: ids never seen (filter "no" + queue); the batched inserts are timed separately
+- checks every new id reached the table and reports the observed false-positive rate
+
+Run from the repo root:  python -m benchmarks.bench_known_users [--users 200000] [--n 20000]
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database  # noqa: E402
+
+
+def per_call_us(fn, ids) -> float:
+    start = time.perf_counter()
+    for user_id in ids:
+        fn(user_id)
+    return (time.perf_counter() - start) / len(ids) * 1e6
+
+
+def legacy_ensure(db):
+    def ensure(user_id):  # database.ensure_user against the scratch database
+        conn = db.writer()
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO users (id, created_at) VALUES (?, ?)", (user_id, int(time.time())))
+    return ensure
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200_000, help="ids already in the users table")
+    parser.add_argument("--n", type=int, default=20_000, help="calls per measurement")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        db = database.ConnectionManager(path)
+        conn = db.writer()
+        with conn:
+            conn.execute("CREATE TABLE users (id TEXT PRIMARY KEY, created_at INTEGER)")
+            conn.executemany("INSERT INTO users VALUES (?, 0)", ((f"user-{k}",) for k in range(args.users)))
+
+        repeat = [f"user-{k * 7919 % args.users}" for k in range(args.n)]
+        fresh = iter(f"new-{k}" for k in range(10 * args.n))
+
+        legacy = legacy_ensure(db)
+        print(f"ensure_user  repeat: {per_call_us(legacy, repeat):7.2f} us/call")
+        print(f"ensure_user  new   : {per_call_us(legacy, [next(fresh) for _ in range(args.n)]):7.2f} us/call")
+
+        known = database.KnownUsers(db, capacity=max(args.users * 2, 1000), hot_size=args.users)
+        start = time.perf_counter()
+        known.preload()
+        print(f"\nKnownUsers preload : {args.users} ids in {time.perf_counter() - start:.2f}s, "
+              f"filter {known.stats()['filter_bytes'] / 1024:.0f} KB, {known.n_hashes} hashes")
+        print(f"KnownUsers repeat, first seen (maybe, queued): {per_call_us(known.ensure, repeat):7.2f} us/call")
+        print(f"KnownUsers repeat, hot set                   : {per_call_us(known.ensure, repeat):7.2f} us/call")
+        pending = known.stats()["pending"]
+        start = time.perf_counter()
+        known.flush()
+        print(f"KnownUsers check maybes (background thread)  : {(time.perf_counter() - start) / max(pending, 1) * 1e6:7.2f} "
+              f"us/id ({pending} ids, batched read-only IN (...), no writes)")
+        new_ids = [next(fresh) for _ in range(args.n)]
+        print(f"KnownUsers new (queued)                      : {per_call_us(known.ensure, new_ids):7.2f} us/call")
+        pending = known.stats()["pending"]
+        start = time.perf_counter()
+        known.flush()
+        print(f"KnownUsers batched insert (background thread): {(time.perf_counter() - start) / max(pending, 1) * 1e6:7.2f} "
+              f"us/id ({pending} ids, one transaction)")
+
+        stored = db.reader().execute(
+            "SELECT COUNT(*) FROM users WHERE id IN (%s)" % ",".join("?" * len(new_ids[:900])), new_ids[:900]
+        ).fetchone()[0]
+        s = known.stats()
+        print(f"\nnew ids stored: {stored}/900 sampled; filter false positives on new ids: "
+              f"{s['false_positives']}/{args.n} (estimate {s['fp_rate_estimate']:.2%})")
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
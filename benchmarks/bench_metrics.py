@@ -0,0 +1,107 @@
+"""
+bench_metrics.py
+Overhead of the /metrics instrumentation (metrics.py + observe_request in app.py).
+- cost of a single Histogram.observe_ns / Counter.inc / perf_counter_ns pair
+- cost of instrumenting one /chat request (stage timers + observe_request)
+- that cost as a share of a full in-process /chat request, for reply-cache hits
+  (cheapest path, fewest stages) and misses (all stages)
+- A/B: /chat with METRICS_ENABLED on vs off, interleaved rounds (noisy; the share above is the figure to track)
+
+Run from the repo root:  python -m benchmarks.bench_metrics [--n 3000] [--rounds 5]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import settings  # noqa: E402
+from metrics import Registry  # noqa: E402
+
+HIT_STAGES = ("moderation", "cache", "respond", "log")  # /chat answered from the reply cache
+MISS_STAGES = ("moderation", "cache", "queue", "vectorize", "predict", "respond", "log")
+
+
+def per_call_ns(fn, n):
+    start = time.perf_counter_ns()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter_ns() - start) / n
+
+
+def bench_primitives(n):
+    reg = Registry()
+    hist = reg.histogram("h", "h", labels=("endpoint", "stage"))
+    counter = reg.counter("c", "c", labels=("intent", "mode", "allowed"))
+    now = time.perf_counter_ns
+    print(f"perf_counter_ns pair      : {per_call_ns(lambda: now() - now(), n):7.1f} ns")
+    print(f"Histogram.observe_ns      : {per_call_ns(lambda: hist.observe_ns(12345, '/chat', 'predict'), n):7.1f} ns")
+    print(f"Counter.inc               : {per_call_ns(lambda: counter.inc('greeting', 'default', 'true'), n):7.1f} ns")
+
+
+def bench_request_instrumentation(app_module, stage_names, n):
+    stages = dict.fromkeys(stage_names, 50_000)
+    now = time.perf_counter_ns
+
+    def instrumented():
+        # The timers /chat takes (one pair per stage) plus feeding them to the metrics.
+        start = now()
+        for _ in stage_names:
+            now() - now()
+        app_module.observe_request("/chat", start, stages, "greeting", "default", allowed=True)
+
+    return per_call_ns(instrumented, n)
+
+
+def bench_chat(client, messages):
+    start = time.perf_counter_ns()
+    for m in messages:
+        client.post("/chat", json={"message": m})
+    return (time.perf_counter_ns() - start) / len(messages)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=3000, help="requests per timing round")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    settings.RATE_LIMIT_ENABLED = False
+    settings.ENABLE_REQUEST_LOG = False  # keep SQLite out of the A/B noise
+    import app as app_module
+    from fastapi.testclient import TestClient
+
+    bench_primitives(200_000)
+    cost = {
+        "hit": bench_request_instrumentation(app_module, HIT_STAGES, 50_000),
+        "miss": bench_request_instrumentation(app_module, MISS_STAGES, 50_000),
+    }
+    traffic = {
+        "hit": ["hello"] * args.n,  # reply-cache hits after the first: the cheapest, most sensitive path
+        "miss": [f"hello there number {k}" for k in range(args.n * args.rounds * 2)],
+    }
+
+    with TestClient(app_module.app) as client:
+        bench_chat(client, traffic["hit"][:500])  # warm-up
+        for kind in ("hit", "miss"):
+            runs = {True: [], False: []}
+            fresh = iter(traffic[kind]) if kind == "miss" else None
+            for r in range(args.rounds):
+                for enabled in ((True, False) if r % 2 == 0 else (False, True)):  # alternate order
+                    settings.METRICS_ENABLED = enabled
+                    messages = traffic[kind] if fresh is None else [next(fresh) for _ in range(args.n)]
+                    runs[enabled].append(bench_chat(client, messages))
+            settings.METRICS_ENABLED = True
+
+            on, off = statistics.median(runs[True]), statistics.median(runs[False])
+            spread = (max(runs[False]) - min(runs[False])) / off
+            print(f"/chat cache {kind:4}: request {off / 1000:8.2f} us, instrumentation {cost[kind] / 1000:5.2f} us "
+                  f"= {cost[kind] / off:.2%} (target < 1%)")
+            print(f"    A/B on vs off: {on / 1000:.2f} vs {off / 1000:.2f} us ({on / off - 1:+.2%}; "
+                  f"spread between rounds with metrics off {spread:.1%})")
+
+if __name__ == "__main__":
+    main()
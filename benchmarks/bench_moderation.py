@@ -0,0 +1,66 @@
+"""
+bench_moderation.py
+Moderation scan cost vs blocklist size.
+- legacy:   any(term in text.lower() for term in terms)   (the old simple_moderation loop)
+- compiled: moderation.ModerationEngine (Aho-Corasick, whole-word, normalized)
+Compiled scan time should stay flat as the term list grows; the legacy loop grows linearly.
+
+Run from the repo root:  python -m benchmarks.bench_moderation [--sizes 10,100,1000,10000,50000]
+"""
+
+import argparse
+import random
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from moderation import ModerationEngine  # noqa: E402
+
+
+def random_word(rng, lo=4, hi=10):
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(lo, hi)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,100,1000,10000,50000")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--length", type=int, default=120, help="approx characters per message")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    # Clean traffic (no hits) is the common and worst case: the whole message is scanned.
+    messages = []
+    for _ in range(args.messages):
+        words = []
+        while sum(len(w) + 1 for w in words) < args.length:
+            words.append(random_word(rng, 2, 8))
+        messages.append(" ".join(words).capitalize() + "?")
+
+    print(f"{'terms':>7} {'build ms':>9} {'legacy us/msg':>14} {'compiled us/msg':>16}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        terms = [random_word(rng, 9, 14) for _ in range(size)]  # long enough to (almost) never hit
+
+        t0 = time.perf_counter()
+        engine = ModerationEngine({"modes": {"safe": {"terms": terms, "word_boundary": True}}})
+        build_ms = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        for m in messages:
+            text = m.lower()
+            any(t in text for t in terms)
+        legacy_us = (time.perf_counter() - t0) / len(messages) * 1e6
+
+        t0 = time.perf_counter()
+        for m in messages:
+            engine.check(m, "safe")
+        compiled_us = (time.perf_counter() - t0) / len(messages) * 1e6
+
+        print(f"{size:>7} {build_ms:>9.1f} {legacy_us:>14.1f} {compiled_us:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+bench_nearest.py
+Latency of the nearest-pattern fallback (nearest.py) as the pattern set grows.
+- intents patterns plus --scale synthetic variants of each (a filler word appended and
+  one word dropped), vectorized with the train.py vectorizer and exported with export_nearest
+- per-query latency (p50 / p99 / mean) of NearestIndex.search on single messages: exact, and
+  with inverted-list pruning (--max-postings)
+- top-1 agreement with a brute-force scipy product X @ q over all patterns
+
+Run from the repo root:  python -m benchmarks.bench_nearest [--scale 1200] [--n 2000]
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+
+from config import settings  # noqa: E402
+from nearest import NearestIndex, export_nearest  # noqa: E402
+from train import build_pipeline, default_config, load_dataset  # noqa: E402
+
+
+def scaled_dataset(patterns, tags, scale: int, rng: random.Random):
+    out_p, out_t = list(patterns), list(tags)
+    for k in range(scale):
+        for p, t in zip(patterns, tags):
+            words = p.split()
+            if len(words) > 2:
+                del words[rng.randrange(len(words))]
+            out_p.append(" ".join(words) + f" filler{rng.randrange(50 * scale + 1)}")
+            out_t.append(t)
+    return out_p, out_t
+
+
+def latencies_us(index: NearestIndex, queries):
+    times = []
+    for q in queries:
+        t0 = time.perf_counter_ns()
+        index.search(*q, k=5)
+        times.append((time.perf_counter_ns() - t0) / 1000)
+    times.sort()
+    return times[len(times) // 2], times[int(len(times) * 0.99)], statistics.fmean(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=1200, help="synthetic variants per pattern")
+    parser.add_argument("--n", type=int, default=2000, help="queries timed")
+    parser.add_argument("--max-postings", type=int, default=2000, help="pruned run: skip longer inverted lists")
+    args = parser.parse_args()
+
+    rng = random.Random(settings.RANDOM_STATE)
+    _, base_patterns, base_tags = load_dataset()
+    patterns, tags = scaled_dataset(base_patterns, base_tags, args.scale, rng)
+    pipeline = build_pipeline(default_config(), len(patterns))
+    pipeline.steps[-1] = ("clf", "passthrough")  # only the vectorizer steps are needed
+    pipeline.fit(patterns)
+    transformer = pipeline[:-1]
+
+    messages = [rng.choice(base_patterns) + rng.choice(["", " please", " now", " thanks"]) for _ in range(args.n)]
+    X = transformer.transform(messages).tocsr()
+    queries = []
+    for r in range(X.shape[0]):
+        row = X.getrow(r)
+        queries.append((1, np.zeros(row.nnz, dtype=np.int64), row.indices.astype(np.int64), row.data))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        export_nearest(pipeline, patterns, tags, tmp)
+        build_s = time.perf_counter() - start
+        index = NearestIndex(tmp)
+        lengths = np.diff(index.indptr)
+        print(f"{index.n_patterns} patterns, {index.n_features} features, {len(index.data)} nonzeros; "
+              f"built in {build_s:.1f}s; longest inverted list {lengths.max()}, median {int(np.median(lengths))}")
+
+        # Brute force over every pattern (scipy), for agreement.
+        P = transformer.transform(patterns).tocsr()
+        norms = np.sqrt(np.asarray(P.multiply(P).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        P = P.multiply((1.0 / norms)[:, None]).tocsr()
+        t0 = time.perf_counter()
+        brute = np.asarray((P @ X.T).max(axis=0).todense()).ravel()
+        brute_us = (time.perf_counter() - t0) / len(messages) * 1e6
+
+        print(f"\n{'':28} {'p50 us':>8} {'p99 us':>8} {'mean us':>8} {'top-1 = brute':>14}")
+        for label, max_postings in (("exact", 0), (f"pruned (max {args.max_postings})", args.max_postings)):
+            index.max_postings = max_postings
+            latencies_us(index, queries[:100])  # warm the mmap pages
+            p50, p99, mean = latencies_us(index, queries)
+            hits = [index.search(*q)[0] for q in queries]
+            best = np.array([h[0][1] if h else 0.0 for h in hits])
+            agree = np.mean(np.isclose(best, brute, atol=1e-5))
+            print(f"{label:28} {p50:8.1f} {p99:8.1f} {mean:8.1f} {agree:14.1%}")
+        print(f"{'brute force X @ q (batched)':28} {'':8} {'':8} {brute_us:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
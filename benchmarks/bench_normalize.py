@@ -0,0 +1,87 @@
+"""
+bench_normalize.py
+Text preprocessing throughput over --n messages (1M by default): normalize.py vs what it replaced.
+- normalize: the old utils.clean_text (two re.sub passes, punctuation class rebuilt per
+  call) vs normalize() per message vs normalize_batch()
+- tokenize: the vectorizer's own analyzer (sklearn) and nltk word_tokenize (when punkt /
+  punkt_tab is installed) vs tokenize() per message vs tokenize_batch()
+- checks the new functions return exactly what the references return
+
+Run from the repo root:  python -m benchmarks.bench_normalize [--n 1000000]
+"""
+
+import argparse
+import random
+import re
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from normalize import TOKEN_PATTERN, normalize, normalize_batch, tokenize, tokenize_batch  # noqa: E402
+from train import load_dataset  # noqa: E402
+
+NOISE = ["", "!!!", "?", " :)", "  pls", "\tASAP", " …", " #42", " thx!!"]
+
+
+def legacy_clean_text(text: str) -> str:
+    if not text:
+        return ""
+    text = text.lower()
+    text = re.sub(f"[{re.escape(string.punctuation)}]", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+
+def corpus(n: int, seed: int = 0):
+    _, patterns, _ = load_dataset()
+    rng = random.Random(seed)
+    return [rng.choice(patterns).upper() if k % 7 == 0 else rng.choice(patterns) + rng.choice(NOISE)
+            for k in range(n)]
+
+
+def timed(label: str, fn, n: int, reference=None):
+    start = time.perf_counter()
+    out = fn()
+    seconds = time.perf_counter() - start
+    match = "" if reference is None else ("  identical" if out == reference else "  MISMATCH")
+    print(f"  {label:34} {seconds:7.2f} s  {n / seconds / 1e6:6.2f} M msg/s{match}")
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=1_000_000)
+    args = parser.parse_args()
+    messages = corpus(args.n)
+    n = len(messages)
+    print(f"{n} messages, {sum(map(len, messages)) / n:.0f} chars on average")
+
+    print("normalize")
+    reference = timed("old clean_text (re.sub x2)", lambda: [legacy_clean_text(m) for m in messages], n)
+    timed("normalize() per message", lambda: [normalize(m) for m in messages], n, reference)
+    timed("normalize_batch()", lambda: normalize_batch(messages), n, reference)
+    timed("normalize_batch() from an iterator", lambda: normalize_batch(iter(messages)), n, reference)
+
+    print("tokenize")
+    try:
+        from sklearn.feature_extraction.text import CountVectorizer
+        analyze = CountVectorizer(token_pattern=TOKEN_PATTERN).build_analyzer()
+        reference = timed("sklearn analyzer (unigrams)", lambda: [analyze(m) for m in messages], n)
+    except ImportError:
+        reference = None
+    try:
+        from nltk.tokenize import word_tokenize
+        word_tokenize("warm up")
+        sample = messages[:max(n // 20, 1)]
+        timed(f"nltk word_tokenize ({len(sample)} msgs)", lambda: [word_tokenize(m) for m in sample], len(sample))
+    except (ImportError, LookupError):
+        print("  nltk word_tokenize                 skipped (nltk or punkt/punkt_tab data not installed)")
+    timed("tokenize() per message", lambda: [tokenize(m) for m in messages], n, reference)
+    timed("tokenize_batch()", lambda: tokenize_batch(messages), n, reference)
+
+
+if __name__ == "__main__":
+    main()
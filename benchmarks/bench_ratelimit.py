@@ -0,0 +1,78 @@
+"""
+bench_ratelimit.py
+Per-request cost of the token-bucket limiter (ratelimit.py).
+- store.take() for the memory and SQLite backends over many distinct keys
+- full middleware hop (header scan + take + passthrough) vs calling the app directly
+- memory backend key count after a flood of unique clients (eviction keeps it bounded)
+
+Run from the repo root:  python -m benchmarks.bench_ratelimit [--keys 200000]
+"""
+
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ratelimit import MemoryBucketStore, RateLimitMiddleware, SqliteBucketStore  # noqa: E402
+
+
+def bench_take(store, keys, n):
+    start = time.perf_counter()
+    for i in range(n):
+        store.take(keys[i % len(keys)])
+    return (time.perf_counter() - start) / n * 1e6
+
+
+async def noop_app(scope, receive, send):
+    return None
+
+
+async def bench_middleware(n, store):
+    mw = RateLimitMiddleware(noop_app, store)
+    scopes = [{
+        "type": "http",
+        "path": "/chat",
+        "client": (f"10.0.{i // 256 % 256}.{i % 256}", 1234),
+        "headers": [(b"host", b"localhost"), (b"content-type", b"application/json"), (b"user-agent", b"bench")],
+    } for i in range(1000)]
+    start = time.perf_counter()
+    for i in range(n):
+        await noop_app(scopes[i % 1000], None, None)
+    direct = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(n):
+        await mw(scopes[i % 1000], None, None)
+    wrapped = time.perf_counter() - start
+    return (wrapped - direct) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200000, help="take() calls per run")
+    parser.add_argument("--keys", type=int, default=200000, help="distinct clients in the flood test")
+    args = parser.parse_args()
+
+    keys = [f"ip:10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(10000)]
+    # Generous limits so the benchmark measures the allowed (common) path.
+    mem = MemoryBucketStore(per_minute=10**9, burst=10**6)
+    print(f"memory take():     {bench_take(mem, keys, args.n):6.2f} us/call")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sq = SqliteBucketStore(Path(tmp) / "rl.db", per_minute=10**9, burst=10**6)
+        print(f"sqlite take():     {bench_take(sq, keys, min(args.n, 50000)):6.2f} us/call")
+
+    overhead = asyncio.run(bench_middleware(args.n, MemoryBucketStore(per_minute=10**9, burst=10**6)))
+    print(f"middleware (mem):  {overhead:6.2f} us/request overhead")
+
+    flood = MemoryBucketStore(per_minute=120, burst=30, max_keys=args.keys // 4)
+    for i in range(args.keys):
+        flood.take(f"ip:{i}")
+    print(f"flood of {args.keys} unique keys, cap {args.keys // 4}: {flood.stats()['keys']} tracked")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+bench_scorer.py
+Compare the sklearn pickle path with the compact NumPy scorer (scorer.py).
+- parity: predictions and confidences on every intents.json pattern
+- cold load: fresh interpreter, import + load artifacts (median of --runs)
+- steady state: per-message and batched scoring latency
+- confirms the NumPy path never imports sklearn
+
+Run from the repo root after training:  python -m benchmarks.bench_scorer
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from config import MODEL_PATH, VECTORIZER_PATH, INTENTS_PATH, COMPACT_DIR  # noqa: E402
+from inference import load_bundle  # noqa: E402
+
+LOAD_SNIPPET = """
+import sys, time
+t = time.perf_counter()
+from config import MODEL_PATH, VECTORIZER_PATH, INTENTS_PATH, COMPACT_DIR
+from inference import load_bundle
+b = load_bundle(MODEL_PATH, VECTORIZER_PATH, INTENTS_PATH, compact_dir={compact})
+b.classify(["hello"])
+print(time.perf_counter() - t, "sklearn" in sys.modules)
+"""
+
+
+def cold_load(compact: bool, runs: int):
+    code = LOAD_SNIPPET.format(compact="COMPACT_DIR" if compact else "None")
+    times, sklearn_loaded = [], False
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+        t, loaded = out.stdout.split()
+        times.append(float(t) * 1000)
+        sklearn_loaded = loaded == "True"
+    return statistics.median(times), sklearn_loaded
+
+
+def per_message_us(bundle, messages):
+    start = time.perf_counter()
+    for m in messages:
+        bundle.score([m])
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+def batched_us(bundle, messages):
+    start = time.perf_counter()
+    bundle.score(messages)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=5000, help="messages per latency run")
+    parser.add_argument("--runs", type=int, default=5, help="cold-start subprocess runs")
+    args = parser.parse_args()
+
+    sk = load_bundle(MODEL_PATH, VECTORIZER_PATH, INTENTS_PATH)
+    np_ = load_bundle(MODEL_PATH, VECTORIZER_PATH, INTENTS_PATH, compact_dir=COMPACT_DIR)
+
+    patterns = [p for i in sk.intents["intents"] for p in i.get("patterns", [])]
+    messages = [patterns[k % len(patterns)] for k in range(args.n)]
+
+    a_idx, a_conf = sk.score(patterns)
+    b_idx, b_conf = np_.score(patterns)
+    same = int((a_idx == b_idx).sum())
+    err = float(abs(a_conf - b_conf).max()) if a_conf is not None else 0.0
+    print(f"parity: {same}/{len(patterns)} identical predictions, max |conf diff| = {err:.3g}")
+
+    for name, compact in (("sklearn", False), ("numpy", True)):
+        ms, sklearn_loaded = cold_load(compact, args.runs)
+        print(f"cold load [{name:7}]: {ms:8.1f} ms  (sklearn imported: {sklearn_loaded})")
+
+    for name, bundle in (("sklearn", sk), ("numpy", np_)):
+        per_message_us(bundle, messages[:200])  # warm-up
+        print(f"score [{name:7}]: {per_message_us(bundle, messages):8.1f} us/msg single, "
+              f"{batched_us(bundle, messages):6.2f} us/msg batched")
+
+
+if __name__ == "__main__":
+    main()
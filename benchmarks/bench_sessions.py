@@ -0,0 +1,76 @@
+"""
+bench_sessions.py
+Memory and latency of the in-process session store (sessions.py).
+- fills --users sessions with full ring buffers and compares the store's own footprint
+  estimate (what /stats reports and the budget is enforced on) with tracemalloc
+- get + record latency for a hot user and across all users
+- with --budget-mb below the fill size, checks the store stays within budget by evicting
+
+Persistence is off here (no SQLite); it only adds the background writer thread.
+Run from the repo root:  python -m benchmarks.bench_sessions [--users 300000] [--budget-mb 64]
+"""
+
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import settings  # noqa: E402
+from sessions import SessionStore  # noqa: E402
+
+INTENTS = [sys.intern(f"intent_{k}") for k in range(40)]
+
+
+def fill(store: SessionStore, users, turns: int, rng: random.Random):
+    for user_id in users:
+        session = store.get(user_id)
+        for _ in range(turns):
+            store.record(session, rng.choice(INTENTS), rng.randrange(3))
+
+
+def per_op_ns(store: SessionStore, users, n: int, rng: random.Random) -> float:
+    picks = [rng.choice(users) for _ in range(n)]
+    start = time.perf_counter_ns()
+    for user_id in picks:
+        session = store.get(user_id)
+        store.record(session, "intent_1", session.next_choice("intent_1", 3))
+    return (time.perf_counter_ns() - start) / n
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=300_000)
+    parser.add_argument("--turns", type=int, default=settings.SESSION_TURNS)
+    parser.add_argument("--budget-mb", type=float, default=settings.SESSION_MEMORY_MB)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    users = [f"user-{k:08d}" for k in range(args.users)]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = SessionStore(max_turns=args.turns, memory_bytes=int(args.budget_mb * 1024 * 1024), persist=False)
+    start = time.perf_counter()
+    fill(store, users, args.turns, rng)
+    fill_s = time.perf_counter() - start
+    actual = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    stats = store.stats()
+    print(f"filled {args.users} users x {args.turns} turns in {fill_s:.1f}s")
+    print(f"sessions held: {stats['sessions']} (evicted over budget: {stats['evicted_lru']})")
+    print(f"estimated: {stats['bytes'] / 2**20:8.1f} MB ({stats['bytes_per_session']:.0f} B/session), "
+          f"budget {args.budget_mb:.0f} MB")
+    print(f"measured : {actual / 2**20:8.1f} MB ({actual / max(stats['sessions'], 1):.0f} B/session, tracemalloc)")
+
+    held = [u for u in users if store.peek(u) is not None]
+    print(f"get+record, hot user : {per_op_ns(store, held[:1], 200_000, rng):7.0f} ns/op")
+    print(f"get+record, all users: {per_op_ns(store, held, 200_000, rng):7.0f} ns/op")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+bench_sqlite.py
+SQLite contention benchmark: N writer threads + M reader threads against a scratch DB.
+- before: fresh connection per operation, default rollback journal (the old database.py)
+- after:  database.ConnectionManager (persistent per-thread connections, WAL, tuned pragmas,
+          read-only analytics connections)
+
+Run from the repo root:  python -m benchmarks.bench_sqlite [--writers 4] [--readers 4] [--seconds 5]
+"""
+
+import argparse
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database  # noqa: E402
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, message TEXT, reply TEXT, intent TEXT,
+    confidence REAL, latency_ms INTEGER, allowed INTEGER, meta TEXT, ts INTEGER
+);
+"""
+READ_QUERIES = (
+    "SELECT intent, COUNT(*) FROM chats GROUP BY intent",
+    "SELECT AVG(latency_ms) FROM chats WHERE latency_ms IS NOT NULL",
+    "SELECT user_id, message, reply, intent, ts FROM chats ORDER BY ts DESC LIMIT 10",
+)
+
+
+def row(i):
+    return (f"user_{i % 500}", "how much is pro", "We offer Free, Plus, and Pro.", "pricing",
+            0.8, 3, 1, "{}", int(time.time()))
+
+
+class Legacy:
+    """The original access pattern: connect, execute, commit, close."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, i):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute(database.INSERT_CHAT_SQL, row(i))
+        conn.commit()
+        conn.close()
+
+    def read(self, q):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute(q).fetchall()
+        conn.close()
+
+
+class Pooled:
+    def __init__(self, path):
+        self.mgr = database.ConnectionManager(path)
+
+    def write(self, i):
+        conn = self.mgr.writer()
+        with conn:
+            conn.execute(database.INSERT_CHAT_SQL, row(i))
+
+    def read(self, q):
+        self.mgr.reader().execute(q).fetchall()
+
+
+def run(impl, writers, readers, seconds):
+    stop = threading.Event()
+    counts = {"writes": 0, "reads": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def loop(fn):
+        n = errors = 0
+        while not stop.is_set():
+            try:
+                fn(n)
+                n += 1
+            except sqlite3.OperationalError:  # "database is locked"
+                errors += 1
+        return n, errors
+
+    def writer():
+        n, e = loop(impl.write)
+        with lock:
+            counts["writes"] += n
+            counts["errors"] += e
+
+    def reader():
+        n, e = loop(lambda k: impl.read(READ_QUERIES[k % len(READ_QUERIES)]))
+        with lock:
+            counts["reads"] += n
+            counts["errors"] += e
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return {k: v / seconds if k != "errors" else v for k, v in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--seed-rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, cls in (("before", Legacy), ("after", Pooled)):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "bench.db"
+            conn = sqlite3.connect(path)
+            conn.execute(SCHEMA)
+            conn.executemany(database.INSERT_CHAT_SQL, [row(i) for i in range(args.seed_rows)])
+            conn.commit()
+            conn.close()
+            r = run(cls(path), args.writers, args.readers, args.seconds)
+            print(f"{name:6}: {r['writes']:9.0f} writes/s  {r['reads']:9.0f} reads/s  "
+                  f"{r['errors']} lock errors  ({args.writers}W/{args.readers}R)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+bench_vectorizers.py
+VECTORIZER_MODE=tfidf (vocabulary) vs VECTORIZER_MODE=hashing (feature hashing + idf array).
+- accuracy: cross-validated accuracy / macro F1 of the train.py pipeline in each mode
+- artifact size: model.pkl, vectorizer.pkl and the compact NumPy export
+- load time: fresh interpreter, unpickle model.pkl / open the compact export (median of --runs)
+- transform latency: vectorizing one message at a time and in one batch, sklearn and NumPy paths
+- --scale K adds K variants of every pattern, each with an unseen filler word, to grow the
+  vocabulary the way a large intent corpus would (hashing memory stays fixed by HASH_N_FEATURES)
+
+Run from the repo root:  python -m benchmarks.bench_vectorizers [--scale 50] [--n 5000]
+"""
+
+import argparse
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import joblib  # noqa: E402
+import numpy as np  # noqa: E402
+from sklearn.model_selection import StratifiedKFold, cross_validate  # noqa: E402
+
+from config import settings  # noqa: E402
+from scorer import CompactScorer, export_compact  # noqa: E402
+from train import build_pipeline, default_config, load_dataset, n_features  # noqa: E402
+
+LOAD_SNIPPET = """
+import sys, time
+t = time.perf_counter()
+{load}
+print(time.perf_counter() - t)
+"""
+LOADERS = {
+    "pickle": "import joblib; m = joblib.load({path!r}); m.predict(['hello'])",
+    "compact": "from scorer import CompactScorer; s = CompactScorer({path!r}); s.score(['hello'])",
+}
+
+
+def scaled_dataset(patterns, tags, scale: int, seed: int):
+    rng = random.Random(seed)
+    out_p, out_t = list(patterns), list(tags)
+    for k in range(scale):
+        for p, t in zip(patterns, tags):
+            out_p.append(f"{p} filler{k}x{rng.randrange(10 ** 6)}")
+            out_t.append(t)
+    return out_p, out_t
+
+
+def dir_kb(path: Path) -> float:
+    return sum(f.stat().st_size for f in path.iterdir()) / 1024
+
+
+def cold_load(kind: str, path: Path, runs: int) -> float:
+    code = LOAD_SNIPPET.format(load=LOADERS[kind].format(path=str(path)))
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.split()[-1]) * 1000)
+    return statistics.median(times)
+
+
+def per_message_us(fn, messages):
+    start = time.perf_counter()
+    for m in messages:
+        fn([m])
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+def batched_us(fn, messages):
+    start = time.perf_counter()
+    fn(messages)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+def bench_mode(mode, patterns, tags, messages, args, workdir: Path):
+    config = {**default_config(), "vectorizer": mode}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # small folds: ill-defined F1 / convergence
+        cv = StratifiedKFold(n_splits=args.cv, shuffle=True, random_state=settings.RANDOM_STATE)
+        n_train = int(len(patterns) * (args.cv - 1) / args.cv)
+        scores = cross_validate(build_pipeline(config, n_train), patterns, tags, cv=cv,
+                                scoring=("accuracy", "f1_macro"))
+        pipeline = build_pipeline(config, len(patterns)).fit(patterns, tags)
+    if mode == "hashing":
+        pipeline.steps[-1][1].sparsify()  # as train_and_save does
+
+    out = workdir / mode
+    out.mkdir()
+    joblib.dump(pipeline, out / "model.pkl")
+    joblib.dump(pipeline[:-1], out / "vectorizer.pkl")
+    compact = export_compact(pipeline, out / "compact", sample=patterns[:500])
+
+    transformer, scorer = pipeline[:-1], CompactScorer(compact)
+    for fn in (transformer.transform, scorer.features):
+        per_message_us(fn, messages[:200])  # warm-up (and the hashing scorer's n-gram cache)
+    return {
+        "accuracy": float(np.mean(scores["test_accuracy"])),
+        "f1_macro": float(np.mean(scores["test_f1_macro"])),
+        "n_features": n_features(pipeline),
+        "model_kb": (out / "model.pkl").stat().st_size / 1024,
+        "vectorizer_kb": (out / "vectorizer.pkl").stat().st_size / 1024,
+        "compact_kb": dir_kb(compact),
+        "load_pickle_ms": cold_load("pickle", out / "model.pkl", args.runs),
+        "load_compact_ms": cold_load("compact", compact, args.runs),
+        "sk_single_us": per_message_us(transformer.transform, messages),
+        "sk_batched_us": batched_us(transformer.transform, messages),
+        "np_single_us": per_message_us(scorer.features, messages),
+        "np_batched_us": batched_us(scorer.features, messages),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=0, help="synthetic variants per pattern (grows the vocabulary)")
+    parser.add_argument("--n", type=int, default=5000, help="messages per latency run")
+    parser.add_argument("--cv", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=5, help="cold-load subprocess runs")
+    args = parser.parse_args()
+
+    _, patterns, tags = load_dataset()
+    patterns, tags = scaled_dataset(patterns, tags, args.scale, settings.RANDOM_STATE)
+    messages = [patterns[k % len(patterns)] for k in range(args.n)]
+    print(f"{len(patterns)} patterns, {len(set(tags))} intents; MAX_FEATURES={settings.MAX_FEATURES}, "
+          f"HASH_N_FEATURES={settings.HASH_N_FEATURES}")
+
+    rows = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("tfidf", "hashing"):
+            rows[mode] = bench_mode(mode, patterns, tags, messages, args, Path(tmp))
+
+    print(f"\n{'':22} {'tfidf':>10} {'hashing':>10}")
+    for key, label, fmt in (
+        ("accuracy", "cv accuracy", "{:10.3f}"),
+        ("f1_macro", "cv macro F1", "{:10.3f}"),
+        ("n_features", "feature columns", "{:10d}"),
+        ("model_kb", "model.pkl KB", "{:10.1f}"),
+        ("vectorizer_kb", "vectorizer.pkl KB", "{:10.1f}"),
+        ("compact_kb", "compact export KB", "{:10.1f}"),
+        ("load_pickle_ms", "cold load pickle ms", "{:10.1f}"),
+        ("load_compact_ms", "cold load compact ms", "{:10.1f}"),
+        ("sk_single_us", "sklearn us/msg single", "{:10.1f}"),
+        ("sk_batched_us", "sklearn us/msg batch", "{:10.2f}"),
+        ("np_single_us", "numpy us/msg single", "{:10.1f}"),
+        ("np_batched_us", "numpy us/msg batch", "{:10.2f}"),
+    ):
+        print(f"{label:22} " + " ".join(fmt.format(rows[m][key]) for m in ("tfidf", "hashing")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+loadtest.py
+Reproducible load test for /chat and /chat/batch.
+- Drives app.app in-process (httpx ASGI transport, no sockets) or a running server (--url)
+- Synthetic traffic from intents.json patterns: intent mix, repeated (cache-hit) share,
+  moderation-blocked share, extra-words length distribution, /chat/batch share; seeded
+- Reports throughput and p50/p95/p99/max latency, plus per-stage timings taken from
+  the Server-Timing header (moderation, cache, queue, vectorize, predict, log)
+- Writes results as JSON; --baseline compares against a stored run and exits 1 when
+  any tracked number regresses by more than --threshold
+
+Run from the repo root:
+    python -m benchmarks.loadtest --requests 5000 --concurrency 32 --out bench.json
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 --concurrency 64
+    python -m benchmarks.loadtest --baseline baseline.json --threshold 0.10
+    python -m benchmarks.loadtest --compare bench.json --baseline baseline.json   # no run
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx  # noqa: E402
+
+from config import INTENTS_PATH, settings  # noqa: E402
+from intents_index import load_source  # noqa: E402
+
+BLOCKED_TERMS = ["illegal", "exploit"]  # blocked in "safe" mode by the default moderation rules
+HOT_SET_SIZE = 20
+PERCENTILES = (50, 95, 99)
+
+
+# -------------------------
+# Traffic
+# -------------------------
+def parse_mix(spec: Optional[str], tags: List[str]) -> List[float]:
+    """'greeting=3,pricing=1' -> weight per tag (unlisted tags get 0; no spec = uniform)."""
+    if not spec:
+        return [1.0] * len(tags)
+    weights = dict.fromkeys(tags, 0.0)
+    for part in spec.split(","):
+        tag, _, w = part.partition("=")
+        if tag.strip() not in weights:
+            raise SystemExit(f"unknown intent in --mix: {tag.strip()}")
+        weights[tag.strip()] = float(w or 1)
+    return [weights[t] for t in tags]
+
+
+def extra_words(spec: str, rng: random.Random) -> int:
+    """--length: 'pattern' (no padding), 'uniform:A:B', or 'lognormal:MU:SIGMA' extra words."""
+    kind, *params = spec.split(":")
+    if kind == "pattern":
+        return 0
+    if kind == "uniform":
+        return rng.randint(int(params[0]), int(params[1]))
+    if kind == "lognormal":
+        return int(rng.lognormvariate(float(params[0]), float(params[1])))
+    raise SystemExit(f"bad --length: {spec}")
+
+
+class Traffic:
+    """Deterministic request generator: same arguments + seed -> same request sequence."""
+
+    def __init__(self, intents: Dict[str, Any], args):
+        self.rng = random.Random(args.seed)
+        self.args = args
+        intents = [i for i in intents.get("intents", []) if i.get("patterns")]
+        self.tags = [i["tag"] for i in intents]
+        self.patterns = {i["tag"]: i["patterns"] for i in intents}
+        self.weights = parse_mix(args.mix, self.tags)
+        self.vocab = sorted({w for ps in self.patterns.values() for p in ps for w in p.split()})
+        self.users = [f"load-{k}" for k in range(args.users)]
+        self.hot = [self._fresh() for _ in range(HOT_SET_SIZE)]
+
+    def _fresh(self) -> Dict[str, Any]:
+        tag = self.rng.choices(self.tags, self.weights)[0]
+        words = self.rng.choice(self.patterns[tag]).split()
+        for _ in range(extra_words(self.args.length, self.rng)):
+            words.insert(self.rng.randint(0, len(words)), self.rng.choice(self.vocab))
+        item = {"message": " ".join(words), "user_id": self.rng.choice(self.users)}
+        if self.rng.random() < self.args.blocked:
+            item["message"] += " " + self.rng.choice(BLOCKED_TERMS)
+            item["mode"] = "safe"
+        return item
+
+    def item(self) -> Dict[str, Any]:
+        if self.rng.random() < self.args.repeat:
+            return dict(self.hot[self.rng.randrange(len(self.hot))])
+        return self._fresh()
+
+    def request(self) -> Tuple[str, Dict[str, Any]]:
+        if self.rng.random() < self.args.batch_ratio:
+            return "/chat/batch", {"items": [self.item() for _ in range(self.args.batch_size)]}
+        return "/chat", self.item()
+
+
+# -------------------------
+# Running
+# -------------------------
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    stages = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "dur" and name:
+                stages[name] = float(value)
+    return stages
+
+
+async def run_load(client: httpx.AsyncClient, requests: List[Tuple[str, Dict]], concurrency: int):
+    samples: List[Tuple[str, int, float, Dict[str, float]]] = []
+    it = iter(requests)
+
+    async def worker():
+        for path, body in it:
+            t0 = time.perf_counter()
+            try:
+                r = await client.post(path, json=body)
+                status, timing = r.status_code, r.headers.get("server-timing")
+            except httpx.HTTPError:
+                status, timing = 0, None
+            samples.append((path, status, (time.perf_counter() - t0) * 1000, parse_server_timing(timing)))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - start
+
+
+async def drive(args, requests, warmup):
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout,
+                                     limits=httpx.Limits(max_connections=args.concurrency)) as client:
+            await run_load(client, warmup, args.concurrency)
+            return await run_load(client, requests, args.concurrency)
+
+    # In-process: the limiter would turn a load test into a 429 test.
+    if not args.rate_limit:
+        settings.RATE_LIMIT_ENABLED = False
+    from app import app
+
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout) as client:
+            await run_load(client, warmup, args.concurrency)
+            return await run_load(client, requests, args.concurrency)
+    finally:
+        await app.router.shutdown()
+
+
+# -------------------------
+# Reporting
+# -------------------------
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    out = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+    out["max"] = values[-1] if values else 0.0
+    out["mean"] = sum(values) / len(values) if values else 0.0
+    return out
+
+
+def git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent.parent).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def report(args, samples, elapsed) -> Dict[str, Any]:
+    by_path: Dict[str, List[float]] = {}
+    stages: Dict[str, List[float]] = {}
+    status: Dict[str, int] = {}
+    for path, code, ms, timing in samples:
+        status[str(code)] = status.get(str(code), 0) + 1
+        if code != 200:
+            continue
+        by_path.setdefault(path, []).append(ms)
+        if path == "/chat":
+            for name, dur in timing.items():
+                stages.setdefault(name, []).append(dur)
+    ok = [ms for mss in by_path.values() for ms in mss]
+    return {
+        "meta": {
+            "target": args.url or "in-process",
+            "git": git_rev(),
+            "python": platform.python_version(),
+            "timestamp": int(time.time()),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "compare")},
+        },
+        "requests": len(samples),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+        "status": status,
+        "error_rate": 1 - len(ok) / len(samples) if samples else 0.0,
+        "latency_ms": summarize(ok),
+        "endpoints": {path: summarize(mss) for path, mss in sorted(by_path.items())},
+        # Server-side stage times of successful /chat calls; absent stages (e.g. cache hits
+        # skip vectorize/predict) are simply not sampled, so counts differ per stage.
+        "stages_ms": {name: {**summarize(v), "count": len(v)} for name, v in sorted(stages.items())},
+    }
+
+
+def print_report(res: Dict[str, Any]):
+    lat = res["latency_ms"]
+    print(f"target: {res['meta']['target']}  requests: {res['requests']}  "
+          f"elapsed: {res['elapsed_s']:.2f} s  throughput: {res['throughput_rps']:.1f} req/s")
+    print(f"status: {res['status']}  error rate: {res['error_rate']:.2%}")
+    print(f"latency ms: p50 {lat['p50']:.2f}  p95 {lat['p95']:.2f}  p99 {lat['p99']:.2f}  max {lat['max']:.2f}")
+    for path, s in res["endpoints"].items():
+        print(f"  {path:12} p50 {s['p50']:8.2f}  p95 {s['p95']:8.2f}  p99 {s['p99']:8.2f}  max {s['max']:8.2f}")
+    if res["stages_ms"]:
+        print("server stages (/chat, ms):")
+        for name, s in res["stages_ms"].items():
+            print(f"  {name:12} p50 {s['p50']:8.3f}  p95 {s['p95']:8.3f}  p99 {s['p99']:8.3f}  "
+                  f"mean {s['mean']:8.3f}  (n={s['count']})")
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Regressions beyond `threshold` (fraction) in latency percentiles, throughput or error rate."""
+    rows = [("throughput_rps", baseline["throughput_rps"], current["throughput_rps"], False)]
+    for p in ("p50", "p95", "p99"):
+        rows.append((f"latency_ms.{p}", baseline["latency_ms"][p], current["latency_ms"][p], True))
+    failures = []
+    print(f"{'metric':18} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, old, new, lower_is_better in rows:
+        change = (new - old) / old if old else 0.0
+        worse = change > threshold if lower_is_better else change < -threshold
+        print(f"{name:18} {old:10.2f} {new:10.2f} {change:+8.1%}{'  REGRESSION' if worse else ''}")
+        if worse:
+            failures.append(name)
+    if current["error_rate"] > baseline["error_rate"] + 0.01:
+        print(f"error_rate: {baseline['error_rate']:.2%} -> {current['error_rate']:.2%}  REGRESSION")
+        failures.append("error_rate")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /chat and /chat/batch.")
+    parser.add_argument("--url", help="running server (default: drive app.app in-process)")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", help="intent weights, e.g. greeting=3,pricing=1 (default: uniform)")
+    parser.add_argument("--length", default="lognormal:1.0:0.8",
+                        help="extra words per message: pattern | uniform:A:B | lognormal:MU:SIGMA")
+    parser.add_argument("--repeat", type=float, default=0.3, help="share of messages from a small hot set")
+    parser.add_argument("--blocked", type=float, default=0.02, help="share of messages that moderation blocks")
+    parser.add_argument("--batch-ratio", type=float, default=0.0, help="share of requests sent to /chat/batch")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--rate-limit", action="store_true", help="keep the rate limiter on (in-process only)")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed regression (fraction)")
+    parser.add_argument("--compare", help="compare this results JSON to --baseline instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        if not args.baseline:
+            parser.error("--compare needs --baseline")
+        with open(args.compare) as f:
+            res = json.load(f)
+    else:
+        traffic = Traffic(load_source(INTENTS_PATH), args)  # a file or a directory of shards
+        warmup = [traffic.request() for _ in range(args.warmup)]
+        requests = [traffic.request() for _ in range(args.requests)]
+        samples, elapsed = asyncio.run(drive(args, requests, warmup))
+        res = report(args, samples, elapsed)
+        print_report(res)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(res, f, indent=2)
+            print(f"wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(res, json.load(f), args.threshold)
+        if failures:
+            print(f"FAIL: {', '.join(failures)} regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+        print("OK: no regression beyond threshold")
+
+
+if __name__ == "__main__":
+    main()
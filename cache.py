@@ -0,0 +1,88 @@
+"""
+cache.py
+In-process reply cache for Candy AI Clone chatbot.
+- Bounded LRU with per-entry TTL
+- Stores the classification (intent, confidence), never the rendered reply
+- Generation counter ties entries to the artifacts that produced them
+- Hit / miss / eviction counters for /stats
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class ReplyCache:
+    """
+    LRU + TTL cache keyed on the message's vectorizer tokens (+ mode).
+
+    Every lookup and insert carries the generation of the artifact bundle the caller
+    is using. `invalidate()` bumps the generation, so a /reload makes all older
+    entries unreachable in one step, and results computed against the old bundle
+    can no longer be stored.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 300.0):
+        self.max_size = max(0, max_size)
+        self.ttl = ttl_seconds
+        self.generation = 0
+        self._data: "OrderedDict[Hashable, Tuple[Any, float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, generation: int) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires, gen = entry
+            if gen != generation or expires < time.monotonic():
+                if gen == generation:
+                    self.expirations += 1
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, generation: int):
+        if self.max_size == 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return  # computed against a bundle that has since been replaced
+            self._data[key] = (value, time.monotonic() + self.ttl, generation)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self) -> int:
+        """Drop everything and return the new generation for the incoming bundle."""
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+            self.invalidations += 1
+            return self.generation
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "generation": self.generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
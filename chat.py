@@ -8,39 +8,30 @@ Interactive CLI chatbot tester for Candy AI Clone.
 - Useful for quick smoke tests before hooking into API (app.py)
 """
 
-import joblib
-import json
 import random
-import os
-from config import MODEL_PATH, VECTORIZER_PATH, INTENTS_PATH
+from config import MODEL_PATH, VECTORIZER_PATH, INTENTS_PATH, INTENTS_INDEX_PATH, NEAREST_DIR, settings
+from inference import load_bundle
 
 # -------------------------
 # Load artifacts
 # -------------------------
-if not os.path.exists(MODEL_PATH) or not os.path.exists(VECTORIZER_PATH):
-    raise RuntimeError("Model/vectorizer not found. Run train.py first.")
-
-print("[INFO] Loading model + vectorizer...")
-model = joblib.load(MODEL_PATH)
-vectorizer = joblib.load(VECTORIZER_PATH)
-
-with open(INTENTS_PATH, "r", encoding="utf-8") as f:
-    intents = json.load(f)
-
+print("[INFO] Loading model + vectorizer + intents...")
+bundle = load_bundle(MODEL_PATH, VECTORIZER_PATH, INTENTS_PATH, index_path=INTENTS_INDEX_PATH,
+                     nearest_dir=NEAREST_DIR if settings.NEAREST_ENABLED else None,
+                     confidence_threshold=settings.CONFIDENCE_THRESHOLD,
+                     min_similarity=settings.NEAREST_MIN_SIMILARITY)
 print("[INFO] Intents loaded.")
 
 # -------------------------
 # Helpers
 # -------------------------
 def get_response(user_input: str):
-    X = vectorizer.transform([user_input])
-    tag = model.predict(X)[0]
-
-    # pick response
-    for intent in intents["intents"]:
-        if intent["tag"] == tag:
-            return random.choice(intent["responses"]), tag
-    return "I'm not sure I understand. Could you rephrase?", "fallback"
+    result = bundle.classify([user_input])[0]
+    intent = result["intent"]
+    if intent is None:  # low confidence and no close pattern
+        return result["reply"], "fallback"
+    choice = random.randrange(bundle.response_count(intent))
+    return bundle.respond(intent, result["confidence"], {"user_id": "cli"}, choice)["reply"], intent
 
 # -------------------------
 # CLI Loop
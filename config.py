@@ -6,6 +6,7 @@ Central configuration for the NSFW (adult) service chatbot.
 - Uses environment variables with sensible defaults.
 - Centralizes paths, toggles, logging, security, and rate-limit knobs.
 - Import from other modules: from config import ...
+- Importing has no side effects; entry points that write files call ensure_dirs()
 """
 
 from pydantic import BaseSettings, AnyHttpUrl, validator
@@ -33,21 +34,92 @@ class Settings(BaseSettings):
     # Model + vectorizer filenames (scikit-learn pipeline)
     MODEL_FILENAME: str = "model.pkl"
     VECTORIZER_FILENAME: str = "vectorizer.pkl"
-    INTENTS_FILENAME: str = "intents.json"
+    INTENTS_FILENAME: str = "intents.json"  # or a directory of *.json shards
+    INTENTS_INDEX_FILENAME: str = "intents.idx"  # compiled responses (see intents_index.py)
+    COMPACT_DIRNAME: str = "compact"  # NumPy export of the pipeline (see scorer.py)
+    NEAREST_DIRNAME: str = "nearest"  # nearest-pattern index (see nearest.py)
+    MANIFEST_FILENAME: str = "manifest.json"  # who published the serving artifacts (train.py / online_train.py)
 
     # ---- Policy / Moderation Modes ----
     #   safe: stricter filtering
     #   nsfw: allow adult content but still block illegal/abuse content
     #   default: medium stance
     MODERATION_MODE: str = "default"  # default | safe | nsfw
+    # Per-mode blocklists (JSON, see moderation.py); built-in 'safe' list if missing
+    MODERATION_RULES_FILENAME: str = "moderation.json"
+
+    # ---- Inference / Batching ----
+    # Load artifacts in the background after startup instead of while importing app.py;
+    # /ready answers 503 (and /chat refuses) until they are live. Single-process nodes only:
+    # serve.py's pre-fork sharing needs the eager load.
+    LAZY_STARTUP: bool = False
+    SERVING_BACKEND: str = "sklearn"  # sklearn | numpy (mmap'd compact artifact, no sklearn import)
+    MAX_BATCH_SIZE: int = 1000  # max items accepted by /chat/batch
+    # Coalesce concurrent /chat calls into one batched inference
+    MICROBATCH_ENABLED: bool = True
+    MICROBATCH_WINDOW_MS: float = 2.0  # how long the first request waits for company
+    MICROBATCH_MAX_BATCH: int = 64
+    # Normalized-message reply cache (stores intent + confidence, cleared on /reload)
+    REPLY_CACHE_ENABLED: bool = True
+    REPLY_CACHE_SIZE: int = 10000
+    REPLY_CACHE_TTL_SECONDS: float = 300.0
+    # Below this classifier confidence (0 = off) the reply comes from the most similar
+    # intents pattern if its cosine similarity reaches NEAREST_MIN_SIMILARITY, else the fallback
+    CONFIDENCE_THRESHOLD: float = 0.55
+    NEAREST_ENABLED: bool = True
+    NEAREST_MIN_SIMILARITY: float = 0.5
+    NEAREST_MAX_POSTINGS: int = 0  # >0: skip query terms in more patterns than this (approximate)
+    SERVER_TIMING: bool = True  # per-stage Server-Timing header on /chat and /chat/batch
+    METRICS_ENABLED: bool = True  # stage histograms + counters served on /metrics
+    # Reload artifacts automatically when the files on disk change (POST /reload works regardless)
+    ARTIFACT_WATCH: bool = False
+    ARTIFACT_WATCH_INTERVAL_S: float = 2.0
+
+    # ---- Workers (production launcher, see serve.py) ----
+    WORKERS: int = 0  # 0 = one per CPU core
+    GC_FREEZE_AFTER_LOAD: bool = True  # gc.freeze() in the parent so workers don't dirty shared pages
 
     # ---- Logging / Analytics ----
     ENABLE_REQUEST_LOG: bool = True
     LOG_LEVEL: str = "INFO"  # DEBUG | INFO | WARNING | ERROR
-
-    # ---- Rate Limiting (basic knobs; implement in middleware if needed) ----
-    RATE_LIMIT_PER_MINUTE: int = 120  # per IP/user
+    # Write-behind chat logging (database.ChatLogWriter)
+    LOG_QUEUE_SIZE: int = 10000  # rows buffered before new ones are dropped
+    LOG_BATCH_SIZE: int = 256  # rows per executemany/transaction
+    LOG_FLUSH_INTERVAL_MS: int = 500
+    EXPORT_PAGE_SIZE: int = 1000  # rows per keyset page in /export/chats
+
+    # ---- Profiling (sampling profiler for slow requests, see profiler.py) ----
+    PROFILE_ENABLED: bool = False  # can also be switched at runtime via POST /admin/profile
+    PROFILE_SAMPLE_RATE: float = 0.01  # share of requests captured regardless of latency
+    PROFILE_SLOW_MS: float = 250.0  # requests slower than this are always captured
+    PROFILE_INTERVAL_MS: float = 5.0  # stack sampling period
+    PROFILE_MAX_REQUESTS: int = 500  # rolling window of captured requests
+    PROFILE_TOP_N: int = 30
+    PROFILE_FLUSH_SECONDS: float = 10.0
+    PROFILE_DIRNAME: str = "profiles"  # under LOG_DIR
+
+    # ---- Known users (Bloom filter in front of the users table, see database.KnownUsers) ----
+    KNOWN_USERS_ENABLED: bool = True
+    KNOWN_USERS_CAPACITY: int = 1_000_000  # filter memory ~ 1.2 MB per million at 1%
+    KNOWN_USERS_FP_RATE: float = 0.01  # false positives cost one primary-key read
+    KNOWN_USERS_HOT_SIZE: int = 100_000  # exact set of recent ids (x2 generations)
+    KNOWN_USERS_FLUSH_MS: float = 500.0  # new ids are inserted in one batch per interval
+
+    # ---- Sessions (per-user recent turns, see sessions.py) ----
+    SESSIONS_ENABLED: bool = True
+    SESSION_TURNS: int = 8  # ring buffer size per user
+    SESSION_MEMORY_MB: float = 128.0  # hard budget; least recently used sessions are evicted past it
+    SESSION_IDLE_S: float = 1800.0  # evict sessions unused for this long
+    SESSION_PERSIST: bool = True  # write-behind to the sessions table, warm from it on a miss
+    SESSION_FLUSH_S: float = 5.0
+
+    # ---- Rate Limiting (token bucket, see ratelimit.py) ----
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_PER_MINUTE: int = 120  # per allowlisted API key, else per client IP; a batch costs one per item
     RATE_LIMIT_BURST: int = 30
+    RATE_LIMIT_BACKEND: str = "memory"  # memory (per process) | sqlite (shared across workers)
+    RATE_LIMIT_DB_FILENAME: str = "ratelimit.db"  # under LOG_DIR, sqlite backend only
+    RATE_LIMIT_MAX_KEYS: int = 1_000_000  # memory backend bound on tracked clients
 
     # ---- Security ----
     # Optional API key for /chat; implement check in app.py if needed
@@ -56,11 +128,26 @@ class Settings(BaseSettings):
     API_KEYS_ALLOWLIST: List[str] = []
 
     # ---- Training Hyperparams (for train.py) ----
-    MAX_FEATURES: int = 5000
+    VECTORIZER_MODE: str = "tfidf"  # tfidf (vocabulary) | hashing (no vocabulary, memory fixed by HASH_N_FEATURES)
+    MAX_FEATURES: int = 5000  # tfidf mode
+    HASH_N_FEATURES: int = 2 ** 16  # hashing mode; more columns = fewer collisions, larger idf array
     NGRAM_RANGE: tuple = (1, 2)  # unigrams + bigrams
     TEST_SIZE: float = 0.15
     RANDOM_STATE: int = 42
     CLASSIFIER: str = "logreg"  # logreg | linear_svc | sgd
+    REG_C: float = 1.0  # inverse regularization strength (sgd: alpha = 1 / (C * n_samples))
+    # train.py --search
+    SEARCH_CV_FOLDS: int = 5
+    SEARCH_JOBS: int = 0  # worker processes, 0 = CPU count
+    SEARCH_N_ITER: int = 30  # candidates for --search random
+    SEARCH_F1_TOLERANCE: float = 0.01  # macro F1 given up for a faster / smaller model
+    # online_train.py (incremental SGD on labeled chats)
+    ONLINE_DIRNAME: str = "online"  # under ARTIFACT_DIR: online model + cursor state
+    ONLINE_CHUNK_SIZE: int = 1000  # labeled rows per partial_fit
+    ONLINE_HASH_FEATURES: int = 2 ** 18
+    ONLINE_ALPHA: float = 1e-4  # SGD regularization
+    ONLINE_REHEARSAL: int = 64  # intents.json patterns mixed into each chunk
+    ONLINE_INTERVAL_S: float = 60.0  # --loop polling period
 
     @property
     def MODEL_PATH(self) -> Path:
@@ -70,10 +157,38 @@ class Settings(BaseSettings):
     def VECTORIZER_PATH(self) -> Path:
         return self.ARTIFACT_DIR / self.VECTORIZER_FILENAME
 
+    @property
+    def COMPACT_DIR(self) -> Path:
+        return self.ARTIFACT_DIR / self.COMPACT_DIRNAME
+
+    @property
+    def NEAREST_DIR(self) -> Path:
+        return self.ARTIFACT_DIR / self.NEAREST_DIRNAME
+
+    @property
+    def MANIFEST_PATH(self) -> Path:
+        return self.ARTIFACT_DIR / self.MANIFEST_FILENAME
+
     @property
     def INTENTS_PATH(self) -> Path:
         return self.DATA_DIR / self.INTENTS_FILENAME
 
+    @property
+    def INTENTS_INDEX_PATH(self) -> Path:
+        return self.ARTIFACT_DIR / self.INTENTS_INDEX_FILENAME
+
+    @property
+    def RATE_LIMIT_DB_PATH(self) -> Path:
+        return self.LOG_DIR / self.RATE_LIMIT_DB_FILENAME
+
+    @property
+    def PROFILE_DIR(self) -> Path:
+        return self.LOG_DIR / self.PROFILE_DIRNAME
+
+    @property
+    def MODERATION_RULES_PATH(self) -> Path:
+        return self.DATA_DIR / self.MODERATION_RULES_FILENAME
+
     @validator("ALLOWED_ORIGINS", pre=True)
     def parse_origins(cls, v):
         """
@@ -96,13 +211,18 @@ ALLOWED_ORIGINS = settings.ALLOWED_ORIGINS
 MODEL_PATH = settings.MODEL_PATH
 VECTORIZER_PATH = settings.VECTORIZER_PATH
 INTENTS_PATH = settings.INTENTS_PATH
+INTENTS_INDEX_PATH = settings.INTENTS_INDEX_PATH
+COMPACT_DIR = settings.COMPACT_DIR
+NEAREST_DIR = settings.NEAREST_DIR
+MANIFEST_PATH = settings.MANIFEST_PATH
 MODERATION_MODE = settings.MODERATION_MODE
 LOG_DIR = settings.LOG_DIR
 PORT = settings.PORT
 HOST = settings.HOST
 DEBUG = settings.DEBUG
 
-# Ensure directories exist at import time
-os.makedirs(settings.ARTIFACT_DIR, exist_ok=True)
-os.makedirs(settings.DATA_DIR, exist_ok=True)
-os.makedirs(settings.LOG_DIR, exist_ok=True)
+def ensure_dirs():
+    """Create the artifact / data / log directories (idempotent)."""
+    os.makedirs(settings.ARTIFACT_DIR, exist_ok=True)
+    os.makedirs(settings.DATA_DIR, exist_ok=True)
+    os.makedirs(settings.LOG_DIR, exist_ok=True)
@@ -4,26 +4,123 @@ database.py
 SQLite database layer for Candy AI Clone chatbot.
 - Manages users, chat history, and intent analytics
 - Uses sqlite3 (no external dependency)
-- Creates schema automatically on first run
+- Persistent per-thread connections in WAL mode, read-only connections for analytics
+- Analytics read from per-intent x hour rollups kept up to date on every insert
+- iter_chats: constant-memory, resumable keyset export of chat history
+- label_chat / iter_labeled: reviewed intent labels, streamed to online_train.py
+- load_session / save_sessions: recent turns per user, behind sessions.SessionStore
+- Creates schema automatically on first use (not at import)
+- ChatLogWriter: write-behind batched logging for the request path
+- KnownUsers: Bloom filter + hot set in front of the users table; new ids are inserted in batches
 """
 
 import sqlite3
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Iterable, Iterator, Tuple
+import base64
+import bisect
+import math
+import os
+import queue
+import threading
 import time
 import json
 
 # -------- Paths --------
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / "logs" / "chatbot.db"
-DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
 # -------- Connection Helper --------
+# Applied to every connection. WAL lets readers run alongside the single writer;
+# synchronous=NORMAL is durable in WAL mode except for the last transactions on power loss.
+PRAGMAS = {
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -16000,  # negative = KiB, i.e. ~16 MB page cache per connection
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+STATEMENT_CACHE_SIZE = 256
+
+def _connect(path, readonly: bool = False) -> sqlite3.Connection:
+    if readonly:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+    else:
+        conn = sqlite3.connect(path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute("PRAGMA journal_mode=WAL")
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
 def get_conn():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    """A new tuned connection owned (and closed) by the caller."""
+    return _connect(DB_PATH)
+
+class ConnectionManager:
+    """
+    Persistent SQLite connections, one read-write and one read-only per thread.
+    - Reusing connections avoids reconnect cost and keeps each one's prepared-statement cache warm
+    - Analytics go through the read-only connection, so they never take the write lock
+    - Connections opened before a fork are discarded and reopened in the child
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open: List[sqlite3.Connection] = []
+
+    def _get(self, readonly: bool) -> sqlite3.Connection:
+        if self.path == DB_PATH:
+            ensure_schema()
+        attr = "reader" if readonly else "writer"
+        pid = os.getpid()
+        if getattr(self._local, "pid", None) != pid:
+            self._local.__dict__.clear()
+            self._local.pid = pid
+        conn = getattr(self._local, attr, None)
+        if conn is None:
+            conn = _connect(self.path, readonly=readonly)
+            setattr(self._local, attr, conn)
+            with self._lock:
+                self._open.append(conn)
+        return conn
+
+    def writer(self) -> sqlite3.Connection:
+        return self._get(readonly=False)
+
+    def reader(self) -> sqlite3.Connection:
+        return self._get(readonly=True)
+
+    def close_all(self):
+        with self._lock:
+            conns, self._open = self._open, []
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+DB = ConnectionManager(DB_PATH)
 
 # -------- Schema Init --------
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+def ensure_schema():
+    """Create the database and schema once per process, on first use."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            init_db()
+            _schema_ready = True
+
 def init_db():
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     conn = get_conn()
     cur = conn.cursor()
 
@@ -46,79 +143,681 @@ def init_db():
         allowed INTEGER,
         meta TEXT,
         ts INTEGER,
+        label TEXT,
+        labeled_at INTEGER,
         FOREIGN KEY(user_id) REFERENCES users(id)
     );
     """)
 
+    # label / labeled_at: reviewed intent for a chat; added in place on databases that predate them.
+    # labeled_at is a strictly increasing microsecond stamp (see label_chat), older rows hold seconds.
+    columns = {row[1] for row in cur.execute("PRAGMA table_info(chats);")}
+    for column, decl in (("label", "TEXT"), ("labeled_at", "INTEGER")):
+        if column not in columns:
+            cur.execute(f"ALTER TABLE chats ADD COLUMN {column} {decl};")
+
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chats_ts ON chats(ts);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chats_user_id ON chats(user_id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chats_intent ON chats(intent);")
+    # Partial index: only labeled rows, in the order online training consumes them.
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chats_labeled ON chats(labeled_at, id) WHERE label IS NOT NULL;")
+
+    # Rollups: one row per (time bucket, intent). intent '' = none (blocked / unknown).
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS chat_rollups (
+        bucket INTEGER NOT NULL,
+        intent TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        allowed INTEGER NOT NULL DEFAULT 0,
+        blocked INTEGER NOT NULL DEFAULT 0,
+        latency_count INTEGER NOT NULL DEFAULT 0,
+        latency_sum INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (bucket, intent)
+    ) WITHOUT ROWID;
+    """)
+
+    # Latency histogram per (bucket, intent); bin i counts latencies <= LATENCY_BINS_MS[i].
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS chat_latency_hist (
+        bucket INTEGER NOT NULL,
+        intent TEXT NOT NULL,
+        bin INTEGER NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (bucket, intent, bin)
+    ) WITHOUT ROWID;
+    """)
+
+    # Recent turns per user as JSON [[intent, response index], ...] (see sessions.py).
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS sessions (
+        user_id TEXT PRIMARY KEY,
+        turns TEXT NOT NULL,
+        updated_at INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    """)
+
     conn.commit()
     conn.close()
 
+# -------- Rollups --------
+ROLLUP_BUCKET_SECONDS = 3600
+# Upper edges (ms) of the latency histogram bins; one extra overflow bin follows.
+LATENCY_BINS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+UPSERT_ROLLUP_SQL = """
+    INSERT INTO chat_rollups (bucket, intent, count, allowed, blocked, latency_count, latency_sum)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(bucket, intent) DO UPDATE SET
+        count = count + excluded.count,
+        allowed = allowed + excluded.allowed,
+        blocked = blocked + excluded.blocked,
+        latency_count = latency_count + excluded.latency_count,
+        latency_sum = latency_sum + excluded.latency_sum
+"""
+UPSERT_HIST_SQL = """
+    INSERT INTO chat_latency_hist (bucket, intent, bin, count) VALUES (?, ?, ?, ?)
+    ON CONFLICT(bucket, intent, bin) DO UPDATE SET count = count + excluded.count
+"""
+
+def _fold_rollups(conn, rows: Iterable[tuple]):
+    """
+    Aggregate chat rows (INSERT_CHAT_SQL column order) in memory, then upsert
+    one row per touched (bucket, intent). Call inside the inserting transaction.
+    """
+    agg: Dict[Tuple[int, str], List[int]] = {}
+    hist: Dict[Tuple[int, str, int], int] = {}
+    for r in rows:
+        intent, latency, allowed, ts = r[3] or "", r[5], r[6], r[8]
+        key = (ts - ts % ROLLUP_BUCKET_SECONDS, intent)
+        a = agg.get(key)
+        if a is None:
+            a = agg[key] = [0, 0, 0, 0, 0]
+        a[0] += 1
+        a[1 if allowed else 2] += 1
+        if latency is not None:
+            a[3] += 1
+            a[4] += latency
+            hkey = key + (bisect.bisect_left(LATENCY_BINS_MS, latency),)
+            hist[hkey] = hist.get(hkey, 0) + 1
+    conn.executemany(UPSERT_ROLLUP_SQL, [k + tuple(v) for k, v in agg.items()])
+    conn.executemany(UPSERT_HIST_SQL, [k + (v,) for k, v in hist.items()])
+
+def rebuild_rollups(chunk_size: int = 50000) -> int:
+    """
+    Backfill rollups from the chats table (for databases created before rollups existed).
+    Rows are folded in id-ordered chunks, one transaction each, so the writer is never
+    blocked for long. Rows inserted while this runs are folded by their own insert.
+    """
+    conn = DB.writer()
+    with conn:
+        conn.execute("DELETE FROM chat_rollups")
+        conn.execute("DELETE FROM chat_latency_hist")
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM chats").fetchone()[0]
+
+    done, last_id = 0, 0
+    while last_id < max_id:
+        rows = conn.execute(
+            "SELECT id, NULL, NULL, intent, NULL, latency_ms, allowed, NULL, ts FROM chats "
+            "WHERE id > ? AND id <= ? ORDER BY id LIMIT ?", (last_id, max_id, chunk_size)
+        ).fetchall()
+        if not rows:
+            break
+        with conn:
+            _fold_rollups(conn, rows)
+        done += len(rows)
+        last_id = rows[-1][0]
+    return done
+
 # -------- User Ops --------
 def ensure_user(user_id: str):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("INSERT OR IGNORE INTO users (id, created_at) VALUES (?, ?)", (user_id, int(time.time())))
-    conn.commit()
-    conn.close()
+    conn = DB.writer()
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO users (id, created_at) VALUES (?, ?)", (user_id, int(time.time())))
+
+class KnownUsers:
+    """
+    Membership layer in front of the users table, so repeat users never touch SQLite.
+    - Bloom filter sized for `capacity` ids at `fp_rate`, preloaded from the users table
+      (in the background, after start()); memory is fixed at construction
+    - Hot set of recently seen ids (two generations of at most `hot_size` each)
+    - ensure() never touches SQLite: an id not in the hot set is queued, and a daemon thread
+      flushes the queue every `flush_interval` (ids queued while the preload runs are safe too)
+    - A Bloom "no" is definitely new and is inserted (INSERT OR IGNORE, one transaction)
+    - A Bloom "maybe" is usually a known user: the flush checks all of them in batched
+      read-only `id IN (...)` reads and inserts only the misses (false positives), so
+      repeat users never cost a write
+    Past `capacity` the false-positive rate rises, which only costs extra reads.
+    Start it after forking and close() on shutdown.
+    """
+
+    def __init__(self, db: "ConnectionManager", capacity: int = 1_000_000, fp_rate: float = 0.01,
+                 hot_size: int = 100_000, flush_interval: float = 0.5):
+        self.db = db
+        self.capacity = max(1, capacity)
+        self.n_bits = max(64, int(-self.capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.n_hashes = max(1, round(self.n_bits / self.capacity * math.log(2)))
+        self._bits = bytearray((self.n_bits + 7) // 8)
+        self.hot_size = hot_size
+        self._hot: set = set()
+        self._warm: set = set()  # previous hot generation
+        self.flush_interval = flush_interval  # new ids queued meanwhile go in one transaction
+        self._pending: List[str] = []  # Bloom "no"
+        self._pending_maybe: List[str] = []  # Bloom "maybe": usually already stored
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.added = 0  # ids in the filter
+        self.preloaded = 0
+        self.hot_hits = 0
+        self.filter_negatives = 0
+        self.filter_maybes = 0
+        self.false_positives = 0
+        self.inserted = 0
+        self.errors = 0
+
+    # ---- Bloom filter ----
+    def _positions(self, user_id: str) -> List[int]:
+        # Double hashing over the two halves of str's own 64-bit hash. It is salted per
+        # interpreter, which is fine: the filter is rebuilt (preloaded) in every process.
+        h = hash(user_id) & 0xFFFFFFFFFFFFFFFF
+        h1, h2, m = h & 0xFFFFFFFF, (h >> 32) | 1, self.n_bits
+        return [(h1 + i * h2) % m for i in range(self.n_hashes)]
+
+    def _maybe_contains(self, positions: List[int]) -> bool:
+        bits = self._bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def _add(self, positions: List[int]):
+        bits = self._bits
+        for p in positions:
+            bits[p >> 3] |= 1 << (p & 7)
+        self.added += 1
+
+    def _remember(self, user_id: str):
+        hot = self._hot
+        if len(hot) >= self.hot_size:
+            self._warm, self._hot = hot, set()
+        self._hot.add(user_id)
+
+    # ---- request path ----
+    def ensure(self, user_id: str):
+        """Make sure `user_id` exists in the users table (eventually); no SQLite on the caller's thread."""
+        if user_id in self._hot or user_id in self._warm:
+            self.hot_hits += 1
+            return
+        positions = self._positions(user_id)
+        with self._lock:
+            if self._maybe_contains(positions):
+                self.filter_maybes += 1
+                self._pending_maybe.append(user_id)
+            else:
+                self.filter_negatives += 1
+                self._add(positions)
+                self._pending.append(user_id)
+            self._remember(user_id)
+
+    # ---- background ----
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="known-users", daemon=True)
+        self._thread.start()
+
+    def preload(self, page_size: int = 10000) -> int:
+        """Add every id in the users table to the filter (keyset pages on the read-only connection)."""
+        last, n = "", 0
+        while not self._stop.is_set():
+            rows = self.db.reader().execute(
+                "SELECT id FROM users WHERE id > ? ORDER BY id LIMIT ?;", (last, page_size)
+            ).fetchall()
+            positions = [self._positions(r[0]) for r in rows]
+            with self._lock:
+                for pos in positions:
+                    self._add(pos)
+            n += len(rows)
+            if len(rows) < page_size:
+                break
+            last = rows[-1][0]
+        self.preloaded = n
+        return n
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+            maybe, self._pending_maybe = self._pending_maybe, []
+        if not batch and not maybe:
+            return
+        try:
+            missing = self._unknown(maybe)
+            self.false_positives += len(missing)
+            batch += missing
+            if not batch:
+                return
+            now = int(time.time())
+            conn = self.db.writer()
+            with conn:
+                conn.executemany("INSERT OR IGNORE INTO users (id, created_at) VALUES (?, ?);",
+                                 [(user_id, now) for user_id in batch])
+            self.inserted += len(batch)
+        except sqlite3.Error:
+            self.errors += 1
+
+    def _unknown(self, user_ids: List[str], chunk: int = 500) -> List[str]:
+        """The ids not in the users table, via batched reads on the read-only connection."""
+        user_ids = list(dict.fromkeys(user_ids))
+        found: set = set()
+        reader = self.db.reader()
+        for i in range(0, len(user_ids), chunk):
+            part = user_ids[i:i + chunk]
+            found.update(r[0] for r in reader.execute(
+                f"SELECT id FROM users WHERE id IN ({','.join('?' * len(part))});", part))
+        return [user_id for user_id in user_ids if user_id not in found]
+
+    def _run(self):
+        try:
+            self.preload()
+        except sqlite3.Error:
+            self.errors += 1
+        while not self._stop.wait(self.flush_interval):
+            if self._pending or self._pending_maybe:
+                self.flush()
+
+    def close(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        fill = self.added / self.capacity
+        return {
+            "running": self.running,
+            "filter_bytes": len(self._bits),
+            "hashes": self.n_hashes,
+            "ids": self.added,
+            "preloaded": self.preloaded,
+            # standard estimate (1 - e^(-k n / m))^k for the current fill
+            "fp_rate_estimate": (1 - math.exp(-self.n_hashes * self.added / self.n_bits)) ** self.n_hashes,
+            "capacity_used": round(fill, 4),
+            "hot": len(self._hot) + len(self._warm),
+            "hot_hits": self.hot_hits,
+            "filter_negatives": self.filter_negatives,
+            "filter_maybes": self.filter_maybes,
+            "false_positives": self.false_positives,
+            "pending": len(self._pending) + len(self._pending_maybe),
+            "inserted": self.inserted,
+            "errors": self.errors,
+        }
 
 # -------- Chat Logging --------
+INSERT_CHAT_SQL = """
+    INSERT INTO chats (user_id, message, reply, intent, confidence, latency_ms, allowed, meta, ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _chat_row(user_id, message, reply, intent, confidence, latency_ms, allowed, meta) -> tuple:
+    return (
+        user_id,
+        message,
+        reply,
+        intent,
+        confidence,
+        latency_ms,
+        int(allowed),
+        json.dumps(meta or {}, ensure_ascii=False),
+        int(time.time())
+    )
+
 def save_chat(
     user_id: Optional[str],
     message: str,
     reply: str,
     intent: Optional[str],
     confidence: Optional[float],
-    latency_ms: Optional[int],
+    latency_ms: Optional[float],
     allowed: bool,
     meta: Optional[Dict[str, Any]] = None
 ):
-    conn = get_conn()
-    cur = conn.cursor()
+    conn = DB.writer()
+    with conn:
+        row = _chat_row(user_id, message, reply, intent, confidence, latency_ms, allowed, meta)
+        conn.execute(INSERT_CHAT_SQL, row)
+        _fold_rollups(conn, [row])
 
-    meta_json = json.dumps(meta or {}, ensure_ascii=False)
+class ChatLogWriter:
+    """
+    Write-behind logger for the chats table.
+    - submit() only builds the row and does a non-blocking queue put
+    - a daemon thread drains the queue and inserts with executemany,
+      one transaction per batch (flushed when `batch_size` rows are waiting
+      or `flush_interval` seconds after the first row of a batch)
+    - a full queue drops the row and counts it instead of blocking the caller
+    Start it after forking (threads do not survive fork) and close() on shutdown.
+    """
 
-    cur.execute("""
-        INSERT INTO chats (user_id, message, reply, intent, confidence, latency_ms, allowed, meta, ts)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        user_id,
-        message,
-        reply,
-        intent,
-        confidence,
-        latency_ms,
-        int(allowed),
-        meta_json,
-        int(time.time())
-    ))
+    def __init__(self, max_queue: int = 10000, batch_size: int = 256, flush_interval: float = 0.5):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self.high_water = 0
 
-    conn.commit()
-    conn.close()
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="chat-log-writer", daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        user_id: Optional[str],
+        message: str,
+        reply: str,
+        intent: Optional[str],
+        confidence: Optional[float],
+        latency_ms: Optional[float],
+        allowed: bool,
+        meta: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """Queue one chat row; returns False if it was dropped because the queue is full."""
+        # meta is serialized on the writer thread, not here.
+        row = (user_id, message, reply, intent, confidence, latency_ms, int(allowed), meta, int(time.time()))
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        depth = self._queue.qsize()
+        if depth > self.high_water:
+            self.high_water = depth
+        return True
+
+    def _next_batch(self) -> List[tuple]:
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                # Past the deadline (or shutting down): take only what is already queued.
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, conn, batch: List[tuple]):
+        rows = [r[:7] + (json.dumps(r[7] or {}, ensure_ascii=False), r[8]) for r in batch]
+        try:
+            with conn:  # one transaction (one fsync) per batch
+                conn.executemany(INSERT_CHAT_SQL, rows)
+                _fold_rollups(conn, rows)
+            self.written += len(batch)
+            self.batches += 1
+        except sqlite3.Error:
+            self.errors += 1
+
+    def _run(self):
+        conn = DB.writer()
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write(conn, batch)
+
+    def close(self, timeout: float = 5.0):
+        """Flush everything queued so far and stop the writer thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "high_water": self.high_water,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
 
 # -------- Analytics --------
-def count_chats_per_intent() -> Dict[str, int]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT intent, COUNT(*) FROM chats GROUP BY intent;")
-    rows = cur.fetchall()
-    conn.close()
+# Read-only connection: analytics never block (or get blocked by) the log writer.
+# Everything except recent_chats reads the rollups, so cost is O(buckets), not O(rows).
+# Time windows are bucket-aligned: [since, until) is widened to whole ROLLUP_BUCKET_SECONDS.
+def _window(since: Optional[int], until: Optional[int], intent: Optional[str] = None) -> Tuple[str, list]:
+    clauses, params = [], []
+    if since is not None:
+        clauses.append("bucket >= ?")
+        params.append(since - since % ROLLUP_BUCKET_SECONDS)
+    if until is not None:
+        clauses.append("bucket < ?")
+        params.append(until)
+    if intent is not None:
+        clauses.append("intent = ?")
+        params.append("" if intent == "unknown" else intent)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def count_chats_per_intent(since: Optional[int] = None, until: Optional[int] = None) -> Dict[str, int]:
+    where, params = _window(since, until)
+    rows = DB.reader().execute(f"SELECT intent, SUM(count) FROM chat_rollups{where} GROUP BY intent;", params).fetchall()
     return {intent or "unknown": count for intent, count in rows}
 
-def avg_latency() -> float:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT AVG(latency_ms) FROM chats WHERE latency_ms IS NOT NULL;")
-    result = cur.fetchone()[0]
-    conn.close()
-    return float(result) if result is not None else 0.0
+def avg_latency(since: Optional[int] = None, until: Optional[int] = None, intent: Optional[str] = None) -> float:
+    where, params = _window(since, until, intent)
+    total, n = DB.reader().execute(
+        f"SELECT SUM(latency_sum), SUM(latency_count) FROM chat_rollups{where};", params
+    ).fetchone()
+    return float(total) / n if n else 0.0
+
+def latency_percentiles(
+    percentiles: Iterable[float] = (50, 95, 99),
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    intent: Optional[str] = None
+) -> Dict[str, float]:
+    """
+    Percentiles from the latency histogram, reported as the upper edge of the bin
+    that contains them (the overflow bin reports the last edge).
+    """
+    where, params = _window(since, until, intent)
+    rows = DB.reader().execute(
+        f"SELECT bin, SUM(count) FROM chat_latency_hist{where} GROUP BY bin ORDER BY bin;", params
+    ).fetchall()
+    counts = [0] * (len(LATENCY_BINS_MS) + 1)
+    for b, c in rows:
+        counts[b] = c
+    total = sum(counts)
+    out = {}
+    for p in percentiles:
+        if not total:
+            out[f"p{p:g}"] = 0.0
+            continue
+        target, seen = total * p / 100.0, 0
+        for b, c in enumerate(counts):
+            seen += c
+            if seen >= target:
+                out[f"p{p:g}"] = float(LATENCY_BINS_MS[min(b, len(LATENCY_BINS_MS) - 1)])
+                break
+    return out
+
+def window_stats(since: Optional[int] = None, until: Optional[int] = None) -> Dict[str, Any]:
+    """Totals, allowed/blocked split, average and percentile latency for a time window."""
+    where, params = _window(since, until)
+    count, allowed, blocked, lat_n, lat_sum = DB.reader().execute(
+        f"SELECT SUM(count), SUM(allowed), SUM(blocked), SUM(latency_count), SUM(latency_sum) "
+        f"FROM chat_rollups{where};", params
+    ).fetchone()
+    return {
+        "count": count or 0,
+        "allowed": allowed or 0,
+        "blocked": blocked or 0,
+        "avg_latency_ms": float(lat_sum) / lat_n if lat_n else 0.0,
+        "latency_ms": latency_percentiles(since=since, until=until),
+        "per_intent": count_chats_per_intent(since, until),
+    }
 
 def recent_chats(limit: int = 10):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT user_id, message, reply, intent, ts FROM chats ORDER BY ts DESC LIMIT ?", (limit,))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    cur = DB.reader().execute("SELECT user_id, message, reply, intent, ts FROM chats ORDER BY ts DESC LIMIT ?", (limit,))
+    return cur.fetchall()
+
+# -------- Export --------
+EXPORT_COLUMNS = ("id", "user_id", "message", "reply", "intent", "confidence", "latency_ms", "allowed", "meta", "ts")
+
+def encode_cursor(ts: int, chat_id: int) -> str:
+    """Opaque resume token for the (ts, id) keyset position of a row."""
+    return base64.urlsafe_b64encode(f"{ts}:{chat_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(token: str) -> Tuple[int, int]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        ts, chat_id = raw.split(":")
+        return int(ts), int(chat_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"invalid cursor: {token!r}") from e
+
+def iter_chats(
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    intent: Optional[str] = None,
+    user_id: Optional[str] = None,
+    allowed: Optional[bool] = None,
+    after: Optional[Tuple[int, int]] = None,
+    page_size: int = 1000
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield chat rows ordered by (ts, id), optionally filtered, starting after the `after` position.
+    Keyset pagination: each page is its own short read on the read-only connection
+    (no OFFSET scans, no long-lived cursor holding a snapshot), so memory and lock
+    time stay constant no matter how large the table is.
+    """
+    clauses, params = [], []
+    if since is not None:
+        clauses.append("ts >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("ts < ?")
+        params.append(until)
+    if intent is not None:
+        clauses.append("intent IS NULL" if intent == "unknown" else "intent = ?")
+        if intent != "unknown":
+            params.append(intent)
+    if user_id is not None:
+        clauses.append("user_id = ?")
+        params.append(user_id)
+    if allowed is not None:
+        clauses.append("allowed = ?")
+        params.append(int(allowed))
+
+    sql = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM chats WHERE "
+    while True:
+        where = clauses + (["(ts, id) > (?, ?)"] if after else [])
+        page_params = params + (list(after) if after else [])
+        query = sql + (" AND ".join(where) or "1") + " ORDER BY ts, id LIMIT ?"
+        rows = DB.reader().execute(query, page_params + [page_size]).fetchall()
+        for row in rows:
+            item = dict(zip(EXPORT_COLUMNS, row))
+            item["allowed"] = bool(item["allowed"])
+            item["meta"] = json.loads(item["meta"]) if item["meta"] else {}
+            yield item
+        if len(rows) < page_size:
+            return
+        after = (rows[-1][-1], rows[-1][0])
+
+# -------- Labels (online training) --------
+LABEL_CHAT_SQL = """
+    UPDATE chats SET label = ?1, labeled_at = MAX(
+        ?2, (SELECT COALESCE(MAX(labeled_at), 0) + 1 FROM chats WHERE label IS NOT NULL)
+    ) WHERE id = ?3;
+"""
+
+def label_chat(chat_id: int, label: str) -> bool:
+    """
+    Record the reviewed intent for a chat; relabeling moves it to the end of the label stream.
+    labeled_at is the time in microseconds, bumped past every existing value inside the
+    write, so each label sorts after any (labeled_at, id) cursor already read, whatever its id.
+    """
+    conn = DB.writer()
+    with conn:
+        cur = conn.execute(LABEL_CHAT_SQL, (label, time.time_ns() // 1000, chat_id))
+    return cur.rowcount > 0
+
+def iter_labeled(
+    after: Optional[Tuple[int, int]] = None, page_size: int = 1000
+) -> Iterator[List[Tuple[int, int, str, str]]]:
+    """
+    Yield pages of (labeled_at, id, message, label) for labeled chats after the `after`
+    position, in labeling order. Uses idx_chats_labeled, so the cost depends on the
+    number of rows after the cursor, not on the size of the table.
+    """
+    sql = (
+        "SELECT labeled_at, id, message, label FROM chats "
+        "WHERE label IS NOT NULL AND (labeled_at, id) > (?, ?) ORDER BY labeled_at, id LIMIT ?;"
+    )
+    after = after or (-1, -1)
+    while True:
+        rows = DB.reader().execute(sql, (after[0], after[1], page_size)).fetchall()
+        if rows:
+            yield rows
+            after = (rows[-1][0], rows[-1][1])
+        if len(rows) < page_size:
+            return
+
+# -------- Sessions --------
+def load_session(user_id: str) -> Optional[List[List[Any]]]:
+    row = DB.reader().execute("SELECT turns FROM sessions WHERE user_id = ?;", (user_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def save_sessions(sessions: List[Tuple[str, List[Tuple[str, int]]]]):
+    """Upsert (user_id, turns) pairs in one transaction."""
+    now = int(time.time())
+    conn = DB.writer()
+    with conn:
+        conn.executemany(
+            "INSERT INTO sessions (user_id, turns, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET turns = excluded.turns, updated_at = excluded.updated_at;",
+            [(user_id, json.dumps(turns, ensure_ascii=False), now) for user_id, turns in sessions],
+        )
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Candy AI Clone database maintenance")
+    parser.add_argument("command", choices=["backfill", "stats"],
+                        help="backfill: rebuild rollups from chats; stats: print rollup stats")
+    args = parser.parse_args()
 
-# -------- Initialize on import --------
-init_db()
+    if args.command == "backfill":
+        start = time.perf_counter()
+        n = rebuild_rollups()
+        print(f"[INFO] Folded {n} chats into rollups in {time.perf_counter() - start:.1f}s")
+    else:
+        print(json.dumps(window_stats(), indent=2))
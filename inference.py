@@ -0,0 +1,438 @@
+"""
+inference.py
+Inference bundle for Candy AI Clone chatbot.
+- Loads model + vectorizer + intents into one object
+- Accepts either a full sklearn Pipeline (what train.py saves) or a bare estimator + vectorizer
+- Or the compact NumPy artifact (scorer.py), which needs no sklearn import at all
+- One transform + one predict_proba per call; tag/confidence come from a single argmax
+- Class index -> responses is a plain list lookup (no per-request scan of intents); responses
+  come from the compiled intents index (intents_index.py), {{meta}} variables pre-rendered
+- Below `confidence_threshold`, the reply comes from the nearest intents pattern
+  (nearest.py) when one is similar enough, else the fallback reply (intent None)
+- ArtifactManager: background load + smoke test + single-reference swap, rollback, file watch
+- read_manifest() / write_manifest(): which trainer published the serving artifacts and when
+- numpy / scorer / nearest / sklearn are imported when the first bundle is built, not with this module
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from intents_index import IntentIndex, Template, load_source, render, source_files, source_version
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from nearest import NearestIndex
+
+FALLBACK_REPLY = "I'm not sure I understood that. Could you rephrase?"
+
+
+class InferenceBundle:
+    """
+    Everything needed to answer a message, resolved once at load time.
+    `responses[i]` holds the responses for `classes[i]`, aligned with the estimator's classes_.
+    Without a prebuilt `index`, one is compiled from `intents` (classes lacking responses get the fallback).
+    """
+
+    def __init__(self, model, vectorizer, intents: Dict[str, Any], index: Optional[IntentIndex] = None):
+        import numpy as np
+        from scorer import CompactScorer
+
+        if isinstance(model, CompactScorer):
+            # NumPy scorer: vectorize() is its features(), scored with score_features().
+            self.transformer = None
+            self.estimator = model
+            self.is_pipeline = False
+        elif hasattr(model, "steps"):
+            # Full Pipeline: run every step but the last as the transformer,
+            # so the input is vectorized exactly once.
+            self.transformer = model[:-1]
+            self.estimator = model.steps[-1][1]
+            self.is_pipeline = True
+        else:
+            if vectorizer is None:
+                raise RuntimeError("Bare estimator artifact needs a separate vectorizer.")
+            self.transformer = vectorizer
+            self.estimator = model
+            self.is_pipeline = False
+
+        self.intents = intents
+        self.classes = np.asarray(self.estimator.classes_)
+        names = [str(c) for c in self.classes]
+        if index is None:
+            index = IntentIndex.compile(intents, names, strict=False)
+        elif index.classes != names:
+            raise RuntimeError("Intents index was built for other model classes; rebuild it (python intents_index.py)")
+        self.responses: List[List[Template]] = [r or [FALLBACK_REPLY] for r in index.responses]
+        self.personalized = index.personalized  # some responses need a per-user context
+        self._index = {str(tag): k for k, tag in enumerate(self.classes)}
+        # Set by the loader before the bundle is published; treat as read-only afterwards.
+        self.generation = 0  # keys reply-cache entries to this bundle
+        self.version: Optional[str] = None  # content hash of the artifact files
+        self.loaded_at: Optional[float] = None
+        # Low-confidence fallback (see set_fallback); off until configured.
+        self.confidence_threshold = 0.0
+        self.min_similarity = 0.0
+        self.nearest: Optional["NearestIndex"] = None
+
+        proba = getattr(self.estimator, "predict_proba", None)
+        self._proba = proba if callable(proba) else None
+
+    def set_fallback(self, confidence_threshold: float, nearest: Optional["NearestIndex"] = None,
+                     min_similarity: float = 0.0):
+        """
+        Answer messages classified below `confidence_threshold` from the nearest pattern
+        (at least `min_similarity` cosine), or with the fallback reply. Models without
+        predict_proba have no confidence and are never thresholded.
+        """
+        if nearest is not None and nearest.n_features != self.n_features:
+            print(f"[WARN] Nearest-pattern index has {nearest.n_features} features, the model "
+                  f"{self.n_features}; retrain to rebuild it. Low-confidence messages get the fallback reply.")
+            nearest = None
+        self.confidence_threshold = confidence_threshold
+        self.nearest = nearest
+        self.min_similarity = min_similarity
+
+    @property
+    def n_features(self) -> int:
+        if self.transformer is None:
+            return self.estimator.n_features
+        return self.transformer.transform([""]).shape[1]
+
+    def vectorize(self, messages: List[str]):
+        """The model's feature vectors: a sparse matrix, or (n, row, col, weight) for the compact scorer."""
+        if self.transformer is None:
+            return self.estimator.features(messages)
+        return self.transformer.transform(messages)
+
+    def query_vectors(self, features, rows: Optional[List[int]] = None) -> Tuple[int, "np.ndarray", "np.ndarray", "np.ndarray"]:
+        """
+        (n_rows, row, col, weight) of vectorize() output, optionally only `rows` (ascending;
+        renumbered from 0), in the nearest index's columns.
+        """
+        if self.transformer is not None:
+            X = (features if rows is None else features[rows]).tocoo()
+            return X.shape[0], X.row, X.col, X.data
+        n, row, col, weight = features
+        if rows is None:
+            return n, row, col, weight
+        import numpy as np
+
+        wanted = np.asarray(rows, dtype=np.int64)
+        keep = np.isin(row, wanted)
+        return len(wanted), np.searchsorted(wanted, row[keep]), col[keep], weight[keep]
+
+    def score(self, messages: List[str], timings: Optional[Dict[str, int]] = None) -> Tuple["np.ndarray", Optional["np.ndarray"]]:
+        """
+        Return (class indices, confidences) for a list of messages.
+        Confidence is None when the estimator has no predict_proba (e.g. LinearSVC).
+        If `timings` is given, nanoseconds spent in "vectorize" and "predict" are added to it.
+        """
+        idx, conf, _ = self._score(messages, timings)
+        return idx, conf
+
+    def _score(self, messages: List[str], timings: Optional[Dict[str, int]] = None):
+        """score() plus the vectorize() output it was computed from (reused by the fallback)."""
+        t0 = time.perf_counter_ns()
+        X = self.vectorize(messages)
+        t1 = time.perf_counter_ns()
+        if timings is not None:
+            timings["vectorize"] = timings.get("vectorize", 0) + (t1 - t0)
+        if self.transformer is None:
+            idx, conf = self.estimator.score_features(X, timings)
+            return idx, conf, X
+        if self._proba is not None:
+            P = self._proba(X)
+            idx = P.argmax(axis=1)
+            out = idx, P.max(axis=1)
+        else:
+            D = self.estimator.decision_function(X)
+            out = ((D > 0).astype(int) if D.ndim == 1 else D.argmax(axis=1)), None
+        if timings is not None:
+            timings["predict"] = timings.get("predict", 0) + (time.perf_counter_ns() - t1)
+        return out + (X,)
+
+    def response_count(self, intent: str) -> int:
+        k = self._index.get(intent)
+        return len(self.responses[k]) if k is not None else 1
+
+    def respond(self, intent: str, confidence: Optional[float],
+                context: Optional[Dict[str, Any]] = None, choice: int = 0,
+                meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Render the reply for an already-classified message (also used on cache hits).
+        `context` fills per-user placeholders such as {{name}}; `choice` picks among the
+        intent's responses (wrapping around); `meta` is passed through (see classify).
+        """
+        k = self._index.get(intent)
+        if k is None:
+            reply = FALLBACK_REPLY
+        else:
+            options = self.responses[k]
+            reply = render(options[choice % len(options)], context)
+        return {"reply": reply, "intent": intent, "confidence": confidence, "meta": meta}
+
+    def _fallback(self, features, rows: List[int]) -> List[Optional[Tuple[str, float]]]:
+        """Nearest pattern for `rows` of already vectorized messages (no second transform)."""
+        if self.nearest is None:
+            return [None] * len(rows)
+        return self.nearest.nearest(*self.query_vectors(features, rows), min_similarity=self.min_similarity)
+
+    def classify(self, messages: List[str], timings: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+        """
+        Classify and render. `confidence` is always the model's probability. Below
+        confidence_threshold, intent is the nearest pattern's intent with
+        meta = {"source": "nearest", "similarity": cosine}, or None with
+        meta = {"source": "fallback"} when no pattern is close enough (fallback reply).
+        """
+        idx, conf, features = self._score(messages, timings)
+        intents: List[Optional[str]] = [str(self.classes[k]) for k in idx]
+        confidences = [float(c) for c in conf] if conf is not None else [None] * len(intents)
+        metas: List[Optional[Dict[str, Any]]] = [None] * len(intents)
+        if conf is not None and self.confidence_threshold > 0:
+            low = [row for row, c in enumerate(confidences) if c < self.confidence_threshold]
+            if low:
+                t0 = time.perf_counter_ns()
+                for row, hit in zip(low, self._fallback(features, low)):
+                    if hit is None:
+                        intents[row], metas[row] = None, {"source": "fallback"}
+                    else:
+                        intents[row] = hit[0]
+                        metas[row] = {"source": "nearest", "similarity": hit[1]}
+                if timings is not None:
+                    timings["fallback"] = timings.get("fallback", 0) + (time.perf_counter_ns() - t0)
+        t0 = time.perf_counter_ns()
+        results = [self.respond(intent, c, meta=m) for intent, c, m in zip(intents, confidences, metas)]
+        if timings is not None:
+            timings["respond"] = timings.get("respond", 0) + (time.perf_counter_ns() - t0)
+        return results
+
+    def smoke_test(self):
+        """Fail loudly before a freshly loaded bundle can go live."""
+        messages = ["hello", "how much does it cost"]
+        idx, _ = self.score(messages)
+        results = self.classify(messages)  # also runs the fallback path when configured
+        if len(idx) != 2 or len(results) != 2 or any(not 0 <= k < len(self.classes) for k in idx):
+            raise RuntimeError("smoke prediction returned unexpected output")
+
+
+def read_manifest(path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(path, source: str, version: Optional[int] = None) -> Dict[str, Any]:
+    """Record who published the serving artifacts; written last, after every artifact is in place."""
+    manifest = {"source": source, "version": version, "published_at": time.time()}
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+    return manifest
+
+
+def artifact_files(model_path, vectorizer_path, intents_path, compact_dir=None, index_path=None,
+                   nearest_dir=None) -> List[Path]:
+    """The files a bundle is built from (used for versioning and file watching)."""
+    if compact_dir is not None:
+        files = sorted(Path(compact_dir).glob("*"))
+    else:
+        files = [Path(model_path), Path(vectorizer_path)]
+    files += source_files(intents_path)
+    if index_path is not None:
+        files.append(Path(index_path))
+    if nearest_dir is not None:
+        files += sorted(Path(nearest_dir).glob("*"))
+    return [f for f in files if f.is_file()]
+
+
+def artifact_version(files: List[Path]) -> str:
+    """Short content hash identifying one set of artifact files."""
+    h = hashlib.sha256()
+    for f in files:
+        h.update(f.name.encode())
+        with open(f, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+def load_intents(intents_path, index_path=None) -> Tuple[Dict[str, Any], Optional[IntentIndex]]:
+    """
+    The compiled index when `index_path` holds one built from the current intents source
+    (then `intents` carries only its meta); otherwise the parsed source and no index.
+    """
+    if index_path is not None and os.path.exists(index_path):
+        index = IntentIndex.load(index_path)
+        if index.source == source_version(intents_path):
+            return {"meta": index.meta}, index
+        print("[WARN] Intents index is older than the intents source; compiling in memory "
+              "(rebuild with python intents_index.py)")
+    return load_source(intents_path), None
+
+
+def load_bundle(model_path, vectorizer_path, intents_path, compact_dir=None, index_path=None,
+                nearest_dir=None, confidence_threshold: float = 0.0, min_similarity: float = 0.0,
+                max_postings: int = 0) -> InferenceBundle:
+    """
+    Load artifacts from disk; the vectorizer file is only required for bare estimators.
+    With `compact_dir`, the memory-mapped NumPy artifact is used instead of the pickles.
+    With `index_path`, responses come from the compiled intents index when it is current.
+    With `confidence_threshold`, low-confidence messages fall back to the nearest-pattern
+    index in `nearest_dir` (when there is one) or to the fallback reply.
+    """
+    bundle = _load_model(model_path, vectorizer_path, intents_path, compact_dir, index_path)
+    nearest = None
+    if confidence_threshold > 0 and nearest_dir is not None:
+        from nearest import NearestIndex
+
+        if NearestIndex.exists(nearest_dir):
+            nearest = NearestIndex(nearest_dir, max_postings=max_postings)
+        else:
+            print(f"[WARN] No nearest-pattern index in {nearest_dir}; low-confidence messages get the fallback reply")
+    bundle.set_fallback(confidence_threshold, nearest, min_similarity)
+    return bundle
+
+
+def _load_model(model_path, vectorizer_path, intents_path, compact_dir=None, index_path=None) -> InferenceBundle:
+    intents, index = load_intents(intents_path, index_path)
+    if compact_dir is not None:
+        from scorer import CompactScorer
+
+        if not CompactScorer.exists(compact_dir):
+            raise RuntimeError(f"Compact artifact not found in {compact_dir}. Train first (see train.py).")
+        return InferenceBundle(CompactScorer(compact_dir), None, intents, index)
+
+    import joblib  # unpickling pulls in sklearn; only paid on this path
+    if not os.path.exists(model_path):
+        raise RuntimeError("Model not found. Train first (see train.py).")
+    model = joblib.load(model_path)
+    vectorizer = None
+    if not hasattr(model, "steps"):
+        if not os.path.exists(vectorizer_path):
+            raise RuntimeError("Vectorizer not found. Train first (see train.py).")
+        vectorizer = joblib.load(vectorizer_path)
+    return InferenceBundle(model, vectorizer, intents, index)
+
+
+class ArtifactManager:
+    """
+    Owns the live InferenceBundle.
+    - reload(): build a new bundle with `loader`, smoke-test it, then publish it by
+      rebinding one attribute; readers grab `manager.current` once per request, so
+      they never see a new model paired with an old vectorizer or intents
+    - rollback(): put the previously live bundle back
+    - watch(): poll the artifact files and reload when they change (and settle)
+    `before_publish(bundle)` runs on a bundle that is about to go live (e.g. to stamp
+    its cache generation). Loads are serialized; a failed load leaves the live bundle alone.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], InferenceBundle],
+        files: Callable[[], List[Path]],
+        before_publish: Optional[Callable[[InferenceBundle], None]] = None,
+    ):
+        self._loader = loader
+        self._files = files
+        self._before_publish = before_publish
+        self._lock = threading.Lock()
+        self._watch_stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self.current: Optional[InferenceBundle] = None
+        self.previous: Optional[InferenceBundle] = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def _publish(self, bundle: InferenceBundle):
+        if self._before_publish is not None:
+            self._before_publish(bundle)
+        self.previous, self.current = self.current, bundle
+
+    def reload(self) -> InferenceBundle:
+        with self._lock:
+            try:
+                files = self._files()
+                version = artifact_version(files)
+                bundle = self._loader()
+                bundle.smoke_test()
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                raise
+            bundle.version = version
+            bundle.loaded_at = time.time()
+            self._publish(bundle)
+            self.reloads += 1
+            self.last_error = None
+            return bundle
+
+    def rollback(self) -> InferenceBundle:
+        with self._lock:
+            if self.previous is None:
+                raise RuntimeError("no previous bundle to roll back to")
+            self._publish(self.previous)
+            return self.current
+
+    # ---- file watch ----
+    def _signature(self) -> Tuple:
+        sig = []
+        for f in self._files():
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            sig.append((str(f), st.st_mtime_ns, st.st_size))
+        return tuple(sig)
+
+    def _watch(self, interval: float):
+        seen = self._signature()
+        pending = None
+        while not self._watch_stop.wait(interval):
+            sig = self._signature()
+            if sig == seen:
+                pending = None
+                continue
+            if sig != pending:
+                pending = sig  # changed: wait one more interval for writers to finish
+                continue
+            try:
+                bundle = self.reload()
+                print(f"[INFO] Artifacts changed on disk; now serving version {bundle.version}")
+            except Exception as e:
+                print(f"[WARN] Artifact reload after file change failed, keeping current bundle: {e}")
+            seen, pending = sig, None
+
+    def watch(self, interval: float = 2.0):
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._watch_stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="artifact-watch", daemon=True)
+        self._watcher.start()
+
+    def stop_watch(self):
+        self._watch_stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+        self._watcher = None
+
+    def info(self) -> Dict[str, Any]:
+        def describe(b: Optional[InferenceBundle]):
+            return None if b is None else {"version": b.version, "loaded_at": b.loaded_at, "generation": b.generation}
+        return {
+            "current": describe(self.current),
+            "previous": describe(self.previous),
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "watching": self._watcher is not None and self._watcher.is_alive(),
+        }
@@ -0,0 +1,177 @@
+"""
+intents_index.py
+Compiled intents index for Candy AI Clone chatbot.
+- Reads INTENTS_PATH: one intents.json, or a directory of *.json shards (e.g. one per
+  language) merged in name order; shards may add patterns/responses to the same tag
+- Responses are pre-rendered with the `meta` variables ({{brand}}, ...) once, at build time
+- Placeholders meta doesn't define are per-user ({{name}}, {{user_id}}, ...): such responses
+  are pre-split into (text, name, text, ...) segments, filled per request by render()
+- Tag ids are aligned with the model's classes_; building fails if any class has no responses
+- Saved as one pickle of plain lists/strings (ARTIFACT_DIR/intents.idx) that loads in one
+  C-level unpickle; the source files' content hash is stored to detect a stale index
+
+Usage (train.py and online_train.py run it after saving a model):
+    python intents_index.py    # rebuild the index for the current model + intents
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+INDEX_VERSION = 1
+PLACEHOLDER_RE = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+# A response is either fully rendered text or (text, name, text, ..., text) segments.
+Template = Union[str, Tuple[str, ...]]
+
+
+# -------------------------
+# Source (intents.json or shards)
+# -------------------------
+def source_files(path) -> List[Path]:
+    path = Path(path)
+    if path.is_dir():
+        return sorted(p for p in path.glob("*.json") if p.is_file())
+    return [path] if path.is_file() else []
+
+
+def source_version(path) -> str:
+    """Content hash of the intents source (all shards)."""
+    h = hashlib.sha256()
+    for f in source_files(path):
+        h.update(f.name.encode())
+        h.update(f.read_bytes())
+    return h.hexdigest()[:12]
+
+
+def load_source(path) -> Dict[str, Any]:
+    """intents.json, or the merge of a shard directory: meta keys and per-tag lists combined."""
+    files = source_files(path)
+    if not files:
+        raise RuntimeError(f"No intents found at {path}")
+    meta: Dict[str, Any] = {}
+    by_tag: Dict[str, Dict[str, Any]] = {}
+    for f in files:
+        with open(f, "r", encoding="utf-8") as fh:
+            shard = json.load(fh)
+        meta.update(shard.get("meta") or {})
+        for intent in shard.get("intents", []):
+            merged = by_tag.setdefault(intent["tag"], {"tag": intent["tag"], "patterns": [], "responses": []})
+            merged["patterns"].extend(intent.get("patterns") or [])
+            merged["responses"].extend(intent.get("responses") or [])
+    return {"meta": meta, "intents": list(by_tag.values())}
+
+
+# -------------------------
+# Templates
+# -------------------------
+def compile_template(text: str, variables: Mapping[str, Any]) -> Template:
+    """Substitute `variables` now; return the remaining placeholders as segments (or plain text)."""
+    text = PLACEHOLDER_RE.sub(lambda m: str(variables[m.group(1)]) if m.group(1) in variables else m.group(0), text)
+    parts = PLACEHOLDER_RE.split(text)  # odd positions are placeholder names
+    return text if len(parts) == 1 else tuple(parts)
+
+
+def render(template: Template, context: Optional[Mapping[str, Any]] = None) -> str:
+    """Fill per-user segments from `context`; missing values render as empty text."""
+    if isinstance(template, str):
+        return template
+    parts = list(template)
+    for i in range(1, len(parts), 2):
+        value = context.get(parts[i]) if context else None
+        parts[i] = "" if value is None else str(value)
+    return "".join(parts)
+
+
+# -------------------------
+# Index
+# -------------------------
+class IntentIndex:
+    """Responses per model class: `responses[k]` belongs to `classes[k]`."""
+
+    def __init__(self, classes: Sequence[str], responses: List[List[Template]], meta: Dict[str, Any],
+                 source: Optional[str] = None):
+        self.classes = [str(c) for c in classes]
+        self.responses = responses
+        self.meta = meta
+        self.source = source  # source_version() of the intents it was built from
+        self.personalized = any(not isinstance(t, str) for rs in responses for t in rs)
+
+    @classmethod
+    def compile(cls, intents: Dict[str, Any], classes: Sequence[str], strict: bool = True,
+                source: Optional[str] = None) -> "IntentIndex":
+        """
+        Align intents with `classes`. With `strict`, a class without responses raises
+        ValueError; otherwise it is left empty for the caller to fill with a fallback.
+        """
+        meta = intents.get("meta") or {}
+        variables = {k: v for k, v in meta.items() if isinstance(v, (str, int, float))}
+        by_tag: Dict[str, List[str]] = {}
+        for intent in intents.get("intents", []):
+            by_tag.setdefault(str(intent["tag"]), []).extend(intent.get("responses") or [])
+
+        missing = [str(c) for c in classes if not by_tag.get(str(c))]
+        if missing and strict:
+            raise ValueError(f"Model classes without responses in intents: {', '.join(missing)}")
+        responses = [[compile_template(r, variables) for r in by_tag.get(str(c), [])] for c in classes]
+        return cls(classes, responses, meta, source)
+
+    def save(self, path) -> Path:
+        path = Path(path)
+        payload = {
+            "version": INDEX_VERSION,
+            "source": self.source,
+            "meta": self.meta,
+            "classes": self.classes,
+            "responses": self.responses,
+        }
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path) -> "IntentIndex":
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+        if payload.get("version") != INDEX_VERSION:
+            raise RuntimeError(f"Unsupported intents index version: {payload.get('version')}")
+        return cls(payload["classes"], payload["responses"], payload["meta"], payload["source"])
+
+
+def model_classes(model_path, compact_dir=None) -> List[str]:
+    """Classes of the trained model, from the compact export's meta.json when there is one."""
+    meta_path = Path(compact_dir) / "meta.json" if compact_dir is not None else None
+    if meta_path is not None and meta_path.exists():
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)["classes"]
+    import joblib
+    model = joblib.load(model_path)
+    estimator = model.steps[-1][1] if hasattr(model, "steps") else model
+    return [str(c) for c in estimator.classes_]
+
+
+def build_index(intents_path, classes: Sequence[str], out_path) -> IntentIndex:
+    """Compile intents (file or shard directory) for `classes` and save; raises on missing responses."""
+    index = IntentIndex.compile(load_source(intents_path), classes, source=source_version(intents_path))
+    index.save(out_path)
+    return index
+
+
+def main():
+    from config import COMPACT_DIR, INTENTS_INDEX_PATH, INTENTS_PATH, MODEL_PATH
+
+    classes = model_classes(MODEL_PATH, COMPACT_DIR)
+    index = build_index(INTENTS_PATH, classes, INTENTS_INDEX_PATH)
+    n = sum(len(r) for r in index.responses)
+    print(f"[INFO] Intents index: {len(classes)} classes, {n} responses "
+          f"({'with' if index.personalized else 'no'} per-user placeholders) → {INTENTS_INDEX_PATH}")
+
+
+if __name__ == "__main__":
+    main()
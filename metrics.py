@@ -0,0 +1,195 @@
+"""
+metrics.py
+Low-overhead request instrumentation for Candy AI Clone chatbot.
+- Stage timings are taken with time.perf_counter_ns() (monotonic, integer ns)
+- Histogram / Counter keep one shard per thread: observing is a bisect and two list
+  increments on thread-private data, no lock; shards are only summed at scrape time
+- Gauges are callbacks evaluated at scrape time (cache stats, queue depths, ...)
+- Registry.render() produces the Prometheus text exposition format for /metrics
+"""
+
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Upper bucket edges in seconds (+Inf is implicit): 10 us .. 10 s, roughly x2.5 apart.
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Sharded:
+    """Per-thread shard storage; `_new_shard()` builds the empty per-thread state."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List = []
+        self._shards_lock = threading.Lock()  # taken once per thread, on its first observation
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = self._new_shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _new_shard(self):
+        raise NotImplementedError
+
+
+class Histogram(_Sharded):
+    """
+    Fixed-bucket histogram, optionally labelled.
+    observe_ns() takes integer nanoseconds (what perf_counter_ns deltas give);
+    edges are compared in ns, exported in seconds as Prometheus expects.
+    """
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__()
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._edges_ns = [int(b * 1e9) for b in self.buckets]
+
+    def _new_shard(self) -> Dict[Tuple, List[int]]:
+        return {}
+
+    def observe_ns(self, ns: int, *labels):
+        # Slot layout: [bucket counts..., +Inf count, sum_ns]; only this thread writes it.
+        shard = self._shard()
+        slots = shard.get(labels)
+        if slots is None:
+            slots = shard[labels] = [0] * (len(self._edges_ns) + 2)
+        slots[bisect.bisect_left(self._edges_ns, ns)] += 1
+        slots[-1] += ns
+
+    def observe(self, seconds: float, *labels):
+        self.observe_ns(int(seconds * 1e9), *labels)
+
+    def observe_many_ns(self, values: Dict[str, int], *labels):
+        """One observation per `values` item, its key appended as the last label (one shard lookup)."""
+        shard = self._shard()
+        edges = self._edges_ns
+        for name, ns in values.items():
+            key = labels + (name,)
+            slots = shard.get(key)
+            if slots is None:
+                slots = shard[key] = [0] * (len(edges) + 2)
+            slots[bisect.bisect_left(edges, ns)] += 1
+            slots[-1] += ns
+
+    def collect(self) -> Dict[Tuple, List[int]]:
+        totals: Dict[Tuple, List[int]] = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for labels, slots in list(shard.items()):
+                acc = totals.setdefault(labels, [0] * len(slots))
+                for i, v in enumerate(slots):
+                    acc[i] += v
+        return totals
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, slots in sorted(self.collect().items()):
+            cumulative = 0
+            for edge, count in zip(self.buckets + ("+Inf",), slots[:-1]):
+                cumulative += count
+                le = 'le="%s"' % edge
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {slots[-1] / 1e9}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}"
+
+
+class Counter(_Sharded):
+    """Monotonic counter, optionally labelled; same per-thread sharding as Histogram."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__()
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+
+    def _new_shard(self) -> Dict[Tuple, int]:
+        return {}
+
+    def inc(self, *labels, amount: int = 1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def collect(self) -> Dict[Tuple, int]:
+        totals: Dict[Tuple, int] = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for labels, v in list(shard.items()):
+                totals[labels] = totals.get(labels, 0) + v
+        return totals
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, v in sorted(self.collect().items()):
+            yield f"{self.name}{_labels(self.label_names, labels)} {v}"
+
+
+class Gauge:
+    """Value read from a callback at scrape time; the callback may return a number or {label value: number}."""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], object], label: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.label = label
+
+    def render(self) -> Iterable[str]:
+        value = self.fn()
+        if value is None:
+            return
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        if isinstance(value, dict):
+            for k, v in sorted(value.items()):
+                yield f"{self.name}{_labels((self.label,), (k,))} {float(v)}"
+        else:
+            yield f"{self.name} {float(value)}"
+
+
+class Registry:
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics: List = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(self.prefix + name, help, labels, buckets))
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(self.prefix + name, help, labels))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], object], label: Optional[str] = None) -> Gauge:
+        return self._add(Gauge(self.prefix + name, help, fn, label))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,154 @@
+"""
+moderation.py
+Multi-pattern moderation engine for Candy AI Clone chatbot.
+- Per-mode term lists compiled into one Aho-Corasick automaton each
+  (single pass over the message, cost independent of the number of terms)
+- Optional whole-word matching and utils.clean_text normalization
+- Reports which rule fired; rebuilt from the rules file on /reload
+
+Rules file (JSON, see config MODERATION_RULES_PATH):
+{
+  "modes": {
+    "*":    {"terms": ["..."], "word_boundary": true},   # applied in every mode
+    "safe": ["minors", "illegal"]                       # shorthand: terms only, default options
+  }
+}
+"""
+
+import json
+import os
+from collections import deque
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from utils import clean_text
+
+# Used when no rules file exists: the original hard-coded "safe" list, substring semantics.
+DEFAULT_RULES: Dict[str, Any] = {
+    "modes": {
+        "safe": {"terms": ["minors", "illegal", "exploit", "rape"], "word_boundary": False},
+    }
+}
+ALL_MODES = "*"
+
+
+class ModerationResult(NamedTuple):
+    allowed: bool
+    mode: str
+    rule: Optional[str] = None  # the term that matched, if blocked
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over characters.
+    `first_match()` returns the first term whose occurrence ends earliest in the text.
+    """
+
+    def __init__(self, terms: Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[Optional[str]] = [None]
+        self.size = 0
+        for term in terms:
+            if term:
+                self._add(term)
+        self._link()
+
+    def _add(self, term: str):
+        node = 0
+        for ch in term:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(None)
+            node = nxt
+        if self.out[node] is None:
+            self.out[node] = term
+            self.size += 1
+
+    def _link(self):
+        # BFS: fail links, and inherit the output of the fail target so every
+        # node knows the shortest term ending at it without walking the chain.
+        q = deque(self.goto[0].values())
+        while q:
+            node = q.popleft()
+            for ch, child in self.goto[node].items():
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[child] = self.goto[f].get(ch, 0)
+                if self.out[child] is None:
+                    self.out[child] = self.out[self.fail[child]]
+                q.append(child)
+
+    def first_match(self, text: str) -> Optional[str]:
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node] is not None:
+                return out[node]
+        return None
+
+
+class _ModeMatcher:
+    def __init__(self, terms: Iterable[str], word_boundary: bool = True, normalize: bool = True):
+        self.word_boundary = word_boundary
+        self.normalize = normalize
+        prepared = {}
+        for term in terms:
+            key = self._prepare(term)
+            if key.strip():
+                prepared[key] = term
+        self._original = prepared
+        self.automaton = AhoCorasick(prepared)
+
+    def _prepare(self, text: str) -> str:
+        text = clean_text(text) if self.normalize else text.lower()
+        # With normalized text, words are separated by single spaces, so padding
+        # both sides with a space turns substring matches into whole-word matches.
+        return f" {text} " if self.word_boundary else text
+
+    def match(self, text: str) -> Optional[str]:
+        hit = self.automaton.first_match(self._prepare(text))
+        return self._original[hit] if hit is not None else None
+
+
+class ModerationEngine:
+    """Compiled per-mode matchers; terms under "*" apply to every mode."""
+
+    def __init__(self, rules: Dict[str, Any]):
+        self.rules = rules
+        self._matchers: Dict[str, List[_ModeMatcher]] = {}
+        for mode, spec in rules.get("modes", {}).items():
+            if isinstance(spec, list):
+                spec = {"terms": spec}
+            matcher = _ModeMatcher(
+                spec.get("terms", []),
+                word_boundary=spec.get("word_boundary", True),
+                normalize=spec.get("normalize", True),
+            )
+            self._matchers.setdefault(mode, []).append(matcher)
+
+    @classmethod
+    def from_file(cls, path) -> "ModerationEngine":
+        """Load rules from JSON; fall back to DEFAULT_RULES when the file does not exist."""
+        if path is None or not os.path.exists(path):
+            return cls(DEFAULT_RULES)
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def check(self, text: str, mode: Optional[str] = "default") -> ModerationResult:
+        mode = mode or "default"
+        for matcher in self._matchers.get(ALL_MODES, []) + self._matchers.get(mode, []):
+            rule = matcher.match(text)
+            if rule is not None:
+                return ModerationResult(False, mode, rule)
+        return ModerationResult(True, mode)
+
+    def stats(self) -> Dict[str, int]:
+        return {mode: sum(m.automaton.size for m in ms) for mode, ms in self._matchers.items()}
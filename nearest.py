@@ -0,0 +1,158 @@
+"""
+nearest.py
+Nearest-pattern index for Candy AI Clone chatbot (low-confidence fallback).
+- Every intents pattern vectorized with the trained model's own vectorizer, L2-normalized,
+  stored column-major (CSC): column t lists the patterns containing feature t with their
+  weights, i.e. an inverted list per term
+- A query touches only the columns of its own terms: one sparse mat-vec over those
+  inverted lists into a reused per-thread accumulator, then argpartition for the top k;
+  cost grows with the postings of the query's terms, not with the number of patterns
+- Inverted lists are impact-ordered (highest weight first); optional pruning
+  (max_postings) reads only that many entries per list (approximate; for very large
+  corpora where a few common terms have very long lists)
+- Saved as .npy files + meta.json (ARTIFACT_DIR/nearest/), memory-mapped on load; needs
+  NumPy only. Written by train.py and online_train.py next to the model it belongs to,
+  into a staging directory swapped in whole (scorer.replace_dir)
+
+Query vectors come from the bundle (inference.py) in the same feature space, already
+L2-normalized by the vectorizer, so a dot product is the cosine similarity.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from scorer import replace_dir, staging_dir
+
+NEAREST_VERSION = 1
+
+
+def export_nearest(pipeline, patterns: Sequence[str], tags: Sequence[str], out_dir) -> Path:
+    """Vectorize `patterns` with every pipeline step but the classifier and save the index."""
+    X = pipeline[:-1].transform(list(patterns)).tocsr().astype(np.float32)
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    X = X.multiply((1.0 / norms)[:, None]).tocsc()
+    # Impact order: each column's patterns by descending weight, so pruning keeps a prefix.
+    column = np.repeat(np.arange(X.shape[1]), np.diff(X.indptr))
+    order = np.lexsort((-X.data, column))
+    X.indices, X.data = X.indices[order], X.data[order]
+
+    classes = sorted({str(t) for t in tags})
+    label_of = {c: k for k, c in enumerate(classes)}
+
+    final_dir, out_dir = Path(out_dir), staging_dir(Path(out_dir))
+    np.save(out_dir / "indptr.npy", X.indptr.astype(np.int64))
+    np.save(out_dir / "indices.npy", X.indices.astype(np.int32))
+    np.save(out_dir / "data.npy", X.data.astype(np.float32))
+    np.save(out_dir / "labels.npy", np.array([label_of[str(t)] for t in tags], dtype=np.int32))
+    meta = {
+        "version": NEAREST_VERSION,
+        "n_patterns": X.shape[0],
+        "n_features": X.shape[1],
+        "classes": classes,
+    }
+    with open(out_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    replace_dir(out_dir, final_dir)
+    return final_dir
+
+
+class NearestIndex:
+    def __init__(self, path, mmap: bool = True, max_postings: int = 0):
+        path = Path(path)
+        with open(path / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != NEAREST_VERSION:
+            raise RuntimeError(f"Unsupported nearest-pattern index version: {meta.get('version')}")
+        mode = "r" if mmap else None
+        # Plain ndarray views of the maps: slicing an np.memmap builds a memmap object every time.
+        self.indptr = np.asarray(np.load(path / "indptr.npy", mmap_mode=mode))
+        self.indices = np.asarray(np.load(path / "indices.npy", mmap_mode=mode))
+        self.data = np.asarray(np.load(path / "data.npy", mmap_mode=mode))
+        self.labels = np.asarray(np.load(path / "labels.npy", mmap_mode=mode))
+        self.path = path
+        self.classes: List[str] = meta["classes"]
+        self.n_patterns = int(meta["n_patterns"])
+        self.n_features = int(meta["n_features"])
+        self.max_postings = max_postings
+        self._local = threading.local()
+
+    @classmethod
+    def exists(cls, path) -> bool:
+        return os.path.exists(Path(path) / "meta.json")
+
+    def _scratch(self) -> np.ndarray:
+        acc = getattr(self._local, "acc", None)
+        if acc is None:
+            acc = self._local.acc = np.zeros(self.n_patterns)
+        return acc
+
+    def _top(self, col: np.ndarray, weight: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (pattern ids, cosine similarities) among patterns sharing a term with the query."""
+        keep = (col >= 0) & (col < self.n_features)
+        col, weight = col[keep], weight[keep]
+        start, end = self.indptr[col], self.indptr[col + 1]
+        if self.max_postings:
+            end = np.minimum(end, start + self.max_postings)  # lists are impact-ordered
+        # Sparse mat-vec over the query's columns into a per-thread accumulator; a column
+        # lists each pattern once, so one fancy-indexed add per term is exact.
+        acc = self._scratch()
+        touched = []
+        for s, e, w in zip(start.tolist(), end.tolist(), weight.tolist()):
+            if e > s:
+                rows = self.indices[s:e]
+                acc[rows] += self.data[s:e] * w
+                touched.append(rows)
+        if not touched:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        ids = np.concatenate(touched)
+        sims = acc[ids]
+        acc[ids] = 0.0  # ready for the next query
+        if k == 1:
+            # Ties (up to float noise, which differs between the sklearn and NumPy query
+            # vectors) go to the lowest pattern id, so both backends pick the same one.
+            tied = np.flatnonzero(sims >= sims.max() - 1e-9)
+            j = tied[ids[tied].argmin()]
+            return ids[j:j + 1], sims[j:j + 1]
+        # A pattern appears once per shared term, so the best k * n_terms entries hold k distinct ones.
+        m = k * len(touched)
+        if len(ids) > m:
+            top = np.argpartition(-sims, m - 1)[:m]
+            ids, sims = ids[top], sims[top]
+        ids, first = np.unique(ids, return_index=True)
+        return ids, sims[first]
+
+    def search(self, n: int, row: np.ndarray, col: np.ndarray, weight: np.ndarray,
+               k: int = 1) -> List[List[Tuple[int, float]]]:
+        """
+        Top-k (pattern id, similarity) per query row, best first, from (row, col, weight)
+        triplets of the L2-normalized query vectors; rows without shared terms get [].
+        """
+        out: List[List[Tuple[int, float]]] = [[] for _ in range(n)]
+        if len(row) == 0:
+            return out
+        order = np.argsort(row, kind="stable")
+        row, col, weight = row[order], np.asarray(col, dtype=np.int64)[order], weight[order]
+        bounds = np.searchsorted(row, np.arange(n + 1))
+        for r in range(n):
+            lo, hi = bounds[r], bounds[r + 1]
+            if lo == hi:
+                continue
+            ids, sims = self._top(col[lo:hi], weight[lo:hi], k)
+            best = np.lexsort((ids, -np.round(sims, 9)))[:k]  # best first, ties to the lower id
+            out[r] = [(int(ids[j]), float(sims[j])) for j in best]
+        return out
+
+    def nearest(self, n: int, row: np.ndarray, col: np.ndarray, weight: np.ndarray,
+                min_similarity: float = 0.0) -> List[Optional[Tuple[str, float]]]:
+        """(intent, similarity) of the closest pattern per row, or None below `min_similarity`."""
+        labels, classes = self.labels, self.classes
+        return [
+            (classes[labels[hits[0][0]]], hits[0][1]) if hits and hits[0][1] >= min_similarity else None
+            for hits in self.search(n, row, col, weight, k=1)
+        ]
@@ -0,0 +1,106 @@
+"""
+normalize.py
+Text normalization and tokenization shared by training and serving.
+- normalize(): lowercase, ASCII punctuation -> space, whitespace collapsed; what
+  utils.clean_text (moderation) returns. ASCII text goes through a
+  precompiled str.translate table, other text through a precompiled regex (translate
+  loses its fast path on non-ASCII strings)
+- tokenize(): the vectorizer's token pattern (TOKEN_PATTERN, sklearn's default), so tokens
+  match what TfidfVectorizer / HashingVectorizer / the compact scorer see (and reply cache
+  keys are built from them)
+- normalize_batch() / tokenize_batch(): lists or iterators of messages, lowercased and
+  punctuation-stripped as one joined string per chunk instead of one call per message
+- compiled(): cached re.compile for patterns built at runtime
+
+Golden cases, and parity with sklearn's analyzer: tests/test_normalize.py
+"""
+
+import re
+import string
+from functools import lru_cache
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+# sklearn's CountVectorizer default; train.py passes it explicitly to every vectorizer.
+TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+PUNCT_TABLE = str.maketrans(string.punctuation, " " * len(string.punctuation))
+PUNCT_PATTERN = f"[{re.escape(string.punctuation)}]"
+
+# Joins a chunk of messages for the batch calls; a chunk containing it falls back to per-message.
+SEPARATOR = "\x00"
+CHUNK_SIZE = 65536
+
+
+@lru_cache(maxsize=64)
+def compiled(pattern: str, flags: int = 0) -> "re.Pattern":
+    return re.compile(pattern, flags)
+
+
+TOKEN_RE = compiled(TOKEN_PATTERN)
+PUNCT_RE = compiled(PUNCT_PATTERN)
+
+
+def _strip_punct(text: str) -> str:
+    return text.translate(PUNCT_TABLE) if text.isascii() else PUNCT_RE.sub(" ", text)
+
+
+# -------------------------
+# Single message
+# -------------------------
+def normalize(text: str) -> str:
+    """Lowercase, replace ASCII punctuation with spaces, collapse whitespace."""
+    if not text:
+        return ""
+    return " ".join(_strip_punct(text.lower()).split())
+
+
+def tokenize(text: str, pattern: str = TOKEN_PATTERN) -> List[str]:
+    """Lowercased tokens as the vectorizer extracts them (before n-grams)."""
+    if not text:
+        return []
+    return compiled(pattern).findall(text.lower())
+
+
+# -------------------------
+# Batches
+# -------------------------
+def _chunks(messages: Iterable[str], size: int) -> Iterator[List[str]]:
+    if isinstance(messages, list) and len(messages) <= size:
+        yield messages
+        return
+    it = iter(messages)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _lowered(chunk: List[str], strip_punct: bool = False) -> List[str]:
+    """Every message lowercased (and punctuation stripped), in one pass over the joined chunk."""
+    joined = SEPARATOR.join(chunk)
+    if joined.count(SEPARATOR) != len(chunk) - 1:  # a message contains the separator
+        return [_strip_punct(m.lower()) if strip_punct else m.lower() for m in chunk]
+    joined = joined.lower()
+    if strip_punct:
+        joined = _strip_punct(joined)
+    return joined.split(SEPARATOR)
+
+
+def normalize_batch(messages: Iterable[str], chunk_size: int = CHUNK_SIZE) -> List[str]:
+    """normalize() of every message, in order."""
+    out: List[str] = []
+    for chunk in _chunks(messages, chunk_size):
+        out.extend([" ".join(m.split()) for m in _lowered(chunk, strip_punct=True)])
+    return out
+
+
+def tokenize_batch(messages: Iterable[str], pattern: str = TOKEN_PATTERN,
+                   chunk_size: int = CHUNK_SIZE) -> List[List[str]]:
+    """tokenize() of every message, in order."""
+    findall = compiled(pattern).findall
+    out: List[List[str]] = []
+    for chunk in _chunks(messages, chunk_size):
+        out.extend([findall(m) for m in _lowered(chunk)])
+    return out
+
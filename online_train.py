@@ -0,0 +1,240 @@
+"""
+online_train.py
+Incremental training from reviewed chats for Candy AI Clone chatbot (no full retrain).
+- Model: HashingVectorizer (stateless, nothing to refit) + SGDClassifier(loss="log_loss").partial_fit
+- Streams labeled rows (database.iter_labeled) after a persisted cursor, ONLINE_CHUNK_SIZE at a
+  time, so memory is bounded by the chunk size and each update costs O(new rows)
+- Every chunk is mixed with a few intents.json patterns (rehearsal) so a burst of
+  corrections for one intent doesn't wash out the others
+- Publishes a new version (whenever new rows were applied) by atomically replacing
+  model.pkl / vectorizer.pkl and the compact NumPy export with the online model; the server
+  picks it up with ARTIFACT_WATCH=true or POST /reload (--reload-url calls it)
+- Never publishes over a model train.py saved after this online state was bootstrapped
+  (ARTIFACT_DIR/manifest.json records who published last); `--bootstrap` starts over
+
+State lives in ARTIFACT_DIR/online/ (model.pkl, state.json). The first run bootstraps
+the model from intents.json. Intent tags are fixed at bootstrap: labels for tags that
+did not exist then are skipped until `--bootstrap` (or train.py) starts over.
+
+Usage:
+    python online_train.py                 # apply new labels once and publish
+    python online_train.py --loop          # keep polling every ONLINE_INTERVAL_S (background process)
+    python online_train.py --bootstrap     # discard online state and start from intents.json
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import Pipeline
+
+from config import (
+    MODEL_PATH, VECTORIZER_PATH, INTENTS_PATH, INTENTS_INDEX_PATH, COMPACT_DIR, NEAREST_DIR, MANIFEST_PATH,
+    ensure_dirs, settings
+)
+from database import iter_labeled
+from inference import InferenceBundle, read_manifest, write_manifest
+from intents_index import build_index, load_source
+from nearest import export_nearest
+from normalize import TOKEN_PATTERN
+from scorer import export_compact
+
+ONLINE_DIR = settings.ARTIFACT_DIR / settings.ONLINE_DIRNAME
+STATE_PATH = ONLINE_DIR / "state.json"
+ONLINE_MODEL_PATH = ONLINE_DIR / "model.pkl"
+BOOTSTRAP_EPOCHS = 20
+
+
+def load_intents() -> Tuple[Dict[str, Any], List[str], List[str]]:
+    intents = load_source(INTENTS_PATH)
+    patterns, tags = [], []
+    for intent in intents["intents"]:
+        for pattern in intent.get("patterns", []):
+            patterns.append(pattern)
+            tags.append(intent["tag"])
+    return intents, patterns, tags
+
+
+def build_model() -> Pipeline:
+    return Pipeline([
+        ("hash", HashingVectorizer(
+            lowercase=True,
+            token_pattern=TOKEN_PATTERN,
+            stop_words="english",
+            ngram_range=tuple(settings.NGRAM_RANGE),
+            n_features=settings.ONLINE_HASH_FEATURES,
+            alternate_sign=False,
+            norm="l2",
+        )),
+        ("clf", SGDClassifier(loss="log_loss", alpha=settings.ONLINE_ALPHA, random_state=settings.RANDOM_STATE)),
+    ])
+
+
+def partial_fit(model: Pipeline, messages: List[str], labels: List[str], classes: Optional[List[str]] = None):
+    X = model.named_steps["hash"].transform(messages)
+    model.named_steps["clf"].partial_fit(X, labels, classes=classes)
+
+
+# -------------------------
+# State
+# -------------------------
+def write_atomic(path: Path, writer):
+    tmp = path.with_name(path.name + ".tmp")
+    writer(tmp)
+    os.replace(tmp, path)
+
+
+def load_state() -> Optional[Tuple[Pipeline, Dict[str, Any]]]:
+    if not (STATE_PATH.exists() and ONLINE_MODEL_PATH.exists()):
+        return None
+    with open(STATE_PATH, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    return joblib.load(ONLINE_MODEL_PATH), state
+
+
+def save_state(model: Pipeline, state: Dict[str, Any]):
+    ONLINE_DIR.mkdir(parents=True, exist_ok=True)
+    write_atomic(ONLINE_MODEL_PATH, lambda p: joblib.dump(model, p))
+    write_atomic(STATE_PATH, lambda p: p.write_text(json.dumps(state, indent=2), encoding="utf-8"))
+
+
+def bootstrap(patterns: List[str], tags: List[str]) -> Tuple[Pipeline, Dict[str, Any]]:
+    classes = sorted(set(tags))
+    model = build_model()
+    rng = random.Random(settings.RANDOM_STATE)
+    order = list(range(len(patterns)))
+    for epoch in range(BOOTSTRAP_EPOCHS):
+        rng.shuffle(order)
+        partial_fit(model, [patterns[i] for i in order], [tags[i] for i in order], classes if epoch == 0 else None)
+    state = {"cursor": None, "rows_applied": 0, "rows_skipped": 0, "version": 0, "classes": classes,
+             "updated_at": int(time.time()), "bootstrapped_at": time.time()}
+    print(f"[INFO] Bootstrapped online model from {len(patterns)} patterns, {len(classes)} intents")
+    return model, state
+
+
+# -------------------------
+# Update + publish
+# -------------------------
+def apply_new_labels(model: Pipeline, state: Dict[str, Any], patterns: List[str], tags: List[str]) -> int:
+    """partial_fit on labeled rows after the cursor, chunk by chunk; returns rows applied."""
+    known = set(state["classes"])
+    rng = random.Random(state["version"])
+    cursor = tuple(state["cursor"]) if state["cursor"] else None
+    applied = 0
+    for page in iter_labeled(after=cursor, page_size=settings.ONLINE_CHUNK_SIZE):
+        messages = [m for _, _, m, label in page if label in known and m]
+        labels = [label for _, _, m, label in page if label in known and m]
+        skipped = len(page) - len(labels)
+        if messages:
+            k = min(settings.ONLINE_REHEARSAL, len(patterns))
+            for i in rng.sample(range(len(patterns)), k):
+                messages.append(patterns[i])
+                labels.append(tags[i])
+            partial_fit(model, messages, labels)
+        applied += len(page) - skipped
+        state["rows_applied"] += len(page) - skipped
+        state["rows_skipped"] += skipped
+        state["cursor"] = [page[-1][0], page[-1][1]]
+        if skipped:
+            print(f"[WARN] Skipped {skipped} rows with empty messages or intents unknown to the online model")
+    return applied
+
+
+def superseded_by(state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The manifest of a train.py model published after this online state was bootstrapped, if any."""
+    manifest = read_manifest(MANIFEST_PATH)
+    if manifest and manifest.get("source") == "train" and manifest.get("published_at", 0) > state.get("bootstrapped_at", 0):
+        return manifest
+    return None
+
+
+def publish(model: Pipeline, intents: Dict[str, Any], patterns: List[str], tags: List[str],
+            state: Dict[str, Any]) -> bool:
+    """
+    Smoke-test, then replace the serving artifacts (vectorizer first, model last, compact
+    export, nearest-pattern index, intents index, manifest). Returns False, publishing
+    nothing, when train.py has saved a newer model.
+    """
+    newer = superseded_by(state)
+    if newer is not None:
+        print(f"[WARN] Not publishing online model v{state['version']}: train.py saved a newer model at "
+              f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(newer['published_at']))}; "
+              f"run with --bootstrap to start the online model over")
+        return False
+    InferenceBundle(model, None, intents).smoke_test()
+    write_atomic(Path(VECTORIZER_PATH), lambda p: joblib.dump(model.named_steps["hash"], p))
+    write_atomic(Path(MODEL_PATH), lambda p: joblib.dump(model, p))
+    export_compact(model, COMPACT_DIR, sample=patterns)
+    export_nearest(model, patterns, tags, NEAREST_DIR)  # feature space changes with the model
+    build_index(INTENTS_PATH, state["classes"], INTENTS_INDEX_PATH)
+    write_manifest(MANIFEST_PATH, "online", state["version"])
+    print(f"[INFO] Published online model v{state['version']} → {MODEL_PATH}")
+    return True
+
+
+def trigger_reload(url: str):
+    # /reload requires an API key when API_KEY_REQUIRED; the trainer shares the server's settings.
+    headers = {settings.API_KEY_HEADER: settings.API_KEYS_ALLOWLIST[0]} if settings.API_KEYS_ALLOWLIST else {}
+    req = urllib.request.Request(url.rstrip("/") + "/reload", method="POST", headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            print(f"[INFO] Server reload: {resp.read().decode()}")
+    except OSError as e:
+        print(f"[WARN] Server reload failed (ARTIFACT_WATCH will still pick the files up if enabled): {e}")
+
+
+def run_once(args) -> int:
+    intents, patterns, tags = load_intents()
+    loaded = None if args.bootstrap else load_state()
+    if loaded is None:
+        model, state = bootstrap(patterns, tags)
+    else:
+        model, state = loaded
+        if set(tags) - set(state["classes"]):
+            print("[WARN] intents.json has tags the online model can't learn incrementally; "
+                  "run with --bootstrap (or train.py) to include them")
+
+    start = time.perf_counter()
+    applied = apply_new_labels(model, state, patterns, tags)
+    if applied:
+        state["version"] += 1
+        state["updated_at"] = int(time.time())
+        if publish(model, intents, patterns, tags, state) and args.reload_url:
+            trigger_reload(args.reload_url)
+    # Saved after publishing: a crash in between re-applies the same rows next time
+    # (at-least-once). The cursor also moves past skipped rows.
+    save_state(model, state)
+    print(f"[INFO] Applied {applied} new labeled rows in {time.perf_counter() - start:.2f}s "
+          f"(total {state['rows_applied']}, version {state['version']})")
+    args.bootstrap = False
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally train the intent model from labeled chats.")
+    parser.add_argument("--loop", action="store_true", help="keep running, polling for new labels")
+    parser.add_argument("--interval", type=float, default=settings.ONLINE_INTERVAL_S)
+    parser.add_argument("--bootstrap", action="store_true", help="start over from intents.json")
+    parser.add_argument("--reload-url", help="POST <url>/reload after publishing, e.g. http://127.0.0.1:8000")
+    args = parser.parse_args()
+    ensure_dirs()
+
+    run_once(args)
+    while args.loop:
+        time.sleep(args.interval)
+        try:
+            run_once(args)
+        except Exception as e:  # keep the background trainer alive; the next round retries
+            print(f"[WARN] Online training round failed: {e}")
+
+
+if __name__ == "__main__":
+    main()
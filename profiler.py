@@ -0,0 +1,187 @@
+"""
+profiler.py
+Opt-in sampling profiler for slow /chat requests.
+- While enabled, a daemon thread samples every thread's Python stack (sys._current_frames)
+  every PROFILE_INTERVAL_MS into a short ring buffer of (timestamp, collapsed stack)
+- When a request finishes, it is captured if it was slower than PROFILE_SLOW_MS or was
+  picked by PROFILE_SAMPLE_RATE: the samples taken during its lifetime are kept
+- Keeps the last PROFILE_MAX_REQUESTS captures and periodically writes them under
+  LOG_DIR/profiles/: chat-<pid>.folded (flamegraph.pl / speedscope input) and
+  chat-<pid>.top.txt (top-N stacks)
+- Disabled (the default): no thread runs, and request handlers skip it after one attribute check
+
+Samples cover every busy thread, so requests running at the same time share stacks;
+the event loop and the inference worker threads both show up.
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# A thread whose innermost frame is in one of these files is blocked, not working.
+IDLE_FILES = frozenset({"threading.py", "selectors.py", "queue.py", "socket.py"})
+
+
+class RequestProfiler:
+    def __init__(
+        self,
+        out_dir,
+        sample_rate: float = 0.01,
+        slow_ms: float = 250.0,
+        interval_ms: float = 5.0,
+        max_requests: int = 500,
+        top_n: int = 30,
+        flush_seconds: float = 10.0,
+        window_seconds: float = 30.0,
+    ):
+        self.out_dir = Path(out_dir)
+        self.sample_rate = sample_rate
+        self.slow_ns = int(slow_ms * 1e6)
+        self.interval = interval_ms / 1000
+        self.top_n = top_n
+        self.flush_seconds = flush_seconds
+        # Samples older than the longest request we could still be asked about are dropped.
+        self._samples: Deque[Tuple[int, str]] = deque(maxlen=max(1, int(window_seconds / self.interval)))
+        self._captures: Deque[Tuple[str, int, Counter]] = deque(maxlen=max_requests)
+        self._names: Dict[Any, str] = {}  # code object -> "file:function"
+        self._lock = threading.Lock()  # captures
+        self._samples_lock = threading.Lock()  # the sampler appends while requests read
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.enabled = False
+        self.samples_taken = 0
+        self.captured = 0
+
+    # ---- lifecycle ----
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            self.enabled = True
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+        self.flush()
+
+    def configure(self, sample_rate: Optional[float] = None, slow_ms: Optional[float] = None):
+        if sample_rate is not None:
+            self.sample_rate = max(0.0, min(1.0, sample_rate))
+        if slow_ms is not None:
+            self.slow_ns = int(slow_ms * 1e6)
+
+    # ---- sampling ----
+    def _collapse(self, frame) -> Optional[str]:
+        names = self._names
+        parts: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            name = names.get(code)
+            if name is None:
+                name = names[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+            parts.append(name)
+            frame = frame.f_back
+        if not parts or parts[0].partition(":")[0] in IDLE_FILES:
+            return None
+        return ";".join(reversed(parts))
+
+    def _sample(self):
+        own = threading.get_ident()
+        now = time.perf_counter_ns()
+        taken = []
+        for tid, frame in sys._current_frames().items():
+            if tid == own:
+                continue
+            stack = self._collapse(frame)
+            if stack is not None:
+                taken.append((now, stack))
+        with self._samples_lock:
+            self._samples.extend(taken)
+        self.samples_taken += 1
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_seconds
+        while not self._stop.wait(self.interval):
+            self._sample()
+            if time.monotonic() >= next_flush:
+                self.flush()
+                next_flush = time.monotonic() + self.flush_seconds
+
+    # ---- requests ----
+    def finish(self, endpoint: str, start_ns: int, end_ns: Optional[int] = None):
+        """Called when a request completes; keeps its samples if it is slow or sampled."""
+        end_ns = time.perf_counter_ns() if end_ns is None else end_ns
+        duration = end_ns - start_ns
+        if duration < self.slow_ns and random.random() >= self.sample_rate:
+            return
+        with self._samples_lock:
+            samples = list(self._samples)
+        stacks: Counter = Counter()
+        for ts, stack in reversed(samples):  # newest first; stop once past the start
+            if ts < start_ns:
+                break
+            if ts <= end_ns:
+                stacks[stack] += 1
+        with self._lock:
+            self._captures.append((endpoint, duration, stacks))
+            self.captured += 1
+
+    # ---- reporting ----
+    def aggregate(self) -> Counter:
+        with self._lock:
+            captures = list(self._captures)
+        total: Counter = Counter()
+        for endpoint, _, stacks in captures:
+            for stack, n in stacks.items():
+                total[f"{endpoint};{stack}"] += n
+        return total
+
+    def report(self, top_n: Optional[int] = None) -> Dict[str, Any]:
+        total = self.aggregate()
+        n = sum(total.values())
+        with self._lock:
+            durations = sorted(d for _, d, _ in self._captures)
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_ms": self.slow_ns / 1e6,
+            "interval_ms": self.interval * 1000,
+            "samples_taken": self.samples_taken,
+            "captured_requests": self.captured,
+            "window_requests": len(durations),
+            "max_request_ms": durations[-1] / 1e6 if durations else None,
+            "top": [
+                {"stack": stack, "samples": count, "share": count / n}
+                for stack, count in total.most_common(self.top_n if top_n is None else top_n)
+            ],
+        }
+
+    def flush(self):
+        """Write the current window as collapsed stacks (+ a top-N summary); atomic replace."""
+        total = self.aggregate()
+        if not total:
+            return
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        base = self.out_dir / f"chat-{os.getpid()}"
+        n = sum(total.values())
+        outputs = {
+            ".folded": "".join(f"{stack} {count}\n" for stack, count in total.most_common()),
+            ".top.txt": "".join(
+                f"{count / n:7.2%} {count:8d}  {stack}\n" for stack, count in total.most_common(self.top_n)
+            ),
+        }
+        for suffix, text in outputs.items():
+            tmp = base.with_suffix(suffix + ".tmp")
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, base.with_suffix(suffix))
@@ -0,0 +1,213 @@
+"""
+ratelimit.py
+Token-bucket rate limiting for Candy AI Clone chatbot.
+- MemoryBucketStore: sharded in-process buckets, O(1) per request, bounded key count
+- SqliteBucketStore: one shared SQLite file so limits hold across uvicorn workers
+- RateLimitMiddleware: raw ASGI middleware, answers 429 + Retry-After when a bucket is empty
+- client_key(): an allowlisted API key, else the client IP; nothing else the client sends
+  picks its bucket (a fresh header value per request would otherwise get a fresh bucket)
+
+Bucket semantics: capacity = RATE_LIMIT_BURST tokens, refilled continuously at
+RATE_LIMIT_PER_MINUTE / 60 tokens per second; a request takes `cost` tokens (one per
+message). A cost above the burst is allowed on a full bucket and leaves it in debt, so
+large batches are paid for by waiting rather than refused outright.
+"""
+
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Collection, Dict, Iterable, List, Optional
+
+
+def client_key(headers: Iterable, client, api_key_header: bytes, api_keys: Collection[str]) -> str:
+    """Bucket key from ASGI scope headers/client: allowlisted API key, else client IP."""
+    if api_keys:
+        for name, value in headers:
+            if name == api_key_header:
+                key = value.decode("latin-1")
+                if key in api_keys:
+                    return "key:" + key
+                break
+    return "ip:" + (client[0] if client else "unknown")
+
+
+class MemoryBucketStore:
+    """
+    In-memory buckets split across `shards` LRU dicts, each with its own lock,
+    so concurrent requests rarely contend. A bucket idle long enough to be full
+    again is indistinguishable from a new one, so it is dropped on sight; beyond
+    that, each shard is capped at max_keys / shards entries (LRU first).
+    """
+
+    blocking = False  # take() is cheap enough to call on the event loop
+
+    def __init__(self, per_minute: int, burst: int, shards: int = 64, max_keys: int = 1_000_000):
+        self.rate = per_minute / 60.0
+        self.burst = float(max(1, burst))
+        self.refill_seconds = self.burst / self.rate if self.rate > 0 else math.inf
+        self._shards: List["OrderedDict[str, List[float]]"] = [OrderedDict() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._cap = max(1, max_keys // shards)
+        self.evictions = 0
+        self.allowed = 0
+        self.limited = 0
+
+    def take(self, key: str, now: Optional[float] = None, cost: float = 1.0) -> float:
+        """Take `cost` tokens; returns 0.0 if allowed, otherwise seconds until enough are available."""
+        now = time.monotonic() if now is None else now
+        need = min(cost, self.burst)
+        i = hash(key) % len(self._shards)
+        shard = self._shards[i]
+        with self._locks[i]:
+            bucket = shard.get(key)
+            if bucket is None:
+                self._evict(shard, now)
+                shard[key] = [self.burst - cost, now]
+                self.allowed += 1
+                return 0.0
+            shard.move_to_end(key)
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= need:
+                bucket[0] = tokens - cost
+                self.allowed += 1
+                return 0.0
+            bucket[0] = tokens
+            self.limited += 1
+            return (need - tokens) / self.rate if self.rate > 0 else math.inf
+
+    def _evict(self, shard: "OrderedDict[str, List[float]]", now: float):
+        # Oldest entry first: drop it if it has refilled (debt included), and always when over the cap.
+        while shard:
+            key, (tokens, last) = next(iter(shard.items()))
+            if tokens + (now - last) * self.rate >= self.burst or len(shard) >= self._cap:
+                del shard[key]
+                self.evictions += 1
+            else:
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "keys": sum(len(s) for s in self._shards),
+            "evictions": self.evictions,
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+
+class SqliteBucketStore:
+    """
+    Buckets in a shared SQLite file (WAL, synchronous=OFF: limiter state is disposable).
+    One upsert ... RETURNING per request, atomic across processes. take() blocks on
+    SQLite (up to the busy timeout), so RateLimitMiddleware runs it in a worker thread.
+    """
+
+    blocking = True
+
+    TAKE_SQL = """
+        INSERT INTO buckets (key, tokens, ts, allowed) VALUES (?1, ?2 - ?5, ?3, 1)
+        ON CONFLICT(key) DO UPDATE SET
+            allowed = MIN(?2, tokens + (?3 - ts) * ?4) >= ?6,
+            tokens = MIN(?2, tokens + (?3 - ts) * ?4) - ?5 * (MIN(?2, tokens + (?3 - ts) * ?4) >= ?6),
+            ts = ?3
+        RETURNING allowed, tokens
+    """
+
+    def __init__(self, path, per_minute: int, burst: int, sweep_every: int = 10000):
+        self.path = str(path)
+        self.rate = per_minute / 60.0
+        self.burst = float(max(1, burst))
+        self.refill_seconds = self.burst / self.rate if self.rate > 0 else math.inf
+        self.sweep_every = sweep_every
+        self._local = threading.local()
+        self._calls = 0
+        self.allowed = 0
+        self.limited = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets "
+            "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, ts REAL NOT NULL, allowed INTEGER NOT NULL) WITHOUT ROWID"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # Per thread, and never reused across a fork.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key: str, now: Optional[float] = None, cost: float = 1.0) -> float:
+        # Wall clock: it is the only clock shared between processes.
+        now = time.time() if now is None else now
+        need = min(cost, self.burst)
+        conn = self._conn()
+        allowed, tokens = conn.execute(self.TAKE_SQL, (key, self.burst, now, self.rate, cost, need)).fetchone()
+        self._calls += 1
+        if self._calls % self.sweep_every == 0:
+            conn.execute("DELETE FROM buckets WHERE tokens + (? - ts) * ? >= ?", (now, self.rate, self.burst))
+        if allowed:
+            self.allowed += 1
+            return 0.0
+        self.limited += 1
+        return (need - tokens) / self.rate if self.rate > 0 else math.inf
+
+    def stats(self) -> Dict[str, Any]:
+        keys = self._conn().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+        return {"backend": "sqlite", "path": self.path, "keys": keys, "allowed": self.allowed, "limited": self.limited}
+
+
+class RateLimitMiddleware:
+    """
+    Raw ASGI middleware (no BaseHTTPMiddleware request/response wrapping).
+    Charges one token per request on `paths`; bucket key from client_key().
+    /chat/batch is charged per item by its handler instead (the body is not read here;
+    parsing it would cost far more than the limiter itself).
+    """
+
+    def __init__(
+        self,
+        app,
+        store,
+        paths: Iterable[str] = ("/chat",),
+        api_key_header: str = "x-api-key",
+        api_keys: Collection[str] = (),
+    ):
+        self.app = app
+        self.store = store
+        self.paths = frozenset(paths)
+        self.api_keys = frozenset(api_keys)
+        self._api_key_header = api_key_header.lower().encode("latin-1")
+
+    def key(self, scope) -> str:
+        return client_key(scope.get("headers", ()), scope.get("client"), self._api_key_header, self.api_keys)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        key = self.key(scope)
+        if self.store.blocking:
+            wait = await asyncio.get_running_loop().run_in_executor(None, self.store.take, key)
+        else:
+            wait = self.store.take(key)
+        if not wait:
+            await self.app(scope, receive, send)
+            return
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": b'{"detail":"rate limit exceeded"}'})
@@ -0,0 +1,385 @@
+"""
+scorer.py
+Pure-NumPy scorer for the trained TF-IDF + linear classifier.
+- export_compact(): called by train.py, writes the model as .npy arrays + meta.json into a
+  staging directory and swaps it in whole (replace_dir)
+- CompactScorer: memory-maps those arrays and scores messages without importing sklearn
+- Vocabulary models (TfidfVectorizer) look n-grams up in a sorted term array; hashing
+  models (HashingVectorizer [+ TfidfTransformer], VECTORIZER_MODE=hashing and
+  online_train.py) hash each n-gram to its column instead, so there is no vocabulary at all
+
+Artifact layout (ARTIFACT_DIR/compact/):
+    meta.json         analyzer options, classes, stop words, probability mode
+    vocab_terms.npy   sorted vocabulary terms (fixed-width unicode)       vocabulary models
+    vocab_cols.npy    feature column for each sorted term                 vocabulary models
+    hash_cols.npy     sorted hash columns the model uses                  hashing models
+    idf.npy           idf weight per feature column (hashing: per hash_cols entry)
+    coef_t.npy        coefficients, transposed to (n_features, n_coef_rows)
+                      (hashing: one row per hash_cols entry)
+    intercept.npy     intercept per coef row
+"""
+
+import json
+import os
+import re
+import shutil
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+COMPACT_VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)  # 1 = vocabulary models only; still loadable
+
+
+# -------------------------
+# Feature hashing
+# -------------------------
+def murmurhash3_32(data: bytes, seed: int = 0) -> int:
+    """Signed MurmurHash3 (x86, 32-bit): the hash sklearn's HashingVectorizer uses."""
+    c1, c2, mask = 0xCC9E2D51, 0x1B873593, 0xFFFFFFFF
+    h = seed
+    end = len(data) - len(data) % 4
+    for i in range(0, end, 4):
+        k = (int.from_bytes(data[i:i + 4], "little") * c1) & mask
+        k = (((k << 15) | (k >> 17)) * c2) & mask
+        h ^= k
+        h = ((h << 13) | (h >> 19)) & mask
+        h = (h * 5 + 0xE6546B64) & mask
+    if end < len(data):
+        k = (int.from_bytes(data[end:], "little") * c1) & mask
+        h ^= (((k << 15) | (k >> 17)) * c2) & mask
+    h ^= len(data)
+    h ^= h >> 16
+    h = (h * 0x85EBCA6B) & mask
+    h ^= h >> 13
+    h = (h * 0xC2B2AE35) & mask
+    h ^= h >> 16
+    return h - (1 << 32) if h & 0x80000000 else h
+
+
+def hash_column(gram: str, n_features: int) -> int:
+    """Column HashingVectorizer(alternate_sign=False) puts `gram` in."""
+    h = murmurhash3_32(gram.encode("utf-8"))
+    if h == -(1 << 31):  # abs() would overflow int32 in sklearn; this is its defined result
+        return (2147483647 - (n_features - 1)) % n_features
+    return abs(h) % n_features
+
+
+# -------------------------
+# Export (training side)
+# -------------------------
+def _proba_mode(estimator) -> str:
+    """How predict_proba is derived from the decision function (mirrors sklearn)."""
+    if not callable(getattr(estimator, "predict_proba", None)):
+        return "none"
+    if type(estimator).__name__ == "LogisticRegression":
+        multi_class = getattr(estimator, "multi_class", "auto")
+        solver = getattr(estimator, "solver", "lbfgs")
+        if multi_class in ("ovr", "warn") or (
+            multi_class in ("auto", "deprecated") and (len(estimator.classes_) <= 2 or solver == "liblinear")
+        ):
+            return "ovr"
+        return "softmax"
+    return "ovr"  # SGDClassifier(loss="log_loss") and other linear models use OvR normalization
+
+
+def export_compact(pipeline, out_dir, sample: Optional[List[str]] = None) -> Path:
+    """
+    Write a fitted Pipeline([("tfidf", TfidfVectorizer), ("clf", linear model)]) as .npy files.
+    Hashing pipelines, Pipeline([("hash", HashingVectorizer), ("idf", TfidfTransformer), ("clf", ...)])
+    with or without the idf step, are exported too.
+    If `sample` messages are given, the export is checked against the sklearn pipeline.
+    """
+    vectorizer = pipeline.steps[0][1]
+    estimator = pipeline.steps[-1][1]
+    hashing = type(vectorizer).__name__ == "HashingVectorizer"
+    transformer = pipeline.steps[1][1] if hashing and len(pipeline.steps) == 3 else None
+
+    unsupported = []
+    if vectorizer.analyzer != "word":
+        unsupported.append("analyzer")
+    if vectorizer.tokenizer is not None or vectorizer.preprocessor is not None:
+        unsupported.append("custom tokenizer/preprocessor")
+    if vectorizer.strip_accents is not None:
+        unsupported.append("strip_accents")
+    if hashing:
+        if vectorizer.alternate_sign or vectorizer.binary:
+            unsupported.append("alternate_sign/binary")
+        if transformer is not None and (type(transformer).__name__ != "TfidfTransformer" or vectorizer.norm is not None
+                                        or transformer.sublinear_tf or not transformer.use_idf):
+            unsupported.append("steps between HashingVectorizer(norm=None) and the classifier other than TfidfTransformer")
+    elif vectorizer.binary or vectorizer.sublinear_tf or not vectorizer.use_idf:
+        unsupported.append("binary/sublinear_tf/use_idf=False")
+    if len(pipeline.steps) > (3 if hashing else 2):
+        unsupported.append("extra pipeline steps")
+    if unsupported:
+        raise ValueError(f"export_compact does not support: {', '.join(unsupported)}")
+
+    out_dir = Path(out_dir)
+    final_dir, out_dir = out_dir, staging_dir(out_dir)
+
+    coef = estimator.coef_
+    coef_t = np.asarray(coef.toarray() if hasattr(coef, "toarray") else coef, dtype=np.float64).T
+    meta = {
+        "version": COMPACT_VERSION,
+        "lowercase": bool(vectorizer.lowercase),
+        "token_pattern": vectorizer.token_pattern,
+        "ngram_range": list(vectorizer.ngram_range),
+        "norm": vectorizer.norm,
+        "stop_words": sorted(vectorizer.get_stop_words() or []),
+        "classes": [str(c) for c in estimator.classes_],
+        "proba": _proba_mode(estimator),
+    }
+
+    if hashing:
+        # Only columns that can change a score are stored: those with a nonzero weight, or an
+        # idf other than the one every column unseen in training shares (needed for the norm).
+        idf = np.ones(vectorizer.n_features) if transformer is None else np.asarray(transformer.idf_, dtype=np.float64)
+        idf_default = float(idf.max())
+        keep = np.flatnonzero((idf != idf_default) | np.any(coef_t != 0, axis=1))
+        np.save(out_dir / "hash_cols.npy", keep.astype(np.int64))
+        np.save(out_dir / "idf.npy", idf[keep])
+        np.save(out_dir / "coef_t.npy", np.ascontiguousarray(coef_t[keep]))
+        meta.update({
+            "vectorizer": "hashing",
+            "n_features": int(vectorizer.n_features),
+            "idf_default": idf_default,
+            "norm": vectorizer.norm if transformer is None else transformer.norm,
+        })
+    else:
+        vocab = vectorizer.vocabulary_
+        terms = np.array(sorted(vocab))
+        cols = np.array([vocab[t] for t in terms], dtype=np.int32)
+        np.save(out_dir / "vocab_terms.npy", terms)
+        np.save(out_dir / "vocab_cols.npy", cols)
+        np.save(out_dir / "idf.npy", np.asarray(vectorizer.idf_, dtype=np.float64))
+        np.save(out_dir / "coef_t.npy", np.ascontiguousarray(coef_t))
+        meta["vectorizer"] = "vocabulary"
+    np.save(out_dir / "intercept.npy", np.atleast_1d(np.asarray(estimator.intercept_, dtype=np.float64)))
+    with open(out_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    if sample:
+        check_parity(pipeline, CompactScorer(out_dir, mmap=False), sample)
+    replace_dir(out_dir, final_dir)
+    return final_dir
+
+
+def staging_dir(out_dir: Path) -> Path:
+    """Empty sibling directory an export is written to before replace_dir() publishes it."""
+    tmp = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    return tmp
+
+
+def replace_dir(tmp: Path, out_dir: Path):
+    """
+    Swap a fully written export in for `out_dir` with renames, like write_atomic for files.
+    Files a running server has memory-mapped are unlinked with the old directory, never
+    rewritten in place, so its maps stay valid until it reloads.
+    """
+    old = out_dir.with_name(out_dir.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if out_dir.exists():
+        os.replace(out_dir, old)
+    os.replace(tmp, out_dir)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def check_parity(pipeline, scorer: "CompactScorer", messages: List[str], atol: float = 1e-9):
+    """Raise if the compact scorer disagrees with the sklearn pipeline on `messages`."""
+    idx, conf = scorer.score(messages)
+    expected = [str(t) for t in pipeline.predict(messages)]
+    got = [scorer.classes[k] for k in idx]
+    if got != expected:
+        raise AssertionError("compact scorer predictions differ from sklearn pipeline")
+    if conf is not None:
+        ref = pipeline.predict_proba(messages).max(axis=1)
+        if not np.allclose(conf, ref, rtol=0, atol=atol):
+            raise AssertionError(f"compact scorer probabilities differ (max err {np.abs(conf - ref).max():.3g})")
+
+
+# -------------------------
+# Scoring (serving side)
+# -------------------------
+class CompactScorer:
+    """
+    TF-IDF (word n-grams, l2 norm) + linear decision function, all in NumPy.
+    Arrays are opened with mmap_mode="r" so forked/parallel workers share the same pages.
+    Hashing artifacts keep only a bounded per-process cache of n-gram -> column.
+    """
+
+    def __init__(self, path, mmap: bool = True):
+        path = Path(path)
+        with open(path / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") not in SUPPORTED_VERSIONS:
+            raise RuntimeError(f"Unsupported compact artifact version: {meta.get('version')}")
+
+        mode = "r" if mmap else None
+        self.hashing = meta.get("vectorizer") == "hashing"
+        if self.hashing:
+            self.hash_cols = np.load(path / "hash_cols.npy", mmap_mode=mode)
+            n_hash = int(meta["n_features"])
+            self._hash = lru_cache(maxsize=1 << 16)(lambda gram: hash_column(gram, n_hash))
+            self._idf_default = float(meta["idf_default"])
+        else:
+            self.terms = np.load(path / "vocab_terms.npy", mmap_mode=mode)
+            self.cols = np.load(path / "vocab_cols.npy", mmap_mode=mode)
+        self.idf = np.load(path / "idf.npy", mmap_mode=mode)
+        self.coef_t = np.load(path / "coef_t.npy", mmap_mode=mode)
+        self.intercept = np.load(path / "intercept.npy", mmap_mode=mode)
+
+        self.path = path
+        self.meta = meta
+        self.classes: List[str] = meta["classes"]
+        self.classes_ = np.array(self.classes)
+        self.n_features = int(meta["n_features"]) if self.hashing else len(self.idf)
+        self.proba_mode = meta["proba"]
+        self._lowercase = meta["lowercase"]
+        self._token_re = re.compile(meta["token_pattern"])
+        self._min_n, self._max_n = meta["ngram_range"]
+        self._stop = frozenset(meta["stop_words"])
+        self._norm = meta["norm"]
+
+    @classmethod
+    def exists(cls, path) -> bool:
+        return os.path.exists(Path(path) / "meta.json")
+
+    # ---- vectorization ----
+    def analyze(self, text: str) -> List[str]:
+        """Same tokens/n-grams TfidfVectorizer(analyzer="word") would produce."""
+        if self._lowercase:
+            text = text.lower()
+        tokens = [t for t in self._token_re.findall(text) if t not in self._stop]
+        min_n, max_n = self._min_n, self._max_n
+        grams = list(tokens) if min_n == 1 else []
+        for n in range(max(min_n, 2), min(max_n, len(tokens)) + 1):
+            grams.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return grams
+
+    def features(self, messages: Iterable[str]) -> Tuple[int, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return (n_rows, row, col, weight) triplets of the normalized TF-IDF matrix, in the
+        same columns as the sklearn vectorizer's output (hashing artifacts: every hash
+        column of the message, including those the model stores no weight for).
+        """
+        rows: List[int] = []
+        grams: List[str] = []
+        n = 0
+        for n, text in enumerate(messages, start=1):
+            g = self.analyze(text)
+            grams.extend(g)
+            rows.extend([n - 1] * len(g))
+
+        if not grams:
+            empty = np.empty(0, dtype=np.int64)
+            return n, empty, empty, np.empty(0)
+        if self.hashing:
+            return self._hashed_features(n, rows, grams)
+
+        grams_arr = np.array(grams)
+        pos = np.searchsorted(self.terms, grams_arr)
+        pos[pos >= len(self.terms)] = 0
+        hit = self.terms[pos] == grams_arr
+        col = self.cols[pos[hit]].astype(np.int64)
+        row = np.asarray(rows, dtype=np.int64)[hit]
+
+        # Merge repeated (row, col) pairs into term counts.
+        keys, counts = np.unique(row * self.n_features + col, return_counts=True)
+        row, col = keys // self.n_features, keys % self.n_features
+        weight = self._normalize(n, row, counts * self.idf[col])
+        return n, row, col, weight
+
+    def _hashed_features(self, n: int, rows: List[int], grams: List[str]):
+        hash_ = self._hash
+        col = np.fromiter((hash_(g) for g in grams), dtype=np.int64, count=len(grams))
+        keys, counts = np.unique(np.asarray(rows, dtype=np.int64) * self.n_features + col, return_counts=True)
+        row, col = keys // self.n_features, keys % self.n_features
+
+        # Columns the model doesn't store still count towards the norm, at idf_default.
+        hit, pos = self._stored(col)
+        idf = np.where(hit, self.idf[pos], self._idf_default)
+        return n, row, col, self._normalize(n, row, counts * idf)
+
+    def _stored(self, col: np.ndarray) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """(mask of columns the artifact stores or None for all, their rows in idf / coef_t)."""
+        if not self.hashing:
+            return None, col
+        pos = np.searchsorted(self.hash_cols, col)
+        pos[pos >= len(self.hash_cols)] = 0
+        return self.hash_cols[pos] == col, pos
+
+    def _normalize(self, n: int, row: np.ndarray, weight: np.ndarray) -> np.ndarray:
+        if self._norm == "l2":
+            sq = np.bincount(row, weights=weight * weight, minlength=n)
+            weight = weight / np.sqrt(sq[row])
+        elif self._norm == "l1":
+            s = np.bincount(row, weights=np.abs(weight), minlength=n)
+            weight = weight / s[row]
+        return weight
+
+    # ---- scoring ----
+    def _timed_features(self, messages: Iterable[str], timings: Optional[Dict[str, int]]):
+        t0 = time.perf_counter_ns()
+        features = self.features(messages)
+        if timings is not None:
+            timings["vectorize"] = timings.get("vectorize", 0) + (time.perf_counter_ns() - t0)
+        return features
+
+    def decision_from_features(self, features: Tuple[int, np.ndarray, np.ndarray, np.ndarray]) -> np.ndarray:
+        """decision_function() of already vectorized messages (features() output)."""
+        n, row, col, weight = features
+        scores = np.tile(np.asarray(self.intercept), (n, 1))
+        if len(row):
+            hit, pos = self._stored(col)
+            if hit is not None:
+                row, pos, weight = row[hit], pos[hit], weight[hit]
+            np.add.at(scores, row, weight[:, None] * self.coef_t[pos])
+        return scores[:, 0] if scores.shape[1] == 1 else scores
+
+    def decision_function(self, messages: Iterable[str], timings: Optional[Dict[str, int]] = None) -> np.ndarray:
+        return self.decision_from_features(self._timed_features(messages, timings))
+
+    def predict_proba(self, messages: Iterable[str], timings: Optional[Dict[str, int]] = None) -> np.ndarray:
+        return self._proba(self.decision_function(messages, timings))
+
+    def _proba(self, d: np.ndarray) -> np.ndarray:
+        if self.proba_mode == "softmax":
+            if d.ndim == 1:
+                d = np.c_[-d, d]
+            d = d - d.max(axis=1, keepdims=True)
+            e = np.exp(d)
+            return e / e.sum(axis=1, keepdims=True)
+        if self.proba_mode == "ovr":
+            p = 1.0 / (1.0 + np.exp(-d))
+            if p.ndim == 1:
+                return np.c_[1 - p, p]
+            return p / p.sum(axis=1, keepdims=True)
+        raise AttributeError("this model has no predict_proba")
+
+    def score(self, messages: List[str], timings: Optional[Dict[str, int]] = None) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        (class indices, confidences); confidences are None for models without probabilities.
+        `timings` works as in InferenceBundle.score ("vectorize" = features(), the rest is "predict").
+        """
+        return self.score_features(self._timed_features(messages, timings), timings)
+
+    def score_features(self, features: Tuple[int, np.ndarray, np.ndarray, np.ndarray],
+                       timings: Optional[Dict[str, int]] = None) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """score() of already vectorized messages (features() output)."""
+        t0 = time.perf_counter_ns()
+        d = self.decision_from_features(features)
+        if self.proba_mode == "none":
+            out = ((d > 0).astype(np.intp) if d.ndim == 1 else d.argmax(axis=1)), None
+        else:
+            P = self._proba(d)
+            idx = P.argmax(axis=1)
+            out = idx, P[np.arange(len(idx)), idx]
+        if timings is not None:
+            timings["predict"] = timings.get("predict", 0) + (time.perf_counter_ns() - t0)
+        return out
@@ -0,0 +1,203 @@
+"""
+serve.py
+Production launcher for Candy AI Clone chatbot (the `__main__` block in app.py is the dev server).
+- Binds the listening socket and imports app.py (model artifacts, intents, moderation) in the parent
+- Optionally gc.freeze()s the loaded heap, then forks WORKERS uvicorn servers sharing the socket,
+  so artifact pages stay shared copy-on-write instead of being loaded once per worker
+- Restarts workers that die; SIGTERM/SIGINT shut all of them down
+- worker_memory(): per-worker RSS / PSS / shared bytes from /proc (shown on /stats)
+
+Usage:
+    python serve.py [--workers N] [--host 0.0.0.0] [--port 8000]
+
+Notes:
+- Each worker keeps its own in-memory reply cache and rate-limit buckets; use
+  RATE_LIMIT_BACKEND=sqlite for limits shared across workers.
+- POST /reload reaches a single worker; set ARTIFACT_WATCH=true so every worker
+  picks up retrained artifacts (reloaded artifacts are private to each worker).
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from config import settings
+
+MASTER_PID_ENV = "CANDY_SERVE_MASTER_PID"
+SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared_clean",
+    "Shared_Dirty": "shared_dirty",
+    "Private_Clean": "private_clean",
+    "Private_Dirty": "private_dirty",
+}
+
+
+# -------------------------
+# Memory accounting
+# -------------------------
+def process_memory(pid: int) -> Optional[Dict[str, int]]:
+    """Bytes from /proc/<pid>/smaps_rollup (Linux 4.14+); None if unavailable."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    mem: Dict[str, int] = {}
+    for line in lines:
+        name, _, rest = line.partition(":")
+        key = SMAPS_FIELDS.get(name)
+        if key is not None:
+            mem[key] = int(rest.split()[0]) * 1024  # values are in kB
+    mem["shared"] = mem.get("shared_clean", 0) + mem.get("shared_dirty", 0)
+    return mem
+
+
+def _children(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", "r") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def worker_memory() -> Dict[str, Any]:
+    """
+    Memory of every worker started by the same serve.py master (just this process
+    when running without it). PSS splits shared pages evenly between the processes
+    mapping them, so sum(pss) is the real footprint of the worker pool.
+    """
+    master = os.environ.get(MASTER_PID_ENV)
+    pids = _children(int(master)) if master else []
+    if not pids:
+        pids = [os.getpid()]
+    workers = []
+    for pid in pids:
+        mem = process_memory(pid)
+        if mem is not None:
+            workers.append({"pid": pid, "self": pid == os.getpid(), **mem})
+    return {
+        "master_pid": int(master) if master else None,
+        "master": process_memory(int(master)) if master else None,
+        "workers": workers,
+        "total_rss": sum(w.get("rss", 0) for w in workers),
+        "total_pss": sum(w.get("pss", 0) for w in workers),
+    }
+
+
+# -------------------------
+# Launcher
+# -------------------------
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket):
+    """Child process body: a plain uvicorn server on the inherited socket."""
+    import uvicorn
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_level=settings.LOG_LEVEL.lower(), lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Master:
+    def __init__(self, app, sock: socket.socket, workers: int):
+        self.app = app
+        self.sock = sock
+        self.n = workers
+        self.pids: Dict[int, int] = {}  # pid -> slot
+        self.stopping = False
+
+    def spawn(self, slot: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.app, self.sock)
+            except BaseException as e:
+                print(f"[WARN] Worker {os.getpid()} crashed: {e}", file=sys.stderr)
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        self.pids[pid] = slot
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        for slot in range(self.n):
+            self.spawn(slot)
+        print(f"[INFO] Master {os.getpid()} started {self.n} workers: {sorted(self.pids)}")
+
+        while self.pids:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            slot = self.pids.pop(pid, None)
+            if slot is None or self.stopping:
+                continue
+            print(f"[WARN] Worker {pid} exited (status {status}); restarting")
+            time.sleep(0.5)  # don't spin if workers die on startup
+            self.spawn(slot)
+        self.sock.close()
+        print("[INFO] All workers stopped")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the chatbot API with pre-forked uvicorn workers.")
+    parser.add_argument("--workers", type=int, default=settings.WORKERS, help="0 = one per CPU core")
+    parser.add_argument("--host", default=settings.HOST)
+    parser.add_argument("--port", type=int, default=settings.PORT)
+    args = parser.parse_args(argv)
+
+    workers = args.workers or len(os.sched_getaffinity(0))
+    sock = bind_socket(args.host, args.port)
+    os.environ[MASTER_PID_ENV] = str(os.getpid())
+
+    # Everything app.py loads at import (artifacts, intents, moderation automata)
+    # is created here once and inherited by the workers.
+    if settings.LAZY_STARTUP:
+        print("[WARN] LAZY_STARTUP is on: every worker loads its own copy of the artifacts after fork")
+    t0 = time.perf_counter()
+    from app import app
+    print(f"[INFO] Loaded app in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    if settings.GC_FREEZE_AFTER_LOAD:
+        # Move the loaded heap out of the collector's reach: otherwise every collection
+        # in a worker writes GC headers on inherited objects and un-shares their pages.
+        gc.collect()
+        gc.freeze()
+        print(f"[INFO] gc.freeze(): {gc.get_freeze_count()} objects")
+
+    print(f"[INFO] Serving on http://{args.host}:{args.port} with {workers} workers")
+    Master(app, sock, workers).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+sessions.py
+In-process conversation sessions for Candy AI Clone chatbot, keyed by user_id.
+- Session: a __slots__ record holding a fixed-size ring buffer of the user's recent turns
+  (intent, response index), so its size never grows with the conversation
+- SessionStore: OrderedDict in LRU order; get / record / evict are O(1)
+- Hard memory budget (SESSION_MEMORY_MB): every session is charged its estimated size and
+  the least recently used ones are evicted past the budget; idle sessions
+  (SESSION_IDLE_S) are evicted from the LRU end as the store is used
+- Write-behind persistence to the sessions table (database.py): changed sessions are
+  upserted in batches by a background thread; a user missing from memory is warmed from
+  the table on first access
+- Response rotation: next_choice() picks the response after the one this user last got
+  for the same intent
+
+Start it after forking (threads do not survive fork) and close() on shutdown.
+"""
+
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from database import load_session, save_sessions
+
+# Per-entry cost of the OrderedDict (hash slot + entry + linked-list node), measured on CPython 3.11.
+ENTRY_OVERHEAD = 104
+
+
+class Session:
+    """Recent turns of one user; turns[2*i] is an intent, turns[2*i + 1] the response index given."""
+
+    __slots__ = ("user_id", "turns", "head", "size", "last_seen", "dirty")
+
+    def __init__(self, user_id: str, max_turns: int):
+        self.user_id = user_id
+        self.turns: List[Any] = [None] * (2 * max_turns)
+        self.head = 0  # slot the next turn's intent is written to (always even)
+        self.size = 0
+        self.last_seen = 0.0
+        self.dirty = False
+
+    def add(self, intent: str, choice: int):
+        turns, h = self.turns, self.head
+        turns[h] = intent
+        turns[h + 1] = choice
+        h += 2
+        self.head = 0 if h == len(turns) else h
+        if self.size < len(turns) >> 1:
+            self.size += 1
+
+    def _slots_newest_first(self):
+        n = len(self.turns)
+        return ((self.head - 2 * i) % n for i in range(1, self.size + 1))
+
+    def recent(self) -> List[Tuple[str, int]]:
+        """Turns oldest first."""
+        turns = self.turns
+        return [(turns[j], turns[j + 1]) for j in reversed(list(self._slots_newest_first()))]
+
+    @property
+    def last_intent(self) -> Optional[str]:
+        return self.turns[(self.head - 2) % len(self.turns)] if self.size else None
+
+    def next_choice(self, intent: str, n_responses: int) -> int:
+        """Index of the response after the last one given for `intent` (0 if none in the buffer)."""
+        if n_responses <= 1:
+            return 0
+        turns = self.turns
+        for j in self._slots_newest_first():
+            if turns[j] == intent:
+                return (turns[j + 1] + 1) % n_responses
+        return 0
+
+
+class SessionStore:
+    def __init__(
+        self,
+        max_turns: int = 8,
+        memory_bytes: int = 128 * 1024 * 1024,
+        idle_seconds: float = 1800.0,
+        flush_interval: float = 5.0,
+        persist: bool = True,
+    ):
+        self.max_turns = max(1, max_turns)
+        self.memory_bytes = memory_bytes
+        self.idle_seconds = idle_seconds
+        self.flush_interval = flush_interval
+        self.persist = persist
+        probe = Session("", self.max_turns)
+        # Fixed part of a session's cost; the user_id string is added per session.
+        self._base_bytes = sys.getsizeof(probe) + sys.getsizeof(probe.turns) + sys.getsizeof(0.0) + ENTRY_OVERHEAD
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._dirty: Set[str] = set()  # changed since the last flush
+        self._unsaved: Dict[str, List] = {}  # evicted before their changes were written
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.warmed = 0
+        self.evicted_lru = 0
+        self.evicted_idle = 0
+        self.written = 0
+        self.errors = 0
+
+    # ---- lifecycle ----
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running or not self.persist:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout: float = 5.0):
+        """Stop the writer thread and write every changed session."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+        if self.persist:
+            self.flush()
+
+    # ---- access ----
+    def _cost(self, session: Session) -> int:
+        return self._base_bytes + sys.getsizeof(session.user_id)
+
+    def _load(self, user_id: str) -> Session:
+        session = Session(user_id, self.max_turns)
+        if self.persist:
+            turns = self._unsaved.get(user_id)
+            if turns is None:
+                try:
+                    turns = load_session(user_id)
+                except sqlite3.Error:
+                    self.errors += 1
+            if turns:
+                for intent, choice in turns[-self.max_turns:]:
+                    session.add(sys.intern(intent), choice)
+                self.warmed += 1
+        return session
+
+    def get(self, user_id: str) -> Session:
+        """
+        The user's session; created (warmed from the database if persisted) on a miss.
+        A miss is a blocking SQLite read: async callers check peek() and call this in a thread.
+        """
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is not None:
+                self._sessions.move_to_end(user_id)
+                session.last_seen = now
+                self.hits += 1
+                return session
+        self.misses += 1
+        loaded = self._load(user_id)  # SQLite point read, outside the lock
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is None:  # nobody else loaded it meanwhile
+                session = self._sessions[user_id] = loaded
+                self.bytes += self._cost(session)
+            session.last_seen = now
+            self._evict(now)
+            return session
+
+    def record(self, session: Session, intent: str, choice: int):
+        """
+        Append a turn. The session may have been evicted by another thread since get():
+        the turn goes to whichever session is resident for the user, re-inserting this one
+        if none is, so it is never added to an orphan that no flush will see.
+        """
+        with self._lock:
+            current = self._sessions.get(session.user_id)
+            if current is None:
+                self._sessions[session.user_id] = session
+                self.bytes += self._cost(session)
+                session.dirty = False  # a flush may have dropped it from _dirty; mark it again below
+            elif current is not session:
+                session = current
+            session.add(sys.intern(intent), choice)
+            if not session.dirty:
+                session.dirty = True
+                self._dirty.add(session.user_id)
+
+    def peek(self, user_id: str) -> Optional[Session]:
+        """In-memory session without touching LRU order or the database."""
+        return self._sessions.get(user_id)
+
+    def _evict(self, now: float, idle_checks: int = 4):
+        """
+        Drop LRU sessions past the memory budget, and up to `idle_checks` idle ones
+        (a handful per request keeps the idle tail short). Caller holds the lock.
+        """
+        sessions = self._sessions
+        idle_before = now - self.idle_seconds
+        while sessions:
+            user_id, oldest = next(iter(sessions.items()))
+            if self.bytes > self.memory_bytes:
+                self.evicted_lru += 1
+            elif idle_checks and oldest.last_seen < idle_before:
+                idle_checks -= 1
+                self.evicted_idle += 1
+            else:
+                break
+            del sessions[user_id]
+            self.bytes -= self._cost(oldest)
+            if oldest.dirty and self.persist:
+                self._unsaved[user_id] = oldest.recent()
+
+    # ---- persistence ----
+    def flush(self):
+        """Upsert changed sessions (and ones evicted since the last flush) in one transaction."""
+        with self._lock:
+            rows, dirty = self._unsaved, self._dirty
+            self._unsaved, self._dirty = {}, set()
+            for user_id in dirty:
+                session = self._sessions.get(user_id)
+                if session is not None and session.dirty:
+                    rows[user_id] = session.recent()
+                    session.dirty = False
+        if not rows:
+            return
+        try:
+            save_sessions(list(rows.items()))
+            self.written += len(rows)
+        except sqlite3.Error:
+            self.errors += 1
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            with self._lock:
+                self._evict(time.monotonic(), idle_checks=10000)
+
+    def stats(self) -> Dict[str, Any]:
+        n = len(self._sessions)
+        return {
+            "sessions": n,
+            "bytes": self.bytes,
+            "budget_bytes": self.memory_bytes,
+            "bytes_per_session": round(self.bytes / n, 1) if n else self._base_bytes,
+            "max_turns": self.max_turns,
+            "hits": self.hits,
+            "misses": self.misses,
+            "warmed_from_db": self.warmed,
+            "evicted_lru": self.evicted_lru,
+            "evicted_idle": self.evicted_idle,
+            "written": self.written,
+            "errors": self.errors,
+            "writer_running": self.running,
+        }
@@ -0,0 +1,123 @@
+"""
+test_cache.py
+ReplyCache (cache.py): entries are tied to the generation of the bundle that produced them.
+- invalidate() bumps the generation and empties the cache
+- lookups with another generation miss (and drop the entry); stale puts are ignored
+- ArtifactManager reload / rollback stamp each published bundle with a fresh generation,
+  as app.py does with before_publish
+- LRU eviction, TTL expiry and the counters /stats reports
+
+Run from the repo root:  python -m pytest -q tests
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cache import ReplyCache  # noqa: E402
+from inference import ArtifactManager  # noqa: E402
+
+
+class StubBundle:
+    """Just what ArtifactManager touches on a bundle."""
+
+    generation = 0
+    version = None
+    loaded_at = None
+
+    def smoke_test(self):
+        pass
+
+
+# -------------------------
+# generations
+# -------------------------
+def test_hit_within_generation():
+    cache = ReplyCache()
+    cache.put("hello", ("greeting", 0.9), cache.generation)
+    assert cache.get("hello", cache.generation) == ("greeting", 0.9)
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_invalidate_bumps_generation_and_drops_entries():
+    cache = ReplyCache()
+    old = cache.generation
+    cache.put("hello", ("greeting", 0.9), old)
+    new = cache.invalidate()
+    assert new == old + 1 == cache.generation
+    assert cache.stats()["size"] == 0
+    assert cache.get("hello", new) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_lookup_with_other_generation_misses_and_drops_entry():
+    cache = ReplyCache()
+    gen = cache.generation
+    cache.put("hello", ("greeting", 0.9), gen)
+    assert cache.get("hello", gen + 1) is None
+    assert cache.get("hello", gen) is None  # a mismatched entry is gone, not kept for later
+    assert cache.expirations == 0
+
+
+def test_put_from_replaced_bundle_is_ignored():
+    # A request classified against the old bundle finishes after a reload: its result must not be cached.
+    cache = ReplyCache()
+    old = cache.generation
+    new = cache.invalidate()
+    cache.put("hello", ("greeting", 0.9), old)
+    assert cache.get("hello", old) is None
+    assert cache.get("hello", new) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_artifact_manager_publishes_a_new_generation_each_time():
+    cache = ReplyCache()
+
+    def stamp(bundle):
+        bundle.generation = cache.invalidate()
+
+    manager = ArtifactManager(StubBundle, lambda: [], before_publish=stamp)
+    first = manager.reload()
+    cache.put("hello", "first", first.generation)
+    second = manager.reload()
+    assert second.generation > first.generation
+    assert cache.get("hello", second.generation) is None
+    cache.put("hello", "second", second.generation)
+
+    back = manager.rollback()
+    assert back is first
+    assert first.generation > second.generation  # rolled-back bundle never sees entries cached since
+    assert cache.get("hello", back.generation) is None
+    assert cache.get("hello", second.generation) is None
+
+
+# -------------------------
+# bounds
+# -------------------------
+def test_lru_eviction():
+    cache = ReplyCache(max_size=2)
+    gen = cache.generation
+    cache.put("a", 1, gen)
+    cache.put("b", 2, gen)
+    cache.get("a", gen)  # "b" is now least recently used
+    cache.put("c", 3, gen)
+    assert cache.get("b", gen) is None
+    assert (cache.get("a", gen), cache.get("c", gen)) == (1, 3)
+    assert cache.evictions == 1
+
+
+def test_ttl_expiry():
+    cache = ReplyCache(ttl_seconds=0.01)
+    cache.put("hello", 1, cache.generation)
+    time.sleep(0.02)
+    assert cache.get("hello", cache.generation) is None
+    assert cache.expirations == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ReplyCache(max_size=0)
+    cache.put("hello", 1, cache.generation)
+    assert cache.get("hello", cache.generation) is None
+    assert cache.stats()["size"] == 0
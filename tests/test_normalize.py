@@ -0,0 +1,114 @@
+"""
+test_normalize.py
+Golden cases for normalize.py and the utils wrappers built on it.
+- normalize() / normalize_batch(): what reply cache keys and moderation see
+- tokenize() / tokenize_batch(): must match the vectorizer's own analyzer token for token
+- utils.clean_text / utils.tokenize: thin wrappers; tokenize now follows the vectorizer
+  (TOKEN_PATTERN) instead of nltk's word_tokenize
+
+Run from the repo root:  python -m pytest -q tests
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import utils  # noqa: E402
+from normalize import (  # noqa: E402
+    SEPARATOR, TOKEN_PATTERN, normalize, normalize_batch, tokenize, tokenize_batch,
+)
+
+GOLDEN = [
+    # (message, normalize(), tokenize())
+    ("Hello!!! How much for your SERVICES???", "hello how much for your services",
+     ["hello", "how", "much", "for", "your", "services"]),
+    ("  what's   the\tprice,\nreally? ", "what s the price really", ["what", "the", "price", "really"]),
+    ("I need help w/ my acc0unt #42 :)", "i need help w my acc0unt 42", ["need", "help", "my", "acc0unt", "42"]),
+    ("snake_case and-dashes", "snake case and dashes", ["snake_case", "and", "dashes"]),
+    ("Ça VA? Très BIEN… merci", "ça va très bien… merci", ["ça", "va", "très", "bien", "merci"]),
+    ("ΟΔΟΣ", "οδος", ["οδος"]),
+    ("it’s “quoted”", "it’s “quoted”", ["it", "quoted"]),
+    ("a b c", "a b c", []),
+    ("bad\x00byte", "bad\x00byte", ["bad", "byte"]),
+    ("", "", []),
+    ("!!!", "", []),
+]
+MESSAGES = [m for m, _, _ in GOLDEN]
+IDS = [repr(m)[:24] for m in MESSAGES]
+# Every code point up to U+3000 in 40-character runs: word/non-word classes, case folding.
+CODE_POINT_RUNS = ["".join(chr(c) for c in range(k, k + 40)) for k in range(0, 0x3000, 40)]
+
+
+# -------------------------
+# normalize
+# -------------------------
+@pytest.mark.parametrize("message, expected, _", GOLDEN, ids=IDS)
+def test_normalize(message, expected, _):
+    assert normalize(message) == expected
+
+
+def test_normalize_batch_matches_per_message():
+    assert normalize_batch(MESSAGES) == [expected for _, expected, _ in GOLDEN]
+
+
+def test_normalize_batch_iterator_and_chunks():
+    messages = MESSAGES * 5
+    expected = [normalize(m) for m in messages]
+    assert normalize_batch(iter(messages)) == expected
+    assert normalize_batch(messages, chunk_size=3) == expected
+
+
+def test_normalize_batch_separator_in_message():
+    # A message containing the join separator falls back to per-message for its chunk.
+    messages = ["A" + SEPARATOR + "B!", "Hello, World"]
+    assert normalize_batch(messages) == [normalize(m) for m in messages]
+
+
+def test_normalize_batch_empty():
+    assert normalize_batch([]) == []
+
+
+# -------------------------
+# tokenize
+# -------------------------
+@pytest.mark.parametrize("message, _, expected", GOLDEN, ids=IDS)
+def test_tokenize(message, _, expected):
+    assert tokenize(message) == expected
+
+
+def test_tokenize_batch_matches_per_message():
+    assert tokenize_batch(MESSAGES) == [expected for _, _, expected in GOLDEN]
+    assert tokenize_batch(iter(MESSAGES * 3), chunk_size=4) == [tokenize(m) for m in MESSAGES * 3]
+
+
+@pytest.mark.parametrize("messages", [MESSAGES, CODE_POINT_RUNS], ids=["golden", "code points"])
+def test_tokenize_matches_vectorizer_analyzer(messages):
+    text = pytest.importorskip("sklearn.feature_extraction.text")
+    analyze = text.TfidfVectorizer(token_pattern=TOKEN_PATTERN).build_analyzer()
+    expected = [analyze(m) for m in messages]
+    assert [tokenize(m) for m in messages] == expected
+    assert tokenize_batch(messages) == expected
+
+
+# -------------------------
+# utils wrappers
+# -------------------------
+@pytest.mark.parametrize("message, expected, _", GOLDEN, ids=IDS)
+def test_utils_clean_text(message, expected, _):
+    assert utils.clean_text(message) == expected
+
+
+@pytest.mark.parametrize("message, expected", [
+    # Vectorizer tokens: lowercased, two or more word characters, punctuation dropped.
+    ("Hello, World!", ["hello", "world"]),
+    ("What's the price?", ["what", "the", "price"]),
+    ("I need a plan", ["need", "plan"]),
+    ("snake_case", ["snake_case"]),
+    ("", []),
+])
+def test_utils_tokenize(message, expected):
+    assert utils.tokenize(message) == expected
+    assert utils.tokenize(message) == tokenize(message)
@@ -0,0 +1,150 @@
+"""
+test_ratelimit.py
+Token buckets (ratelimit.py), run against both stores with explicit clocks.
+- burst requests pass, the next waits exactly until one token has refilled
+- refill is continuous and capped at the burst; buckets are per key
+- a cost above the burst passes on a full bucket and leaves it in debt
+- client_key(): allowlisted API key, else the client IP
+- RateLimitMiddleware: 429 + Retry-After (whole seconds, at least 1) on limited paths only
+
+Run from the repo root:  python -m pytest -q tests
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ratelimit import MemoryBucketStore, RateLimitMiddleware, SqliteBucketStore, client_key  # noqa: E402
+
+PER_MINUTE = 60  # one token per second
+BURST = 3
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(per_minute=PER_MINUTE, burst=BURST):
+        if request.param == "memory":
+            return MemoryBucketStore(per_minute, burst, shards=4)
+        return SqliteBucketStore(tmp_path / "buckets.db", per_minute, burst)
+    return make
+
+
+# -------------------------
+# buckets
+# -------------------------
+def test_burst_then_limited(make_store):
+    store = make_store()
+    assert [store.take("a", now=100.0) for _ in range(BURST)] == [0.0] * BURST
+    assert store.take("a", now=100.0) == pytest.approx(1.0)
+    assert store.take("a", now=100.25) == pytest.approx(0.75)
+    assert (store.allowed, store.limited) == (BURST, 2)
+
+
+def test_refill_is_continuous_and_capped(make_store):
+    store = make_store()
+    for _ in range(BURST):
+        store.take("a", now=0.0)
+    assert store.take("a", now=1.0) == 0.0  # one token back after a second
+    assert store.take("a", now=1.0) > 0
+    # Idle far longer than a refill: back to the burst, not beyond it.
+    assert [store.take("a", now=1000.0) for _ in range(BURST)] == [0.0] * BURST
+    assert store.take("a", now=1000.0) > 0
+
+
+def test_buckets_are_per_key(make_store):
+    store = make_store()
+    for _ in range(BURST):
+        store.take("a", now=0.0)
+    assert store.take("a", now=0.0) > 0
+    assert store.take("b", now=0.0) == 0.0
+
+
+def test_cost_above_burst_leaves_debt(make_store):
+    # A batch of 5 on a full bucket of 3 passes, then the bucket is 2 tokens in debt.
+    store = make_store()
+    assert store.take("a", now=0.0, cost=5) == 0.0
+    assert store.take("a", now=0.0) == pytest.approx(3.0)  # -2 -> +1 takes three seconds
+    assert store.take("a", now=3.0) == 0.0
+
+
+def test_oversized_cost_waits_for_a_full_bucket(make_store):
+    store = make_store()
+    store.take("a", now=0.0)
+    assert store.take("a", now=0.0, cost=10) == pytest.approx(1.0)  # needs the burst (3), has 2
+
+
+def test_zero_rate_never_refills(make_store):
+    store = make_store(per_minute=0, burst=1)
+    assert store.take("a", now=0.0) == 0.0
+    assert store.take("a", now=1e9) == float("inf")
+
+
+def test_memory_store_drops_refilled_buckets():
+    store = MemoryBucketStore(PER_MINUTE, BURST, shards=1)
+    store.take("a", now=0.0)
+    store.take("b", now=100.0)  # "a" has refilled: dropped on sight
+    assert store.stats()["keys"] == 1
+    assert store.evictions == 1
+
+
+# -------------------------
+# client_key
+# -------------------------
+@pytest.mark.parametrize("headers, client, expected", [
+    ([(b"x-api-key", b"good")], ("1.2.3.4", 5), "key:good"),
+    ([(b"x-api-key", b"forged")], ("1.2.3.4", 5), "ip:1.2.3.4"),
+    ([], ("1.2.3.4", 5), "ip:1.2.3.4"),
+    ([(b"x-api-key", b"good")], None, "key:good"),
+    ([], None, "ip:unknown"),
+])
+def test_client_key(headers, client, expected):
+    assert client_key(headers, client, b"x-api-key", {"good"}) == expected
+
+
+def test_client_key_without_allowlist_ignores_header():
+    assert client_key([(b"x-api-key", b"anything")], ("1.2.3.4", 5), b"x-api-key", ()) == "ip:1.2.3.4"
+
+
+# -------------------------
+# middleware
+# -------------------------
+@pytest.fixture
+def client(make_store):
+    testclient = pytest.importorskip("starlette.testclient")
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse
+    from starlette.routing import Route
+
+    async def ok(request):
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/chat", ok, methods=["POST"]), Route("/health", ok)])
+    store = make_store(per_minute=6, burst=2)  # a token every ten seconds
+    app = RateLimitMiddleware(app, store, paths=("/chat",), api_keys={"good"})
+    return testclient.TestClient(app)
+
+
+def test_middleware_answers_429_with_retry_after(client):
+    assert [client.post("/chat").status_code for _ in range(2)] == [200, 200]
+    r = client.post("/chat")
+    assert r.status_code == 429
+    assert r.json() == {"detail": "rate limit exceeded"}
+    assert 1 <= int(r.headers["retry-after"]) <= 10
+
+
+def test_middleware_skips_other_paths(client):
+    for _ in range(2):
+        client.post("/chat")
+    assert client.post("/chat").status_code == 429
+    assert all(client.get("/health").status_code == 200 for _ in range(5))
+
+
+def test_middleware_api_key_gets_its_own_bucket(client):
+    for _ in range(2):
+        client.post("/chat")
+    assert client.post("/chat").status_code == 429
+    assert client.post("/chat", headers={"x-api-key": "good"}).status_code == 200
+    assert client.post("/chat", headers={"x-api-key": "forged"}).status_code == 429
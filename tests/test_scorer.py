@@ -0,0 +1,108 @@
+"""
+test_scorer.py
+Parity of the compact NumPy scorer (scorer.py) with the sklearn pipeline it was exported from.
+- tfidf (vocabulary) and hashing (HashingVectorizer + TfidfTransformer, sparsified coef_) artifacts
+- scores: same predicted class, probabilities to 1e-9
+- classify() with the low-confidence nearest-pattern fallback (nearest.py): same intent,
+  confidence and fallback meta whichever bundle vectorized the message
+
+Trains small models on the repo's intents.json into a temporary directory.
+Run from the repo root:  python -m pytest -q tests
+"""
+
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+pytest.importorskip("sklearn")
+
+from inference import InferenceBundle  # noqa: E402
+from nearest import NearestIndex, export_nearest  # noqa: E402
+from scorer import CompactScorer, check_parity, export_compact  # noqa: E402
+from train import build_pipeline, default_config, load_dataset  # noqa: E402
+
+INTENTS = ROOT / "intents.json"
+MODES = ["tfidf", "hashing"]
+CONFIDENCE_THRESHOLD = 0.55
+MIN_SIMILARITY = 0.3
+
+
+def messages(patterns):
+    """The training patterns, random recombinations of their words, and text the model never saw."""
+    words = [w for p in patterns for w in p.lower().split()]
+    rng = random.Random(0)
+    mixed = [" ".join(rng.choice(words) for _ in range(rng.randint(1, 4))) for _ in range(1500)]
+    return list(patterns) + mixed + ["", "!!!", "zzz qqq", "HELLO hello Hello", "price price price"]
+
+
+@pytest.fixture(scope="module", params=MODES)
+def trained(request, tmp_path_factory):
+    intents, patterns, tags = load_dataset(INTENTS)
+    config = dict(default_config(), vectorizer=request.param, classifier="logreg")
+    pipeline = build_pipeline(config, len(patterns))
+    pipeline.fit(patterns, tags)
+    if "hash" in pipeline.named_steps:
+        pipeline.steps[-1][1].sparsify()  # as train.py stores hashing models
+    out = tmp_path_factory.mktemp(request.param)
+    compact_dir = export_compact(pipeline, out / "compact")
+    nearest_dir = export_nearest(pipeline, patterns, tags, out / "nearest")
+    return pipeline, intents, CompactScorer(compact_dir), nearest_dir, messages(patterns)
+
+
+# -------------------------
+# scores
+# -------------------------
+def test_export_records_vectorizer_mode(trained):
+    pipeline, _, scorer, _, _ = trained
+    assert scorer.hashing == ("hash" in pipeline.named_steps)
+
+
+def test_compact_scores_match_sklearn(trained):
+    pipeline, _, scorer, _, msgs = trained
+    check_parity(pipeline, scorer, msgs)  # raises on any disagreement
+
+
+def test_compact_features_match_sklearn(trained):
+    # Same columns and weights as the sklearn vectorizer, hashing columns the model stores nothing for included.
+    pipeline, _, scorer, _, msgs = trained
+    X = pipeline[:-1].transform(msgs).tocoo()
+    n, row, col, weight = scorer.features(msgs)
+    assert n == X.shape[0]
+    expected = sorted(zip(X.row.tolist(), X.col.tolist(), X.data.round(9).tolist()))
+    assert sorted(zip(row.tolist(), col.tolist(), weight.round(9).tolist())) == expected
+
+
+# -------------------------
+# classify() with the nearest-pattern fallback
+# -------------------------
+def bundles(trained):
+    pipeline, intents, scorer, nearest_dir, _ = trained
+    pair = InferenceBundle(pipeline, None, intents), InferenceBundle(scorer, None, intents)
+    for bundle in pair:
+        bundle.set_fallback(CONFIDENCE_THRESHOLD, NearestIndex(nearest_dir), MIN_SIMILARITY)
+    return pair
+
+
+def test_classify_with_nearest_fallback_matches(trained):
+    sk, compact = bundles(trained)
+    msgs = trained[-1]
+    expected, got = sk.classify(msgs), compact.classify(msgs)
+    for m, a, b in zip(msgs, expected, got):
+        assert (b["intent"], b["reply"]) == (a["intent"], a["reply"]), m
+        assert b["confidence"] == pytest.approx(a["confidence"], abs=1e-9), m
+        assert b["meta"] == pytest.approx(a["meta"], abs=1e-6) if a["meta"] else b["meta"] is None, m
+    sources = {(r.get("meta") or {}).get("source") for r in expected}
+    assert {"nearest", "fallback"} <= sources  # both fallback outcomes were exercised
+
+
+def test_fallback_rows_are_sliced_from_the_batch(trained):
+    # Low-confidence rows are looked up from the batch's own features; alone or in a batch, same answer.
+    _, compact = bundles(trained)
+    msgs = trained[-1][:200]
+    batch = compact.classify(msgs)
+    assert [compact.classify([m])[0] for m in msgs] == batch
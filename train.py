@@ -4,106 +4,358 @@ train.py
 Training pipeline for Candy AI Clone (NSFW chatbot).
 - Reads intents.json
 - Builds dataset (patterns → tags)
-- Trains a classifier with TF-IDF
+- Trains a classifier with TF-IDF (vocabulary, or feature hashing + idf with VECTORIZER_MODE=hashing)
 - Saves model + vectorizer artifacts
+- Exports a compact, memory-mappable NumPy copy of the model (see scorer.py)
 - Prints evaluation metrics
+- Optional search (--search grid|random): cross-validated classifier / max_features /
+  ngram_range / regularization candidates in a process pool, each also timed for
+  single-message and batched inference and sized; prints the accuracy / latency /
+  size Pareto table, saves it, then trains and saves the chosen configuration
+
+Usage:
+    python train.py                          # one configuration from config.Settings
+    python train.py --config best.json       # one configuration from a saved search result
+    python train.py --search grid [--jobs 4] [--cv 5]
+    python train.py --search random --n-iter 30
 """
 
+import argparse
+import itertools
 import json
+import os
+import pickle
 import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+
 import numpy as np
 import joblib
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer, TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
 from sklearn.pipeline import Pipeline
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import StratifiedKFold, cross_validate, train_test_split
 from sklearn.metrics import classification_report, confusion_matrix
 
 from config import (
     INTENTS_PATH,
+    INTENTS_INDEX_PATH,
     MODEL_PATH,
     VECTORIZER_PATH,
+    COMPACT_DIR,
+    NEAREST_DIR,
+    MANIFEST_PATH,
+    ensure_dirs,
     settings
 )
+from inference import InferenceBundle, write_manifest
+from normalize import TOKEN_PATTERN
+from intents_index import IntentIndex, load_source, source_version
+from nearest import export_nearest
+from scorer import export_compact
+
+SEARCH_DIR = settings.ARTIFACT_DIR / "search"
+
+# Search space. Regularization is C for logreg / linear_svc; sgd gets the equivalent
+# alpha = 1 / (C * n_samples).
+SEARCH_SPACE = {
+    "classifier": ["logreg", "linear_svc", "sgd"],
+    "max_features": [1000, 5000, 20000],
+    "ngram_range": [(1, 1), (1, 2), (1, 3)],
+    "C": [0.1, 1.0, 10.0],
+}
+
 
 # -------------------------
 # 1. Load Data
 # -------------------------
-with open(INTENTS_PATH, "r", encoding="utf-8") as f:
-    intents = json.load(f)
-
-patterns = []
-tags = []
+def load_dataset(path=INTENTS_PATH) -> Tuple[Dict[str, Any], List[str], List[str]]:
+    intents = load_source(path)  # intents.json or a directory of shards
 
-for intent in intents["intents"]:
-    tag = intent["tag"]
-    for pattern in intent["patterns"]:
-        patterns.append(pattern)
-        tags.append(tag)
+    patterns = []
+    tags = []
+    for intent in intents["intents"]:
+        tag = intent["tag"]
+        for pattern in intent["patterns"]:
+            patterns.append(pattern)
+            tags.append(tag)
+    return intents, patterns, tags
 
-print(f"[INFO] Loaded {len(patterns)} patterns across {len(set(tags))} intent tags.")
 
 # -------------------------
-# 2. Split Train/Test
+# 2. Build Pipeline
 # -------------------------
-X_train, X_test, y_train, y_test = train_test_split(
-    patterns,
-    tags,
-    test_size=settings.TEST_SIZE,
-    random_state=settings.RANDOM_STATE,
-    stratify=tags
-)
+def default_config() -> Dict[str, Any]:
+    return {
+        "classifier": settings.CLASSIFIER,
+        "vectorizer": settings.VECTORIZER_MODE,
+        "max_features": settings.MAX_FEATURES,
+        "n_features": settings.HASH_N_FEATURES,
+        "ngram_range": tuple(settings.NGRAM_RANGE),
+        "C": settings.REG_C,
+    }
 
-# -------------------------
-# 3. Build Pipeline
-# -------------------------
-if settings.CLASSIFIER == "logreg":
-    classifier = LogisticRegression(max_iter=200, solver="lbfgs", multi_class="auto")
-elif settings.CLASSIFIER == "linear_svc":
-    from sklearn.svm import LinearSVC
-    classifier = LinearSVC()
-elif settings.CLASSIFIER == "sgd":
-    from sklearn.linear_model import SGDClassifier
-    classifier = SGDClassifier(loss="log_loss")
-else:
-    raise ValueError(f"Unsupported classifier: {settings.CLASSIFIER}")
-
-pipeline = Pipeline([
-    ("tfidf", TfidfVectorizer(
-        lowercase=True,
-        stop_words="english",
-        max_features=settings.MAX_FEATURES,
-        ngram_range=settings.NGRAM_RANGE
-    )),
-    ("clf", classifier)
-])
 
-# -------------------------
-# 4. Train Model
-# -------------------------
-print("[INFO] Training model...")
-pipeline.fit(X_train, y_train)
-print("[INFO] Training complete.")
+def build_pipeline(config: Dict[str, Any], n_samples: int) -> Pipeline:
+    name, C = config["classifier"], float(config["C"])
+    if name == "logreg":
+        classifier = LogisticRegression(C=C, max_iter=200, solver="lbfgs", multi_class="auto")
+    elif name == "linear_svc":
+        from sklearn.svm import LinearSVC
+        classifier = LinearSVC(C=C)
+    elif name == "sgd":
+        from sklearn.linear_model import SGDClassifier
+        classifier = SGDClassifier(loss="log_loss", alpha=1.0 / (C * max(n_samples, 1)),
+                                   random_state=settings.RANDOM_STATE)
+    else:
+        raise ValueError(f"Unsupported classifier: {name}")
+
+    mode = config.get("vectorizer", settings.VECTORIZER_MODE)
+    if mode == "hashing":
+        # Stateless: n-grams hash straight to columns, so there is no vocabulary to fit,
+        # pickle or hold per worker; TfidfTransformer adds the idf weights (one float per column).
+        return Pipeline([
+            ("hash", HashingVectorizer(
+                lowercase=True,
+                token_pattern=TOKEN_PATTERN,
+                stop_words="english",
+                n_features=int(config.get("n_features", settings.HASH_N_FEATURES)),
+                ngram_range=tuple(config["ngram_range"]),
+                alternate_sign=False,
+                norm=None
+            )),
+            ("idf", TfidfTransformer()),
+            ("clf", classifier)
+        ])
+    if mode != "tfidf":
+        raise ValueError(f"Unsupported vectorizer mode: {mode}")
+
+    return Pipeline([
+        ("tfidf", TfidfVectorizer(
+            lowercase=True,
+            token_pattern=TOKEN_PATTERN,
+            stop_words="english",
+            max_features=int(config["max_features"]),
+            ngram_range=tuple(config["ngram_range"])
+        )),
+        ("clf", classifier)
+    ])
+
+
+def n_features(pipeline: Pipeline) -> int:
+    vectorizer = pipeline.steps[0][1]
+    vocab = getattr(vectorizer, "vocabulary_", None)
+    return len(vocab) if vocab is not None else vectorizer.n_features
+
 
 # -------------------------
-# 5. Evaluate
+# 3. Train / Evaluate / Save
 # -------------------------
-y_pred = pipeline.predict(X_test)
-print("\n[REPORT] Classification Report")
-print(classification_report(y_test, y_pred))
+def train_and_save(config: Dict[str, Any], intents, patterns: List[str], tags: List[str]) -> Pipeline:
+    print(f"[INFO] Configuration: {config}")
+    X_train, X_test, y_train, y_test = train_test_split(
+        patterns,
+        tags,
+        test_size=settings.TEST_SIZE,
+        random_state=settings.RANDOM_STATE,
+        stratify=tags
+    )
+    pipeline = build_pipeline(config, len(X_train))
+
+    print("[INFO] Training model...")
+    pipeline.fit(X_train, y_train)
+    print("[INFO] Training complete.")
+    # Responses aligned with the classes; fails before anything is saved if a class has none.
+    index = IntentIndex.compile(intents, [str(c) for c in pipeline.classes_], source=source_version(INTENTS_PATH))
+    if "hash" in pipeline.named_steps:
+        # Only columns some training n-gram hashed to have weights; store coef_ sparse
+        # so model.pkl doesn't carry a dense (n_classes x HASH_N_FEATURES) array.
+        pipeline.steps[-1][1].sparsify()
+
+    y_pred = pipeline.predict(X_test)
+    print("\n[REPORT] Classification Report")
+    print(classification_report(y_test, y_pred, zero_division=0))
+
+    print("\n[REPORT] Confusion Matrix")
+    print(confusion_matrix(y_test, y_pred))
+
+    # Save whole pipeline (vectorizer + classifier)
+    joblib.dump(pipeline, MODEL_PATH)
+    print(f"[INFO] Model saved → {MODEL_PATH}")
+
+    # If you want separate vectorizer and classifier (hashing: HashingVectorizer + idf steps):
+    joblib.dump(pipeline[:-1] if "hash" in pipeline.named_steps else pipeline.named_steps["tfidf"], VECTORIZER_PATH)
+    print(f"[INFO] Vectorizer saved → {VECTORIZER_PATH}")
+
+    # Compact NumPy export for sklearn-free, mmap-shared serving (SERVING_BACKEND=numpy).
+    # Parity with the pipeline is checked on every training pattern.
+    export_compact(pipeline, COMPACT_DIR, sample=patterns)
+    print(f"[INFO] Compact NumPy artifact saved → {COMPACT_DIR}")
+
+    # Every pattern (not only the training split) in the model's feature space, for the
+    # low-confidence nearest-pattern fallback.
+    export_nearest(pipeline, patterns, tags, NEAREST_DIR)
+    print(f"[INFO] Nearest-pattern index saved → {NEAREST_DIR} ({len(patterns)} patterns)")
+
+    index.save(INTENTS_INDEX_PATH)
+    print(f"[INFO] Intents index saved → {INTENTS_INDEX_PATH}")
+
+    # online_train.py will not publish over this model with state bootstrapped before it.
+    write_manifest(MANIFEST_PATH, "train")
+    return pipeline
 
-print("\n[REPORT] Confusion Matrix")
-print(confusion_matrix(y_test, y_pred))
 
 # -------------------------
-# 6. Save Artifacts
+# 4. Search
 # -------------------------
-# Save whole pipeline (vectorizer + classifier)
-joblib.dump(pipeline, MODEL_PATH)
-print(f"[INFO] Model saved → {MODEL_PATH}")
+def candidates(mode: str, n_iter: int, seed: int) -> List[Dict[str, Any]]:
+    keys = list(SEARCH_SPACE)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*(SEARCH_SPACE[k] for k in keys))]
+    if mode == "grid":
+        return grid
+    rng = random.Random(seed)
+    sample = []
+    for _ in range(n_iter):
+        config = {k: rng.choice(SEARCH_SPACE[k]) for k in keys if k != "C"}
+        config["C"] = round(10 ** rng.uniform(-2, 2), 4)  # log-uniform 0.01 .. 100
+        sample.append(config)
+    return sample
+
+
+def evaluate_candidate(config: Dict[str, Any], patterns: List[str], tags: List[str], folds: int) -> Dict[str, Any]:
+    """Process-pool worker: cross-validated scores, then a fit on all data (returned pickled)."""
+    import warnings
+    warnings.filterwarnings("ignore")  # tiny folds: ill-defined F1, convergence, few members per class
+
+    cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=settings.RANDOM_STATE)
+    n_train = int(len(patterns) * (folds - 1) / folds)
+    start = time.perf_counter()
+    scores = cross_validate(build_pipeline(config, n_train), patterns, tags, cv=cv,
+                            scoring=("accuracy", "f1_macro"), error_score=np.nan)
+    pipeline = build_pipeline(config, len(patterns)).fit(patterns, tags)
+    return {
+        "config": config,
+        "accuracy": float(np.nanmean(scores["test_accuracy"])),
+        "f1_macro": float(np.nanmean(scores["test_f1_macro"])),
+        "fit_s": time.perf_counter() - start,
+        "model": pickle.dumps(pipeline, protocol=pickle.HIGHEST_PROTOCOL),
+    }
+
+
+def measure_serving(model_bytes: bytes, intents, patterns: List[str], batch: int = 256, rounds: int = 3) -> Dict[str, float]:
+    """Latency through the serving path (InferenceBundle.score) and model size."""
+    pipeline = pickle.loads(model_bytes)
+    bundle = InferenceBundle(pipeline, None, intents)
+    messages = [patterns[k % len(patterns)] for k in range(batch)]
+    bundle.score(messages[:16])  # warm-up
+
+    single = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for m in messages:
+            bundle.score([m])
+        single.append((time.perf_counter() - start) / len(messages))
+    batched = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        bundle.score(messages)
+        batched.append((time.perf_counter() - start) / len(messages))
+
+    clf = pipeline.steps[-1][1]
+    return {
+        "single_us": min(single) * 1e6,
+        "batched_us": min(batched) * 1e6,
+        "size_kb": len(model_bytes) / 1024,
+        "n_features": n_features(pipeline),
+        "coef_kb": np.asarray(clf.coef_).nbytes / 1024,
+    }
+
+
+def pareto_front(rows: List[Dict[str, Any]]) -> None:
+    """Mark rows not dominated on (higher f1_macro, lower single_us, lower size_kb)."""
+    for r in rows:
+        r["pareto"] = not any(
+            o["f1_macro"] >= r["f1_macro"] and o["single_us"] <= r["single_us"] and o["size_kb"] <= r["size_kb"]
+            and (o["f1_macro"] > r["f1_macro"] or o["single_us"] < r["single_us"] or o["size_kb"] < r["size_kb"])
+            for o in rows
+        )
+
+
+def choose(rows: List[Dict[str, Any]], tolerance: float) -> Dict[str, Any]:
+    """Cheapest Pareto configuration whose F1 is within `tolerance` of the best."""
+    best_f1 = max(r["f1_macro"] for r in rows)
+    eligible = [r for r in rows if r["pareto"] and r["f1_macro"] >= best_f1 - tolerance]
+    return min(eligible, key=lambda r: (r["single_us"], r["size_kb"], -r["f1_macro"]))
+
+
+def print_table(rows: List[Dict[str, Any]], chosen: Dict[str, Any]):
+    print(f"\n[REPORT] Search results ({len(rows)} candidates, * = Pareto front, > = chosen)")
+    print(f"   {'classifier':10} {'max_feat':>8} {'ngram':>6} {'C':>8} {'acc':>6} {'f1':>6} "
+          f"{'single_us':>9} {'batch_us':>8} {'size_kb':>8} {'feats':>6}")
+    for r in sorted(rows, key=lambda r: (-r["f1_macro"], r["single_us"])):
+        c = r["config"]
+        mark = (">" if r is chosen else " ") + ("*" if r["pareto"] else " ")
+        print(f"{mark} {c['classifier']:10} {c['max_features']:8d} {str(tuple(c['ngram_range'])):>6} {c['C']:8.3g} "
+              f"{r['accuracy']:6.3f} {r['f1_macro']:6.3f} {r['single_us']:9.1f} {r['batched_us']:8.2f} "
+              f"{r['size_kb']:8.1f} {r['n_features']:6d}")
+
+
+def run_search(args, intents, patterns: List[str], tags: List[str]) -> Dict[str, Any]:
+    configs = candidates(args.search, args.n_iter, settings.RANDOM_STATE)
+    jobs = args.jobs or os.cpu_count() or 1
+    print(f"[INFO] Searching {len(configs)} candidates ({args.search}), {args.cv}-fold CV on {jobs} processes...")
+
+    # CV + fit in parallel; latency is measured afterwards, one candidate at a time,
+    # so timings aren't skewed by the other workers competing for cores.
+    rows = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(evaluate_candidate, c, patterns, tags, args.cv) for c in configs]
+        for fut in futures:
+            rows.append(fut.result())
+    for r in rows:
+        r.update(measure_serving(r.pop("model"), intents, patterns))
+
+    pareto_front(rows)
+    chosen = choose(rows, args.f1_tolerance)
+    print_table(rows, chosen)
+
+    SEARCH_DIR.mkdir(parents=True, exist_ok=True)
+    with open(SEARCH_DIR / "results.json", "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2)
+    with open(SEARCH_DIR / "best_config.json", "w", encoding="utf-8") as f:
+        json.dump(chosen["config"], f, indent=2)
+    print(f"\n[INFO] Chosen (F1 within {args.f1_tolerance} of best, lowest latency): {chosen['config']}")
+    print(f"[INFO] Results saved → {SEARCH_DIR / 'results.json'}, {SEARCH_DIR / 'best_config.json'}")
+    return chosen["config"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the intent classifier (optionally search configurations first).")
+    parser.add_argument("--search", choices=("grid", "random"), help="search configurations, then train the chosen one")
+    parser.add_argument("--n-iter", type=int, default=settings.SEARCH_N_ITER, help="candidates for --search random")
+    parser.add_argument("--cv", type=int, default=settings.SEARCH_CV_FOLDS, help="cross-validation folds")
+    parser.add_argument("--jobs", type=int, default=settings.SEARCH_JOBS, help="worker processes (0 = CPU count)")
+    parser.add_argument("--f1-tolerance", type=float, default=settings.SEARCH_F1_TOLERANCE,
+                        help="accept this much lower macro F1 for a cheaper model")
+    parser.add_argument("--config", help="train the configuration in this JSON file (e.g. a saved best_config.json)")
+    args = parser.parse_args()
+    ensure_dirs()
+
+    intents, patterns, tags = load_dataset()
+    print(f"[INFO] Loaded {len(patterns)} patterns across {len(set(tags))} intent tags.")
+
+    if args.search:
+        config = run_search(args, intents, patterns, tags)
+    elif args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = {**default_config(), **json.load(f)}
+    else:
+        config = default_config()
+
+    train_and_save(config, intents, patterns, tags)
+    print("\n✅ Training finished successfully.")
 
-# If you want separate vectorizer and classifier:
-joblib.dump(pipeline.named_steps["tfidf"], VECTORIZER_PATH)
-print(f"[INFO] Vectorizer saved → {VECTORIZER_PATH}")
 
-print("\n✅ Training finished successfully.")
+if __name__ == "__main__":
+    main()
@@ -10,9 +10,17 @@ import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
 
-# Download NLTK resources (only first time)
-nltk.download("punkt")
-nltk.download("wordnet")
+# NLTK data is not downloaded here; install it once with:
+#   python -m nltk.downloader punkt punkt_tab
+# (nltk >= 3.8.2 loads punkt_tab; older releases load punkt)
+def word_tokenize(text):
+    try:
+        return nltk.word_tokenize(text)
+    except LookupError as e:
+        raise RuntimeError(
+            "NLTK 'punkt' / 'punkt_tab' tokenizer data is not installed; "
+            "run: python -m nltk.downloader punkt punkt_tab"
+        ) from e
 
 # -----------------------------
 # 1. Define Intents Dataset
@@ -75,7 +83,7 @@ for intent in intents["intents"]:
         tags.append(intent["tag"])
 
 # TF-IDF Vectorizer
-vectorizer = TfidfVectorizer(tokenizer=nltk.word_tokenize, stop_words="english")
+vectorizer = TfidfVectorizer(tokenizer=word_tokenize, stop_words="english")
 
 X = vectorizer.fit_transform(patterns)
 y = np.array(tags)
@@ -115,15 +123,16 @@ while True:
     print("Bot:", response)
 
 
-🤖 Candy AI Clone (Service Chatbot) is ready! Type 'quit' to exit.
-You: Hi
-Bot: Hi there! What service are you looking for?
-
-You: What services do you offer?
-Bot: We provide Web Development, Mobile App Development, SEO, and AI Solutions.
-
-You: How much does it cost?
-Bot: Pricing depends on project scope. Small projects start from $500.
-
-You: bye
-Bot: Goodbye!
+# Example session:
+# 🤖 Candy AI Clone (Service Chatbot) is ready! Type 'quit' to exit.
+# You: Hi
+# Bot: Hi there! What service are you looking for?
+#
+# You: What services do you offer?
+# Bot: We provide Web Development, Mobile App Development, SEO, and AI Solutions.
+#
+# You: How much does it cost?
+# Bot: Pricing depends on project scope. Small projects start from $500.
+#
+# You: bye
+# Bot: Goodbye!
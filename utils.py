@@ -1,25 +1,17 @@
 """
 utils.py
 Helper functions for Candy AI Clone chatbot (Triple Minds).
-- Text preprocessing (clean, normalize, tokenize)
+- Text preprocessing (clean, normalize, tokenize; implemented in normalize.py)
 - Confidence checks & fallbacks
 - ID generators for users/sessions
 """
 
-import re
-import string
 import random
 import hashlib
 import uuid
 from typing import List, Optional
 
-import nltk
-
-# Make sure tokenizers are available
-try:
-    nltk.data.find("tokenizers/punkt")
-except LookupError:
-    nltk.download("punkt")
+import normalize
 
 
 # -------------------------
@@ -32,20 +24,14 @@ def clean_text(text: str) -> str:
     - Remove punctuation
     - Collapse extra spaces
     """
-    if not text:
-        return ""
-    text = text.lower()
-    text = re.sub(f"[{re.escape(string.punctuation)}]", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
+    return normalize.normalize(text)
 
 
 def tokenize(text: str) -> List[str]:
     """
-    Tokenize text into words using nltk.
+    Lowercased word tokens, as the trained vectorizer extracts them.
     """
-    from nltk.tokenize import word_tokenize
-    return word_tokenize(text)
+    return normalize.tokenize(text)
 
 
 # -------------------------